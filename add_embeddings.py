@@ -1,194 +1,259 @@
-from src.backend.database.neo4j_client import Neo4jClient
+from src.backend.database.neo4j_client import Neo4jClient, close_drivers
+from src.backend.database.redis_client import bump_corpus_version
+from src.backend.document_processing.embedding_client import create_token_aware_batches, estimate_tokens
+from src.backend.assistant.local_index import publish_index_changes, LOCAL_VECTOR_INDEX
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from tqdm import tqdm
+import argparse
+import json
 import os
+import re
+import threading
 import time
-from tqdm import tqdm
-import numpy as np
 import requests
-from src.backend.assistant.rag import RAGAssistant
-from src.backend.assistant.graph_rag import GraphRAGAssistant
-import json
-from datetime import datetime
-from typing import Optional
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
-
-rag_assistant_instance: Optional[RAGAssistant] = None
-graph_rag_assistant_instance: Optional[GraphRAGAssistant] = None
-
-def chunks(lst, n):
-    """Split a list into chunks of size n"""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
-
-def estimate_tokens(text):
-    """Estimate token count in a text (rough approximation)"""
-    # Average of ~4 characters per token in English
-    return len(text) // 4 + 1
-
-def create_token_aware_batches(sentences, max_tokens=7500):
-    """Create batches that respect token limits"""
-    batches = []
-    current_batch = []
-    current_token_count = 0
-    
-    for sentence_id, sentence_text in sentences:
-        # Estimate tokens in this sentence
-        tokens = estimate_tokens(sentence_text)
-        
-        # If adding this sentence would exceed the token limit, start a new batch
-        if current_token_count + tokens > max_tokens and current_batch:
-            batches.append(current_batch)
-            current_batch = [(sentence_id, sentence_text)]
-            current_token_count = tokens
-        else:
-            current_batch.append((sentence_id, sentence_text))
-            current_token_count += tokens
-    
-    # Add the last batch if it's not empty
-    if current_batch:
-        batches.append(current_batch)
-    
-    return batches
-
-
-@app.on_event("startup")
-async def startup_event():
-    global rag_assistant_instance, graph_rag_assistant_instance
-    print("Initializing Assistants on startup...")
-    # Initialize with default LLM settings here
-    rag_assistant_instance = RAGAssistant()
-    graph_rag_assistant_instance = GraphRAGAssistant()
-    print("Assistants initialized.")
+# --- Embedding API configuration ---
+EMBEDDING_API_URL = os.getenv('EMBEDDING_API_URL', 'https://models.inference.ai.azure.com/embeddings')
+EMBEDDING_API_KEY = os.getenv('EMBEDDING_API_KEY', os.getenv('GITHUB_TOKEN', ''))
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv('EMBEDDING_REQUESTS_PER_MINUTE', 10))
+EMBEDDING_TOKENS_PER_MINUTE = float(os.getenv('EMBEDDING_TOKENS_PER_MINUTE', 0)) # 0 = no token limit
+# Chunk embeddings must come from the model the chunk_embeddings index (and the local index) was built with
+CHUNK_EMBEDDING_MODEL = os.getenv('CHUNK_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+CHUNK_VECTOR_INDEX = "chunk_embeddings"
+MAX_BATCH_TOKENS = 7500 # Stay under the 8000 token input limit
+MAX_RETRIES = 5
+MAX_RATE_LIMIT_WAIT = 300 # Cap server-requested waits at 5 minutes
+
+LABELS = ('Sentence', 'Chunk') # Node labels with `id`, `content` and `embedding` properties
+
+# Keyset pagination: every page starts after the last id seen, so it stays cheap at any depth
+PAGE_QUERY = """
+MATCH (n:{label})
+WHERE n.embedding IS NULL AND n.id > $after
+RETURN n.id AS id, n.content AS content
+ORDER BY n.id
+LIMIT $limit
+"""
+COUNT_QUERY = "MATCH (n:{label}) WHERE n.embedding IS NULL AND n.id > $after RETURN count(n) AS count"
+WRITE_QUERY = """
+UNWIND $batch AS row
+MATCH (n:{label} {{id: row.id}})
+SET n.embedding = row.embedding
+"""
+ID_INDEX_QUERY = "CREATE INDEX {index_name} IF NOT EXISTS FOR (n:{label}) ON (n.id)"
+INDEX_DIMENSIONS_QUERY = """
+SHOW INDEXES YIELD name, options
+WHERE name = $name
+RETURN options.indexConfig['vector.dimensions'] AS dimensions
+"""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` units per second refill up to `capacity`.
+
+    acquire() blocks only as long as needed for the requested amount to be available,
+    so requests go out as fast as the limit allows instead of after fixed sleeps.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity) # Oversized requests wait for a full bucket
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds: float) -> None:
+        """Pauses all callers for `seconds` (the server asked us to back off)"""
+        with self._lock:
+            self._tokens = -seconds * self.rate
+            self._updated = time.monotonic()
+
+
+class RateLimitedEmbedder:
+    """Calls the embedding API within request/token per-minute limits, retrying rate limits and errors."""
+
+    def __init__(self, requests_per_minute: float = EMBEDDING_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = EMBEDDING_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 6)) # Bursts up to 10s worth
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute > 0 else None
+        self.session = requests.Session() # Reuse the HTTPS connection between batches
+
+    def embed(self, texts):
+        for attempt in range(1, MAX_RETRIES + 1):
+            self.requests.acquire()
+            if self.tokens:
+                self.tokens.acquire(sum(estimate_tokens(text) for text in texts))
+            try:
+                response = self.session.post(
+                    EMBEDDING_API_URL,
+                    headers={
+                        "Authorization": f"Bearer {EMBEDDING_API_KEY}",
+                        "Content-Type": "application/json"
+                    },
+                    json={"model": EMBEDDING_MODEL, "input": texts},
+                    timeout=120
+                )
+            except requests.RequestException as e:
+                print(f"Error calling embedding API (attempt {attempt}/{MAX_RETRIES}): {e}")
+                time.sleep(min(2 ** attempt, 60))
+                continue
+
+            if response.status_code == 200:
+                data = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+                return [item["embedding"] for item in data]
+            if response.status_code == 429:
+                # Rate limit hit - use the server's wait time, capped
+                error_msg = response.json().get('error', {}).get('message', '') if response.content else ''
+                wait_match = re.search(r'Please wait (\d+) seconds', error_msg)
+                wait_time = min(int(wait_match.group(1)), MAX_RATE_LIMIT_WAIT) if wait_match else 60
+                print(f"Rate limit exceeded, pausing requests for {wait_time} seconds...")
+                self.requests.drain(wait_time)
+                continue
+            print(f"Error: {response.status_code} - {response.text[:200]} (attempt {attempt}/{MAX_RETRIES})")
+            time.sleep(min(2 ** attempt, 60))
+        raise RuntimeError(f"Embedding request for {len(texts)} texts failed after {MAX_RETRIES} attempts")
+
+
+def vector_index_dimensions(neo4j_client, index_name):
+    """Dimensions of a vector index, or None if it doesn't exist"""
+    records = neo4j_client.run_query(INDEX_DIMENSIONS_QUERY, {"name": index_name})
+    return int(records[0]["dimensions"]) if records and records[0]["dimensions"] is not None else None
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"after": "", "embedded": 0}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path) # Never leave a half-written checkpoint
 
 
 def main():
-    
-    # Initialize Neo4j client
+    parser = argparse.ArgumentParser(description='Backfill missing embeddings with batched, rate-limited API calls (resumable)')
+    parser.add_argument('--label', choices=LABELS, default='Sentence', help='Node label to backfill (default: Sentence)')
+    parser.add_argument('--page-size', type=int, default=2000, help='Nodes fetched per page (default: 2000)')
+    parser.add_argument('--concurrency', type=int, default=2, help='Embedding requests in flight (default: 2)')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: data/add_embeddings_<label>.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first node')
+    parser.add_argument('--limit', type=int, default=None, help='Stop after embedding this many nodes')
+    args = parser.parse_args()
+    if args.label == 'Chunk' and EMBEDDING_MODEL != CHUNK_EMBEDDING_MODEL:
+        parser.error(f"--label Chunk needs EMBEDDING_MODEL={CHUNK_EMBEDDING_MODEL} (the model of the {CHUNK_VECTOR_INDEX} index), "
+                     f"got {EMBEDDING_MODEL}")
+
+    checkpoint_path = args.checkpoint or os.path.join('data', f"add_embeddings_{args.label.lower()}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+    checkpoint = {"after": "", "embedded": 0} if args.restart else load_checkpoint(checkpoint_path)
+    if checkpoint["after"]:
+        print(f"Resuming after id {checkpoint['after']!r} ({checkpoint['embedded']} embedded so far)")
+
     neo4j_client = Neo4jClient(
         os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
         os.getenv('NEO4J_USERNAME', 'neo4j'),
         os.getenv('NEO4J_PASSWORD', 'vaggpinel')
     )
-    
-    # Get sentences without embeddings
-    print("Fetching sentences without embeddings...")
-    results = neo4j_client.run_query("""
-        MATCH (s:Sentence) 
-        WHERE s.embedding IS NULL
-        RETURN s.id AS id, s.content AS content
-        LIMIT 500
-    """)
-    
-    sentences = [(record["id"], record["content"]) for record in results]
-    total_sentences = len(sentences)
-    print(f"Found {total_sentences} sentences without embeddings")
-    
-    if total_sentences == 0:
-        print("No sentences need embeddings. Exiting.")
-        neo4j_client.close()
+    page_query = PAGE_QUERY.format(label=args.label)
+    write_query = WRITE_QUERY.format(label=args.label)
+    try:
+        # Keyset pages and UNWIND writes look nodes up by id
+        neo4j_client.run_query(ID_INDEX_QUERY.format(index_name=f"{args.label.lower()}_id", label=args.label))
+    except Exception as e:
+        print(f"WARNING: Could not create index on {args.label}.id: {e}")
+
+    chunk_dimensions = None
+    if args.label == 'Chunk':
+        chunk_dimensions = vector_index_dimensions(neo4j_client, CHUNK_VECTOR_INDEX)
+        if chunk_dimensions is None:
+            print(f"ERROR: Vector index {CHUNK_VECTOR_INDEX} not found; run the ingest pipeline first so chunk embeddings can be checked against it.")
+            close_drivers()
+            return
+
+    remaining = neo4j_client.run_query(COUNT_QUERY.format(label=args.label), {"after": checkpoint["after"]})[0]["count"]
+    if args.limit is not None:
+        remaining = min(remaining, args.limit)
+    print(f"Found {remaining} {args.label} nodes without embeddings")
+    if remaining == 0:
+        print("No nodes need embeddings. Exiting.")
+        close_drivers()
         return
-    
-    # Create token-aware batches
-    batches = create_token_aware_batches(sentences, max_tokens=7500)  # Using 7500 as buffer
-    print(f"Created {len(batches)} batches respecting the 8000 token input limit")
-    
-    successful = 0
-    
-    # Keep track of request times to manage rate limits
-    request_times = []
-    
-    # Process token-aware batches
-    for i, batch in enumerate(batches):
-        batch_ids = [s[0] for s in batch]
-        batch_texts = [s[1] for s in batch]
-        
-        # Check rate limits
-        current_time = time.time()
-        request_times = [t for t in request_times if current_time - t < 60]
-        
-        # If we've made 10+ requests in the last minute, wait until we're under the limit
-        while len(request_times) >= 10:
-            sleep_time = max(0, 61 - (current_time - request_times[0]))
-            if sleep_time > 0:
-                print(f"Rate limit approaching, waiting {sleep_time:.1f} seconds...")
-                time.sleep(sleep_time)
-            
-            # Update our tracking after waiting
-            current_time = time.time()
-            request_times = [t for t in request_times if current_time - t < 60]
-        
-        try:
-            # Add a small delay between batches
-            if i > 0:
-                time.sleep(5)
-                
-            # Record this request time
-            request_times.append(time.time())
-            
-            print(f"Processing batch {i+1}/{len(batches)} with {len(batch_texts)} sentences...")
-            
-            # Make the API call with batch input
-            response = requests.post(
-                "https://models.inference.ai.azure.com/embeddings",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "text-embedding-3-small",
-                    "input": batch_texts
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                embeddings = [item["embedding"] for item in result["data"]]
-                
-                # Update Neo4j with these embeddings
-                for j, embedding in enumerate(embeddings):
-                    neo4j_client.run_query(
-                        "MATCH (s:Sentence {id: $id}) SET s.embedding = $embedding",
-                        {"id": batch_ids[j], "embedding": embedding}
-                    )
-                
-                successful += len(embeddings)
-                print(f"Progress: {successful}/{total_sentences} sentences processed")
-                
-            elif response.status_code == 429:
-                # Rate limit hit - parse wait time but cap it
-                error_data = response.json()
-                wait_time = 60  # Default wait time
-                
-                # Try to extract the wait time but cap it at 5 minutes
-                error_msg = error_data.get('error', {}).get('message', '')
-                print(f"Rate limit error: {error_msg}")
-                
-                import re
-                wait_match = re.search(r'Please wait (\d+) seconds', error_msg)
-                if wait_match:
-                    parsed_wait = int(wait_match.group(1))
-                    wait_time = min(parsed_wait, 300)  # Cap at 5 minutes (300 seconds)
-                
-                print(f"Rate limit exceeded, waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-                
-                # Try this batch again
-                i -= 1
-                
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-                time.sleep(30)  # Wait before retrying
-                
-        except Exception as e:
-            print(f"Error processing batch: {e}")
-            time.sleep(30)  # Wait before continuing
-    
-    print(f"Finished adding embeddings to {successful}/{total_sentences} sentences")
-    neo4j_client.close()
+
+    embedder = RateLimitedEmbedder()
+
+    def embed_and_write(batch):
+        embeddings = embedder.embed([content for _, content in batch])
+        if chunk_dimensions is not None and any(len(embedding) != chunk_dimensions for embedding in embeddings):
+            # Never mix vector sizes in the chunk index
+            raise ValueError(f"{EMBEDDING_MODEL} returned {len(embeddings[0])}-dim embeddings, "
+                             f"{CHUNK_VECTOR_INDEX} expects {chunk_dimensions}")
+        rows = [{"id": node_id, "embedding": embedding} for (node_id, _), embedding in zip(batch, embeddings)]
+        # One transaction per batch instead of one query per node
+        neo4j_client.run_query(write_query, {"batch": rows})
+        if args.label == 'Chunk' and LOCAL_VECTOR_INDEX:
+            publish_index_changes([(row["id"], row["embedding"]) for row in rows])
+        return len(rows)
+
+    start_time = time.time()
+    embedded_this_run = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor, \
+                tqdm(total=remaining, desc="Embedding", unit="node") as progress:
+            while embedded_this_run < remaining:
+                limit = min(args.page_size, remaining - embedded_this_run)
+                records = neo4j_client.run_query(page_query, {"after": checkpoint["after"], "limit": limit})
+                if not records:
+                    break
+                nodes = [(record["id"], record["content"] or "") for record in records]
+                batches = [[nodes[i] for i in batch] for batch in create_token_aware_batches([content for _, content in nodes], MAX_BATCH_TOKENS)]
+                # Batches of a page run concurrently; the page is checkpointed once all are written
+                for written in executor.map(embed_and_write, batches):
+                    embedded_this_run += written
+                    progress.update(written)
+                checkpoint["after"] = nodes[-1][0]
+                checkpoint["embedded"] += len(nodes)
+                save_checkpoint(checkpoint_path, checkpoint)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun to resume from the last checkpoint.")
+    except Exception as e:
+        print(f"Error during backfill: {type(e).__name__}: {e}")
+        print("Rerun to resume from the last checkpoint.")
+    finally:
+        if args.label == 'Chunk' and embedded_this_run:
+            try:
+                bump_corpus_version() # Answer caches were built without these chunks
+            except Exception as e:
+                print(f"WARNING: Could not bump corpus version: {type(e).__name__}: {e}")
+        close_drivers()
+
+    elapsed = time.time() - start_time
+    print(f"Finished adding embeddings to {embedded_this_run}/{remaining} nodes in {elapsed:.2f} seconds "
+          f"({embedded_this_run / elapsed if elapsed else 0:.1f} nodes/s)")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,146 @@
+from src.backend.database.neo4j_client import Neo4jClient, close_drivers
+from src.backend.database.redis_client import bump_corpus_version
+from src.backend.assistant.local_index import CHUNK_EMBEDDINGS_PAGE_QUERY, publish_index_changes, LOCAL_VECTOR_INDEX
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from tqdm import tqdm
+import numpy as np
+import argparse
+import os
+import time
+
+# Load environment variables
+load_dotenv()
+
+# Bulk export/import of Chunk embeddings:
+#   python bulk_embeddings.py export data/embeddings/chunks.npy
+#   python bulk_embeddings.py import data/embeddings/chunks.npy
+# The matrix is a plain float32 .npy (np.load(path, mmap_mode='r') opens it without reading it);
+# row i belongs to the chunk id on line i of the <path>.ids.txt sidecar.
+
+COUNT_EMBEDDED_CHUNKS_QUERY = "MATCH (c:Chunk) WHERE c.embedding IS NOT NULL RETURN count(c) AS count"
+
+IMPORT_EMBEDDINGS_QUERY = """
+UNWIND $batch AS row
+MATCH (c:Chunk {id: row.id})
+SET c.embedding = row.embedding
+RETURN collect(c.id) AS updated_ids
+"""
+
+
+def ids_path(npy_path: str) -> str:
+    return f"{npy_path}.ids.txt"
+
+
+def export_embeddings(neo4j_client, npy_path: str, page_size: int) -> int:
+    """Streams every chunk embedding into a float32 .npy matrix plus an id sidecar; returns the rows written"""
+    total = neo4j_client.run_query(COUNT_EMBEDDED_CHUNKS_QUERY)[0]["count"]
+    if total == 0:
+        print("No chunk embeddings to export.")
+        return 0
+    os.makedirs(os.path.dirname(os.path.abspath(npy_path)), exist_ok=True)
+
+    matrix = None
+    written = 0
+    after = ""
+    tmp_path, tmp_ids_path = f"{npy_path}.part", f"{ids_path(npy_path)}.part"
+    with open(tmp_ids_path, 'w', encoding='utf-8') as ids_file, tqdm(total=total, desc="Exporting", unit="chunk") as progress:
+        # Keyset pagination: each page starts after the last id seen, so pages stay cheap at any offset
+        while written < total:
+            records = neo4j_client.run_query(CHUNK_EMBEDDINGS_PAGE_QUERY, {"after": after, "limit": min(page_size, total - written)})
+            if not records:
+                break
+            vectors = np.asarray([record["embedding"] for record in records], dtype=np.float32)
+            if matrix is None:
+                # Allocated once on disk; pages are copied straight into the memory map
+                matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(total, vectors.shape[1]))
+            matrix[written:written + len(records)] = vectors
+            ids_file.writelines(f"{record['id']}\n" for record in records)
+            written += len(records)
+            after = records[-1]["id"]
+            progress.update(len(records))
+
+    if matrix is None:
+        # Every chunk counted above was deleted before its page was read
+        print("No chunk embeddings left to export.")
+        os.remove(tmp_ids_path)
+        return 0
+    matrix.flush()
+    if written < total:
+        # Chunks were deleted during the export: shrink the matrix to the rows actually written
+        print(f"WARNING: {total - written} chunks disappeared during export, trimming the matrix")
+        np.save(npy_path, matrix[:written])
+        del matrix
+        os.remove(tmp_path)
+    else:
+        del matrix
+        os.replace(tmp_path, npy_path)
+    os.replace(tmp_ids_path, ids_path(npy_path))
+    return written
+
+
+def import_embeddings(neo4j_client, npy_path: str, batch_size: int, workers: int) -> int:
+    """Writes the rows of an exported matrix back onto the chunks with the same ids; returns the chunks updated"""
+    matrix = np.load(npy_path, mmap_mode='r')
+    with open(ids_path(npy_path), encoding='utf-8') as f:
+        ids = [line.rstrip('\n') for line in f]
+    if len(ids) != len(matrix):
+        raise ValueError(f"{ids_path(npy_path)} has {len(ids)} ids but {npy_path} has {len(matrix)} rows")
+
+    def write_batch(start):
+        rows = np.asarray(matrix[start:start + batch_size], dtype=np.float32).tolist()
+        batch = [{"id": chunk_id, "embedding": row} for chunk_id, row in zip(ids[start:start + batch_size], rows)]
+        records = neo4j_client.run_query(IMPORT_EMBEDDINGS_QUERY, {"batch": batch})
+        updated_ids = set(records[0]["updated_ids"]) if records else set()
+        if LOCAL_VECTOR_INDEX and updated_ids:
+            # Keep the API processes' local indexes in step with the new vectors
+            publish_index_changes([(row["id"], row["embedding"]) for row in batch if row["id"] in updated_ids])
+        return len(batch), len(updated_ids)
+
+    updated = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, tqdm(total=len(ids), desc="Importing", unit="chunk") as progress:
+        # One UNWIND write per batch; a few batches in flight keep Neo4j busy
+        for sent, batch_updated in executor.map(write_batch, range(0, len(ids), batch_size)):
+            updated += batch_updated
+            progress.update(sent)
+    if updated < len(ids):
+        print(f"WARNING: {len(ids) - updated} ids in the export have no matching Chunk node")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk export/import of Chunk embeddings as a float32 .npy matrix with an id sidecar')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='Write all chunk embeddings to a .npy file')
+    export_parser.add_argument('path', help='Output .npy path (ids go to <path>.ids.txt)')
+    export_parser.add_argument('--page-size', type=int, default=5000, help='Chunks fetched per query (default: 5000)')
+    import_parser = subparsers.add_parser('import', help='Load embeddings from a .npy export back into Neo4j')
+    import_parser.add_argument('path', help='.npy file written by export')
+    import_parser.add_argument('--batch-size', type=int, default=1000, help='Chunks per UNWIND write (default: 1000)')
+    import_parser.add_argument('--workers', type=int, default=2, help='Concurrent write transactions (default: 2)')
+    args = parser.parse_args()
+
+    neo4j_client = Neo4jClient(
+        os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
+        os.getenv('NEO4J_USERNAME', 'neo4j'),
+        os.getenv('NEO4J_PASSWORD', 'vaggpinel')
+    )
+    start_time = time.time()
+    try:
+        if args.command == 'export':
+            written = export_embeddings(neo4j_client, args.path, args.page_size)
+            print(f"Exported {written} embeddings to {args.path} in {time.time() - start_time:.2f} seconds")
+        else:
+            updated = import_embeddings(neo4j_client, args.path, args.batch_size, args.workers)
+            print(f"Imported {updated} embeddings from {args.path} in {time.time() - start_time:.2f} seconds")
+            if updated:
+                try:
+                    bump_corpus_version() # Cached answers were built on the old embeddings
+                except Exception as e:
+                    print(f"WARNING: Could not bump corpus version: {type(e).__name__}: {e}")
+    finally:
+        close_drivers()
+
+
+if __name__ == '__main__':
+    main()
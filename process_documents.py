@@ -1,23 +1,68 @@
 ﻿from src.backend.document_processing.text_processor import TextProcessor
-from src.backend.database.neo4j_client import Neo4jClient
+from src.backend.document_processing.ingest_pipeline import IngestPipeline, iter_document_pages, FULLTEXT_INDEX_QUERY
+from src.backend.document_processing.embedding_cache import CachedEmbeddings
+from src.backend.document_processing.embedding_client import AsyncEmbeddingClient, EMBEDDING_MAX_IN_FLIGHT
+from src.backend.database.neo4j_client import Neo4jClient, close_drivers
 from langchain_openai import OpenAIEmbeddings # Use OpenAIEmbeddings client
 from dotenv import load_dotenv
 import os
 import time
 import argparse
-from tqdm import tqdm
-from PyPDF2 import PdfReader # Import PdfReader here
-import chardet # Import chardet
+import asyncio
 
 # Load environment variables
 load_dotenv()
 
+async def ingest_file(filename, data_dir, neo4j_client, embedder, text_processor, args):
+    """Streams one file's pages -> chunks -> embeddings -> Neo4j and returns the chunks written"""
+    file_path = os.path.join(data_dir, filename)
+    file_start = time.time()
+    print(f'\nProcessing {filename}...')
+
+    # One pipeline per file: its counters are per run
+    pipeline = IngestPipeline(neo4j_client, embedder, text_processor, batch_size=args.batch_size,
+                              incremental=not args.full_reingest, verbose=args.verbose)
+    doc_id = filename.rsplit('.', 1)[0]
+    try:
+        pages = iter_document_pages(file_path, filename, max_pages=args.max_pages)
+        chunks_added_this_file = await pipeline.run(doc_id, filename, pages)
+    except Exception as e:
+        print(f"  Error processing file {filename}: {e}")
+        return 0 # Skip to next file
+
+    if pipeline.chunks_produced == 0:
+        print(f"  {filename}: No text content found. Skipping.")
+        return 0
+
+    print(f'  {filename}: Generated {pipeline.chunks_produced} chunks')
+    print(f'  {filename}: Added/Updated {chunks_added_this_file} chunks to the graph '
+          f'({pipeline.chunks_unchanged} unchanged, {pipeline.chunks_deleted} removed)')
+    print(f'  {filename}: Completed in {time.time() - file_start:.2f} seconds')
+    return chunks_added_this_file
+
+
+async def ingest_files(files_to_process, data_dir, neo4j_client, embedder, text_processor, args):
+    """Ingests up to args.workers files at a time and returns the total chunks written"""
+    semaphore = asyncio.Semaphore(max(1, args.workers))
+
+    async def bounded(filename):
+        async with semaphore:
+            return await ingest_file(filename, data_dir, neo4j_client, embedder, text_processor, args)
+
+    results = await asyncio.gather(*(bounded(filename) for filename in files_to_process))
+    return sum(results)
+
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Process PDF/TXT documents, generate embeddings, and build a knowledge graph')
     parser.add_argument('--max-pages', type=int, default=None, help='Maximum pages to process per PDF (default: all)')
-    parser.add_argument('--batch-size', type=int, default=50, help='Batch size for Neo4j and embedding operations (default: 50)')
+    parser.add_argument('--batch-size', type=int, default=50, help='Chunks per Neo4j write; embedding requests are sized adaptively by token count (default: 50)')
     parser.add_argument('--verbose', action='store_true', help='Enable verbose logging')
+    parser.add_argument('--embed-concurrency', type=int, default=EMBEDDING_MAX_IN_FLIGHT, help=f'Maximum concurrent embedding requests (default: {EMBEDDING_MAX_IN_FLIGHT})')
+    parser.add_argument('--workers', type=int, default=max(2, (os.cpu_count() or 2) // 2), help='Files ingested concurrently (default: half the CPU cores)')
+    parser.add_argument('--full-reingest', action='store_true', help='Re-embed and rewrite every chunk instead of only new/changed ones')
+    parser.add_argument('--no-embedding-cache', action='store_true', help='Always call the embedding server, bypassing the Redis embedding cache')
     args = parser.parse_args()
 
     # --- Configuration ---
@@ -39,6 +84,9 @@ def main():
         openai_api_base=lm_studio_api_base,
         chunk_size=args.batch_size # Langchain handles internal batching for embedding requests if needed
     )
+    if not args.no_embedding_cache:
+        # Serve unchanged chunks from the Redis embedding cache instead of the embedding server
+        embeddings_client = CachedEmbeddings(embeddings_client)
     print("Components initialized.")
 
     # --- Find Files ---
@@ -47,120 +95,15 @@ def main():
 
     if not files_to_process:
         print(f'No PDF or TXT files found in {data_dir}')
-        neo4j_client.close()
+        close_drivers()
         return
 
     print(f'Processing {len(files_to_process)} files from {data_dir}')
     start_time = time.time()
-    total_chunks_added = 0
-
-    for filename in files_to_process:
-        file_path = os.path.join(data_dir, filename)
-        file_start = time.time()
-        print(f'\nProcessing {filename}...')
-
-        # --- Read File Content ---
-        text = ""
-        try:
-            if filename.lower().endswith(".pdf"):
-                with open(file_path, 'rb') as f:
-                    reader = PdfReader(f)
-                    num_pages = len(reader.pages)
-                    pages_to_read = min(num_pages, args.max_pages) if args.max_pages else num_pages
-                    print(f'  Reading {pages_to_read} pages from PDF...')
-                    for i in range(pages_to_read):
-                        page = reader.pages[i]
-                        page_text = page.extract_text()
-                        if page_text: text += page_text + "\n"
-            elif filename.lower().endswith(".txt"):
-                print(f'  Reading TXT file...')
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read()
-                    detected_encoding = chardet.detect(raw_data)['encoding'] or 'utf-8'
-                with open(file_path, 'r', encoding=detected_encoding) as f:
-                    text = f.read()
-            print(f'  Read content (Length: {len(text)} characters)')
-        except Exception as read_e:
-            print(f"  Error reading file {filename}: {read_e}")
-            continue # Skip to next file
-
-        if not text.strip():
-            print("  No text content found. Skipping.")
-            continue
-
-        # --- Create Document Node ---
-        doc_id = filename.rsplit('.', 1)[0]
-        neo4j_client.run_query(
-            "MERGE (d:Document {id: $doc_id}) ON CREATE SET d.title = $title",
-            {'doc_id': doc_id, 'title': filename}
-        )
 
-        # --- Process into Chunks ---
-        print("  Chunking text...")
-        chunks = text_processor.process_text(text, verbose=args.verbose)
-        print(f'  Generated {len(chunks)} chunks')
-
-        if not chunks:
-            print("  No chunks generated. Skipping Neo4j/Embedding steps.")
-            continue
-
-        # --- Embed and Store Chunks ---
-        batch_size = args.batch_size # This is for Neo4j batching, not embedding request batching
-        num_batches = (len(chunks) + batch_size - 1) // batch_size
-        print(f'  Creating graph nodes, relationships, and embeddings in {num_batches} batches...')
-        chunks_added_this_file = 0
-
-        for i in tqdm(range(0, len(chunks), batch_size), desc="  Processing batches"):
-            batch_texts = chunks[i : i + batch_size]
-            if not batch_texts: continue
-
-            # Generate embeddings for the Neo4j batch
-            try:
-                # OpenAIEmbeddings handles batching internally based on its chunk_size
-                batch_embeddings = embeddings_client.embed_documents(batch_texts)
-            except Exception as e:
-                print(f"\nError generating embeddings for batch starting at index {i}: {e}")
-                continue # Skip this Neo4j batch if embedding fails
-
-            if len(batch_embeddings) != len(batch_texts):
-                 print(f"\nWarning: Embedding count mismatch for batch {i}. Expected {len(batch_texts)}, got {len(batch_embeddings)}. Skipping batch.")
-                 continue
-
-            # Prepare data for Neo4j
-            batch_params = []
-            for j, chunk_text in enumerate(batch_texts):
-                chunk_index = i + j
-                chunk_id = f'{doc_id}_c{chunk_index}' # Use 'c' for chunk
-                batch_params.append({
-                    'doc_id': doc_id,
-                    'chunk_id': chunk_id,
-                    'content': chunk_text,
-                    'embedding': batch_embeddings[j]
-                })
-
-            # Add to Neo4j
-            if batch_params:
-                try:
-                    # Use MERGE for idempotency, use Chunk label
-                    neo4j_client.run_query(
-                        """
-                        UNWIND $batch as row
-                        MATCH (d:Document {id: row.doc_id})
-                        MERGE (c:Chunk {id: row.chunk_id})
-                        ON CREATE SET c.content = row.content, c.embedding = row.embedding
-                        ON MATCH SET c.embedding = row.embedding // Update embedding if node exists
-                        MERGE (d)-[:CONTAINS]->(c)
-                        """,
-                        {'batch': batch_params}
-                    )
-                    chunks_added_this_file += len(batch_params)
-                except Exception as e:
-                    print(f"\nError executing Neo4j batch query for batch {i}: {e}")
-                    continue # Skip this Neo4j batch if query fails
-
-        total_chunks_added += chunks_added_this_file
-        print(f'  Added/Updated {chunks_added_this_file} chunks from {filename} to the graph')
-        print(f'  Completed in {time.time() - file_start:.2f} seconds')
+    embedder = AsyncEmbeddingClient(embeddings_client, max_in_flight=args.embed_concurrency)
+    # Files are ingested concurrently; they share the PDF process pool and the embedding request limit
+    total_chunks_added = asyncio.run(ingest_files(files_to_process, data_dir, neo4j_client, embedder, text_processor, args))
 
     # --- Create Vector Index ---
     print("\nCreating Neo4j vector index 'chunk_embeddings' (if it doesn't exist)...")
@@ -181,11 +124,22 @@ def main():
         print(f"Error creating Neo4j vector index: {e}")
         print("Please ensure your Neo4j version supports vector indexes (5.11+ recommended).")
 
+    # --- Create Full-Text Index (hybrid retrieval) ---
+    print("Creating Neo4j full-text index 'chunk_fulltext' (if it doesn't exist)...")
+    try:
+        neo4j_client.run_query(FULLTEXT_INDEX_QUERY)
+        print("Full-text index 'chunk_fulltext' created or already exists.")
+    except Exception as e:
+        print(f"Error creating Neo4j full-text index: {e}")
+
 
-    neo4j_client.close()
+    close_drivers()
     total_time = time.time() - start_time
     print(f'\nProcessing finished in {total_time:.2f} seconds total!')
     print(f'Total chunks added/updated: {total_chunks_added}')
+    if hasattr(embeddings_client, 'stats'):
+        cache_stats = embeddings_client.stats()
+        print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,27 +1,28 @@
-﻿from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks, Request # Added Request
+﻿from fastapi import APIRouter, HTTPException, UploadFile, File, Request # Added Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional # Added Optional
 import os
-import shutil
-import chardet
 import uuid
+import hashlib
 import json
 import redis
-import asyncio
 import traceback
 from dotenv import load_dotenv
 import src.backend.api.models
+from src.backend.api.models import ChatRequest, ChatResponse # Request carries optional temperature/max_tokens
 from src.backend.api.progress import redis_client as shared_redis_client
 from src.backend.api.progress import router as progress_router
-from src.backend.api.progress import create_job, update_job_progress, update_job_status, progress_complete_job, complete_job_sync # Corrected import
+from src.backend.api.progress import create_job, create_batch_job, update_job_status, progress_complete_job
 
-from src.backend.document_processing.pdf_loader import PDFLoader
-from src.backend.document_processing.text_processor import TextProcessor
-from src.backend.database.neo4j_client import Neo4jClient
+from src.backend.document_processing.ingest_job import process_document, get_async_neo4j_client, find_ingested_document
+from src.backend.document_processing.job_queue import IngestQueue
+from src.backend.document_processing.job_scheduler import FairJobScheduler
 from src.backend.assistant.rag import RAGAssistant # Keep for type hinting if needed
 from src.backend.assistant.graph_rag import GraphRAGAssistant # Keep for type hinting if needed
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings # Added OpenAIEmbeddings
+from src.backend.assistant.llm import DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS
 
 
 redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
@@ -57,31 +58,25 @@ print(f"DEBUG: Progress router registered with routes: {[route.path for route in
 rag_assistant = None
 graph_rag_assistant = None
 
-class ChatRequest(BaseModel):
-    question: str
-    use_graph: bool = False
+# With the queue enabled, uploads are processed by src/backend/worker.py instead of in this process
+INGEST_QUEUE_ENABLED = os.getenv('INGEST_QUEUE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+ingest_queue = None
+# Otherwise they run here, a bounded number at a time
+ingest_scheduler = FairJobScheduler(process_document)
 
-class ChatResponse(BaseModel):
-    answer: str
-    sources: List[str] = []
+def get_ingest_queue() -> IngestQueue:
+    global ingest_queue
+    if ingest_queue is None:
+        ingest_queue = IngestQueue()
+    return ingest_queue
 
 @router.get("/health")
 async def health_check():
     """Check if all services are ready"""
     neo4j_status = "down"
     try:
-        # Check Neo4j connection (use correct host 'neo4j' for docker-compose)
-        neo4j_uri_health = os.getenv('NEO4J_URI', 'bolt://neo4j:7687')
-        neo4j_user_health = os.getenv('NEO4J_USERNAME', 'neo4j')
-        neo4j_password_health = os.getenv('NEO4J_PASSWORD', 'vaggpinel')
-
-        neo4j_client_health = Neo4jClient(
-            neo4j_uri_health,
-            neo4j_user_health,
-            neo4j_password_health
-        )
-        neo4j_client_health.run_query("RETURN 1 as test")
-        neo4j_client_health.close()
+        # Reuses the shared driver pool, so polling this endpoint doesn't open new connections
+        await get_async_neo4j_client().run_query("RETURN 1 as test")
         neo4j_status = "up"
     except Exception as neo4j_e:
         print(f"Health check Neo4j error: {neo4j_e}")
@@ -111,40 +106,114 @@ async def health_check():
          raise HTTPException(status_code=503, detail={"status": overall_status, "services": {"neo4j": neo4j_status, "redis": redis_status, "backend": backend_status}})
 
 
-# --- Upload Endpoint ---
-@router.post("/upload", status_code=200)
-async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    """Upload and process a PDF document"""
-    try:
-        upload_dir = "data/pdf_files"
-        os.makedirs(upload_dir, exist_ok=True)
+# --- Upload Endpoints ---
+UPLOAD_DIR = "data/pdf_files"
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # Uploads are streamed to disk 1 MB at a time
+
+
+def _write_chunk(buffer, hasher, chunk: bytes) -> None:
+    buffer.write(chunk)
+    hasher.update(chunk)
 
-        job_id = str(uuid.uuid4())
-        # Sanitize filename to prevent path traversal issues, although saving locally might be okay here
-        safe_filename = os.path.basename(file.filename or f"upload_{job_id}.pdf")
-        file_path = os.path.join(upload_dir, safe_filename)
 
-        # Save uploaded file
+async def save_upload(file: UploadFile, job_id: str):
+    """
+    Streams an upload to the upload directory while hashing it.
+
+    Returns (temp_path, safe_filename, sha256 hex digest). Disk writes and hashing run in the
+    threadpool and only one chunk is held in memory at a time. The file stays under a
+    job-specific temporary name: duplicates are discarded without touching the stored file, and
+    the ingest job moves it to its real name once it has been processed, so neither a duplicate
+    nor a concurrent upload with the same name replaces a file another job is reading.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    # Sanitize filename to prevent path traversal issues, although saving locally might be okay here
+    safe_filename = os.path.basename(file.filename or f"upload_{job_id}.pdf")
+    temp_path = os.path.join(UPLOAD_DIR, f".{job_id}.part")
+    hasher = hashlib.sha256()
+    try:
+        buffer = await run_in_threadpool(open, temp_path, "wb")
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except Exception as save_e:
-             print(f"ERROR saving uploaded file {safe_filename}: {save_e}")
-             raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {save_e}")
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
         finally:
-            # Ensure the file object is closed
-             if hasattr(file, 'close'):
-                await file.close()
+            await run_in_threadpool(buffer.close)
+        return temp_path, safe_filename, hasher.hexdigest()
+    except Exception as save_e:
+         print(f"ERROR saving uploaded file {safe_filename}: {save_e}")
+         if os.path.exists(temp_path):
+             os.remove(temp_path)
+         raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {save_e}")
+    finally:
+        # Ensure the file object is closed
+         if hasattr(file, 'close'):
+            await file.close()
+
+
+async def find_duplicate(content_hash: str) -> Optional[str]:
+    """Id of the document already ingested from the same bytes, or None (dedup is best effort)"""
+    try:
+        return await find_ingested_document(content_hash)
+    except Exception as e:
+        print(f"WARNING: Duplicate upload check failed: {type(e).__name__}: {e}")
+        return None
+
+
+def discard_upload(temp_path: str) -> None:
+    """Removes the temporary file of a duplicate upload"""
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+async def schedule_document(file_path: str, filename: str, job_id: str, group: str, content_hash: Optional[str] = None) -> None:
+    """Hands a saved document to the ingest queue (workers) or to this process's scheduler"""
+    if INGEST_QUEUE_ENABLED:
+        # Durable: survives API restarts; workers take jobs round-robin across groups
+        await get_ingest_queue().enqueue(file_path, filename, job_id, content_hash, group=group)
+    else:
+        # Bounded and shared fairly between uploads/batches
+        ingest_scheduler.submit(group, file_path, filename, job_id, content_hash)
 
 
-        # Add the background task
-        background_tasks.add_task(process_pdf, file_path, safe_filename, job_id)
+@router.post("/upload", status_code=200)
+async def upload_document(file: UploadFile = File(...)):
+    """Upload and process a PDF document"""
+    try:
+        job_id = str(uuid.uuid4())
+        file_path, safe_filename, content_hash = await save_upload(file, job_id)
+
+        # Identical content was already ingested: nothing to do
+        existing_doc_id = await find_duplicate(content_hash)
+        if existing_doc_id is not None:
+            discard_upload(file_path)
+            await create_job(job_id, safe_filename, 0)
+            await progress_complete_job(job_id, f"Already ingested as document '{existing_doc_id}' - ready for querying")
+            print(f"Duplicate upload {safe_filename} (sha256 {content_hash[:12]}), existing document {existing_doc_id}")
+            return {
+                "message": "File already processed",
+                "filename": safe_filename,
+                "job_id": job_id,
+                "document_id": existing_doc_id,
+                "duplicate": True
+            }
+
+        # Visible as 'queued' until a worker or scheduler slot picks it up
+        await create_job(job_id, safe_filename, 0)
+        await update_job_status(job_id, status="queued", message="Waiting to be processed...")
+        await schedule_document(file_path, safe_filename, job_id, group=job_id, content_hash=content_hash)
 
         print(f"Upload successful for {safe_filename}, starting background job {job_id}")
         return {
             "message": "File uploaded and processing started",
             "filename": safe_filename,
-            "job_id": job_id
+            "job_id": job_id,
+            "document_id": safe_filename.rsplit('.', 1)[0],
+            "duplicate": False
         }
     except HTTPException as http_exc:
         # Re-raise HTTP exceptions
@@ -156,185 +225,64 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
         raise HTTPException(status_code=500, detail=f"Internal server error during upload: {type(e).__name__}")
 
 
-# --- Background PDF Processing Task ---
-async def process_document(file_path, filename, job_id): # Rename to process_document
-    """Process PDF or TXT document in the background with progress tracking"""
-    from src.backend.api.progress import create_job, update_job_progress, update_job_status # Import update_job_status
-
-    text = ""
-    total_items = 0 # Pages for PDF, Chunks for TXT
-    is_pdf = filename.lower().endswith(".pdf")
+@router.post("/upload/batch", status_code=200)
+async def upload_documents(files: List[UploadFile] = File(...)):
+    """
+    Upload and process several PDF/TXT documents as one batch job.
 
+    Each file gets a child job; GET /api/progress/{batch_id} reports the aggregate progress and
+    GET /api/progress/{batch_id}/children the progress of each file.
+    """
     try:
-        print(f"Background task started for job {job_id}, file {filename}")
-
-        if is_pdf:
-            # --- PDF Extraction ---
-            pdf_loader = PDFLoader(os.path.dirname(file_path))
-            # Use await since extract_text_from_pdf is now async
-            text = await pdf_loader.extract_text_from_pdf(file_path, job_id) # This already calls create_job
-            if not text:
-                 print(f"Job {job_id}: No text extracted from PDF {filename}.")
-                 await progress_complete_job(job_id, "Failed: No text could be extracted from PDF", final_status="failed")
-                 return # Stop processing
-            print(f"Job {job_id}: PDF extraction complete. Text length: {len(text)}")
-            # total_items is handled by create_job inside extract_text_from_pdf
-
-        else:
-            # --- TXT Reading ---
-            print(f"Job {job_id}: Reading TXT file {filename}")
-            try:
-                # Detect encoding
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read()
-                    detected_encoding = chardet.detect(raw_data)['encoding'] or 'utf-8' # Default to utf-8
-
-                with open(file_path, 'r', encoding=detected_encoding) as f:
-                    text = f.read()
-                # Initialize progress for TXT (total_items will be chunk count later)
-                create_job(job_id, filename, total_pages=1) # Use 1 page initially for TXT
-                await update_job_progress(job_id, 1) # Mark reading as complete (1/1 page)
-                print(f"Job {job_id}: TXT reading complete. Text length: {len(text)}")
-            except Exception as read_e:
-                print(f"Job {job_id}: Error reading TXT file {filename}: {read_e}")
-                await progress_complete_job(job_id, f"Failed: Error reading TXT file: {read_e}", final_status="failed")
-                return # Stop processing
-
-        # --- Phase 2: Text Chunking and Neo4j Ingestion ---
-        await update_job_status(job_id, status="chunking", message="Chunking document text...") # Update status
-
-        text_processor = TextProcessor()
-        # Use chunking instead of sentence splitting
-        chunks = text_processor.process_text(text) # Now returns chunks
-        total_items = len(chunks) # Update total_items to chunk count
-        print(f"Job {job_id}: Processed text into {total_items} chunks.")
-
-        # Update total pages in Redis job info if it was a TXT file
-        if not is_pdf and shared_redis_client:
-             redis_key = f"job:{job_id}"
-             job_data = shared_redis_client.get(redis_key)
-             if job_data:
-                 try:
-                     job = json.loads(job_data)
-                     job["total_pages"] = total_items # Re-purpose total_pages for chunks
-                     job["message"] = f"Processing {total_items} chunks..."
-                     shared_redis_client.setex(redis_key, 86400, json.dumps(job))
-                 except Exception as redis_update_e:
-                     print(f"Job {job_id}: Failed to update total chunk count in Redis: {redis_update_e}")
-
-
-        if not chunks:
-            print(f"Job {job_id}: No chunks generated from the text.")
-            await progress_complete_job(job_id, "Completed: No text chunks generated after processing.", final_status="completed") # Consider completed if no chunks
-            return
-
-        # Connect to Neo4j
-        neo4j_client = Neo4jClient(
-            os.getenv('NEO4J_URI', 'bolt://neo4j:7687'),
-            os.getenv('NEO4J_USERNAME', 'neo4j'),
-            os.getenv('NEO4J_PASSWORD', 'vaggpinel')
-        )
-
-        # Create document node
-        doc_id = filename.rsplit('.', 1)[0] # More robust way to remove extension
-        neo4j_client.run_query(
-             "MERGE (d:Document {id: $doc_id}) ON CREATE SET d.title = $title",
-             {'doc_id': doc_id, 'title': filename}
-        )
-
-        # --- Embeddings and Neo4j Ingestion ---
-        await update_job_status(job_id, status="embedding_neo4j", message="Generating embeddings and storing in Neo4j...")
-
-        # Initialize Embeddings client pointing to LM Studio (same as process_documents.py)
-        lm_studio_api_base = "http://host.docker.internal:1234/v1" # Use host.docker.internal for Docker
-        lm_studio_api_key = "lm-studio"
-        embeddings_client = OpenAIEmbeddings(
-            openai_api_key=lm_studio_api_key,
-            openai_api_base=lm_studio_api_base,
-            chunk_size=50 # Or make configurable
-        )
-
-        chunks_added_count = 0
-        batch_size = 50 # Configurable batch size for Neo4j/Embedding
-
-        for i in range(0, total_items, batch_size):
-            batch_chunks = chunks[i : i + batch_size]
-            if not batch_chunks: continue
-
-            # Generate embeddings
-            try:
-                batch_embeddings = embeddings_client.embed_documents(batch_chunks)
-            except Exception as emb_e:
-                print(f"Job {job_id}: Error generating embeddings for batch starting at index {i}: {emb_e}")
-                # Optionally skip or retry
-                continue
-
-            if len(batch_embeddings) != len(batch_chunks):
-                print(f"Job {job_id}: Warning: Embedding count mismatch for batch {i}.")
-                continue
-
-            # Prepare data for Neo4j
-            batch_params = []
-            for j, chunk_text in enumerate(batch_chunks):
-                chunk_index = i + j # Overall index of the chunk
-                chunk_id = f'{doc_id}_c{chunk_index}' # Use 'c' for chunk
-                batch_params.append({
-                    'doc_id': doc_id,
-                    'chunk_id': chunk_id,
-                    'content': chunk_text,
-                    'embedding': batch_embeddings[j]
-                })
-
-            # Add to Neo4j
-            if batch_params:
-                try:
-                    # Use MERGE for idempotency, rename Sentence to Chunk
-                    neo4j_client.run_query(
-                        """
-                        UNWIND $batch as row
-                        MATCH (d:Document {id: row.doc_id})
-                        MERGE (c:Chunk {id: row.chunk_id})
-                        ON CREATE SET c.content = row.content, c.embedding = row.embedding
-                        ON MATCH SET c.embedding = row.embedding
-                        MERGE (d)-[:CONTAINS]->(c)
-                        """,
-                        {'batch': batch_params}
-                    )
-                    chunks_added_count += len(batch_params)
-
-                    # Update progress based on chunks processed
-                    percent_complete = int((chunks_added_count / total_items) * 100)
-                    await update_job_status(
-                        job_id,
-                        status="embedding_neo4j",
-                        message=f"Storing chunk {chunks_added_count}/{total_items}",
-                        percent_complete=percent_complete,
-                        current_page=chunks_added_count # Re-use current_page for chunks processed
-                    )
-
-                except Exception as neo_e:
-                    print(f"Job {job_id}: Error executing Neo4j batch query for batch starting at index {i}: {neo_e}")
-                    # Optionally skip or retry
-                    continue
-
-            await asyncio.sleep(0) # Yield control
-
-        print(f"Job {job_id}: Finished Neo4j ingestion. Added/Updated {chunks_added_count} chunks.")
-        neo4j_client.close()
-
-        # --- Final Step: Create Vector Index ---
-        # This should ideally be done once after processing, maybe not per-job
-        # Or ensure it's idempotent. Let's keep it in process_documents.py for now.
-
-        await progress_complete_job(job_id, "Processing complete - ready for querying", final_status="completed")
-        print(f"Background task finished successfully for job: {job_id}")
-
+        batch_id = str(uuid.uuid4())
+        saved = []
+        for file in files:
+            job_id = str(uuid.uuid4())
+            file_path, safe_filename, content_hash = await save_upload(file, job_id)
+            saved.append((job_id, safe_filename, file_path, content_hash, await find_duplicate(content_hash)))
+
+        await create_batch_job(batch_id, [(job_id, filename) for job_id, filename, _, _, _ in saved])
+        for job_id, filename, file_path, content_hash, existing_doc_id in saved:
+            if existing_doc_id is not None:
+                discard_upload(file_path)
+                await progress_complete_job(job_id, f"Already ingested as document '{existing_doc_id}'")
+            else:
+                await schedule_document(file_path, filename, job_id, group=batch_id, content_hash=content_hash)
+
+        duplicates = sum(1 for *_, existing_doc_id in saved if existing_doc_id is not None)
+        print(f"Batch upload of {len(saved)} files successful ({duplicates} already ingested), batch job {batch_id}")
+        return {
+            "message": f"{len(saved)} files uploaded and processing started ({duplicates} already ingested)",
+            "batch_id": batch_id,
+            "jobs": [
+                {
+                    "job_id": job_id,
+                    "filename": filename,
+                    "document_id": existing_doc_id or filename.rsplit('.', 1)[0],
+                    "duplicate": existing_doc_id is not None
+                }
+                for job_id, filename, _, _, existing_doc_id in saved
+            ]
+        }
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
-        error_message = f"Error during processing: {type(e).__name__}: {str(e)}"
-        print(f"ERROR in background task for job {job_id}: {error_message}")
-        import traceback
+        print(f"ERROR during batch upload: {type(e).__name__}: {e}")
         traceback.print_exc()
-        await progress_complete_job(job_id, error_message, final_status="failed")
+        raise HTTPException(status_code=500, detail=f"Internal server error during upload: {type(e).__name__}")
+
+
+def get_llm_params(chat_request: ChatRequest) -> dict:
+    """LLM settings for a chat request, falling back to the defaults"""
+    return {
+        "temperature": chat_request.temperature if chat_request.temperature is not None else DEFAULT_TEMPERATURE,
+        "max_tokens": chat_request.max_tokens if chat_request.max_tokens is not None else DEFAULT_MAX_TOKENS,
+    }
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -351,48 +299,119 @@ async def chat_with_assistant(request: Request, chat_request: ChatRequest): # Ad
 
     try:
         # --- LLM Configuration ---
-        lm_studio_api_base = "http://host.docker.internal:1234/v1" # Use host.docker.internal inside docker
-        lm_studio_api_key = "lm-studio"
-
-        # Default LLM parameters
-        llm_params = {
-            "temperature": 0.1, # Default temperature
-            "max_tokens": 512, # Default max tokens
-        }
-        # Override defaults with request parameters if provided
-        if chat_request.temperature is not None:
-            llm_params["temperature"] = chat_request.temperature
-        if chat_request.max_tokens is not None:
-            llm_params["max_tokens"] = chat_request.max_tokens
-
-        # Create a potentially customized LLM instance for this request
-        llm_instance = ChatOpenAI(
-            openai_api_key=lm_studio_api_key,
-            openai_api_base=lm_studio_api_base,
-            temperature=llm_params["temperature"],
-            max_tokens=llm_params["max_tokens"]
-        )
+        # Request overrides are passed per call; the shared assistants and their chains are not modified
+        llm_params = get_llm_params(chat_request)
         print(f"Using LLM for chat with params: {llm_params}")
 
-        # --- Update Assistants with request-specific LLM ---
-        rag_assistant_instance.update_llm(llm_instance)
-        graph_rag_assistant_instance.update_llm(llm_instance)
+        # --- Answer Cache ---
+        answer_cache = getattr(request.app.state, "answer_cache", None)
+        mode = "graph" if chat_request.use_graph else "rag"
+        if answer_cache is not None:
+            try:
+                cached = await run_in_threadpool(answer_cache.get, chat_request.question, mode, llm_params)
+                if cached is not None:
+                    print(f"Answer cache hit for question: {chat_request.question}")
+                    return ChatResponse(answer=cached["answer"], sources=cached.get("sources", []), cached=True)
+            except Exception as cache_e:
+                print(f"WARNING: Answer cache lookup failed: {type(cache_e).__name__}: {cache_e}")
 
         # --- Perform Query ---
+        # The LangChain chains are blocking; run them in the threadpool so other requests keep being served
         if chat_request.use_graph:
             print("Using Graph RAG Assistant")
-            result = graph_rag_assistant_instance.query(chat_request.question)
+            result = await run_in_threadpool(graph_rag_assistant_instance.query, chat_request.question, **llm_params)
             answer = result.get("result", "Could not retrieve answer from graph.")
             sources = [] # GraphQAChain doesn't easily provide sources
         else:
             print("Using Standard RAG Assistant")
-            result = rag_assistant_instance.query(chat_request.question)
+            result = await run_in_threadpool(rag_assistant_instance.query, chat_request.question, **llm_params)
             answer = result.get("result", "Could not retrieve answer.")
             sources = [doc.page_content for doc in result.get("source_documents", [])]
 
+        # Only cache real answers, not assistant errors
+        if answer_cache is not None and "error" not in result:
+            try:
+                await run_in_threadpool(answer_cache.put, chat_request.question, mode, llm_params, answer, sources)
+            except Exception as cache_e:
+                print(f"WARNING: Failed to store answer in cache: {type(cache_e).__name__}: {cache_e}")
+
         return ChatResponse(answer=answer, sources=sources)
 
     except Exception as e:
         print(f"ERROR during chat: {type(e).__name__}: {e}")
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Internal server error during chat: {type(e).__name__}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error during chat: {type(e).__name__}")
+
+
+@router.post("/chat/stream")
+async def chat_with_assistant_stream(request: Request, chat_request: ChatRequest):
+    """
+    Streaming variant of /chat using Server-Sent Events.
+
+    Events: 'sources' (retrieved chunks, sent before generation starts), then one 'token'
+    event per generated piece of text, then 'done' (or 'error').
+    """
+    rag_assistant_instance = request.app.state.rag_assistant_instance
+    graph_rag_assistant_instance = request.app.state.graph_rag_assistant_instance
+
+    if rag_assistant_instance is None or graph_rag_assistant_instance is None:
+         raise HTTPException(status_code=503, detail="Assistants not initialized")
+
+    llm_params = get_llm_params(chat_request)
+    mode = "graph" if chat_request.use_graph else "rag"
+    answer_cache = getattr(request.app.state, "answer_cache", None)
+    print(f"Streaming chat ({mode}) with params: {llm_params}")
+
+    async def event_stream():
+        try:
+            # --- Answer Cache ---
+            if answer_cache is not None:
+                try:
+                    cached = await run_in_threadpool(answer_cache.get, chat_request.question, mode, llm_params)
+                except Exception as cache_e:
+                    print(f"WARNING: Answer cache lookup failed: {type(cache_e).__name__}: {cache_e}")
+                    cached = None
+                if cached is not None:
+                    print(f"Answer cache hit for question: {chat_request.question}")
+                    yield sse_event("sources", {"sources": cached.get("sources", [])})
+                    yield sse_event("token", {"text": cached["answer"]})
+                    yield sse_event("done", {"cached": True})
+                    return
+
+            # --- Retrieval (blocking, in the threadpool) ---
+            if chat_request.use_graph:
+                llm, prompt, _ = await run_in_threadpool(graph_rag_assistant_instance.prepare, chat_request.question, **llm_params)
+                sources = [] # Graph context is query records, not source chunks
+            else:
+                llm, prompt, source_documents = await run_in_threadpool(rag_assistant_instance.prepare, chat_request.question, **llm_params)
+                sources = [doc.page_content for doc in source_documents]
+            yield sse_event("sources", {"sources": sources})
+
+            # --- Generation ---
+            answer_parts = []
+            async for chunk in llm.astream(prompt):
+                if await request.is_disconnected():
+                    print("Chat stream client disconnected, stopping generation")
+                    return
+                if chunk.content:
+                    answer_parts.append(chunk.content)
+                    yield sse_event("token", {"text": chunk.content})
+            answer = "".join(answer_parts)
+
+            if answer_cache is not None and answer:
+                try:
+                    await run_in_threadpool(answer_cache.put, chat_request.question, mode, llm_params, answer, sources)
+                except Exception as cache_e:
+                    print(f"WARNING: Failed to store answer in cache: {type(cache_e).__name__}: {cache_e}")
+            yield sse_event("done", {"cached": False})
+
+        except Exception as e:
+            print(f"ERROR during streaming chat: {type(e).__name__}: {e}")
+            traceback.print_exc()
+            yield sse_event("error", {"detail": f"Internal server error during chat: {type(e).__name__}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -33,4 +33,5 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     answer: str
-    sources: List[str] = []
\ No newline at end of file
+    sources: List[str] = []
+    cached: bool = False # True when served from the answer cache
\ No newline at end of file
@@ -1,15 +1,27 @@
 from fastapi import APIRouter, HTTPException
 import redis
+import redis.asyncio as aioredis
 import json
+import asyncio
 import os
 import datetime
 import traceback
 import time
-# REMOVE: from src.backend.api.websocket import broadcast_progress # Remove WebSocket import
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 # Create router
 router = APIRouter()
 
+# --- Progress push configuration ---
+# Every job write is also published on job_progress:<job_id>; websocket.py relays it to clients
+PROGRESS_CHANNEL_PREFIX = "job_progress:"
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', 0.5)) # Seconds between page progress writes per job
+JOB_TTL = 86400 # Expire job data after 24 hours
+
+# job_id -> (total_pages, last write time) for throttling update_job_progress in this process
+_progress_state: Dict[str, Tuple[int, float]] = {}
+# job_id -> batch job id ('' for standalone jobs), so scripts can be given the parent's keys
+_parent_ids: Dict[str, str] = {}
+
 # Standardize Redis client initialization
 redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 try:
@@ -26,6 +38,188 @@ except Exception as e:
     print(f"FATAL: Failed to connect to Redis at {redis_url}: {e}")
     redis_client = None
 
+# --- Job state scripts ---
+# A job is a hash at job:<job_id>. Each script updates it, refreshes the TTL and publishes the
+# resulting job as JSON in one atomic step, so concurrent writers can't lose each other's fields.
+# KEYS[1] = job key, KEYS[2] = progress channel; the job TTL is always the first argument.
+# A child job of a batch (parent_id field) also updates the batch job's aggregate progress;
+# its callers pass the batch job key and channel as KEYS[3] and KEYS[4], so every key a script
+# touches is declared. percent_sum tracks the sum of the children's percentages and
+# files_done/files_failed count children that reached a final status.
+_LUA_HELPERS = """
+local function publish_job(key, channel)
+    local flat = redis.call('HGETALL', key)
+    local job = {}
+    for i = 1, #flat, 2 do
+        local value = flat[i + 1]
+        if flat[i] == 'percent_complete' or flat[i] == 'current_page' or flat[i] == 'total_pages'
+                or flat[i] == 'total_files' or flat[i] == 'files_done' or flat[i] == 'files_failed' then
+            value = tonumber(value)
+        end
+        job[flat[i]] = value
+    end
+    redis.call('PUBLISH', channel, cjson.encode(job))
+end
+
+local function is_final(status)
+    return status == 'completed' or status == 'failed' or status == 'error'
+end
+
+local function sync_parent(key, old_percent, old_status)
+    local parent_key = KEYS[3]
+    if not parent_key then return end
+    local parent = redis.call('HGET', key, 'parent_id')
+    if not parent or parent_key ~= 'job:' .. parent then return end
+    if redis.call('EXISTS', parent_key) == 0 then return end
+
+    local status = redis.call('HGET', key, 'status')
+    local new_percent = tonumber(redis.call('HGET', key, 'percent_complete') or '0') or 0
+    local percent_sum = redis.call('HINCRBY', parent_key, 'percent_sum', new_percent - old_percent)
+    if is_final(status) ~= is_final(old_status) then
+        local delta = is_final(status) and 1 or -1
+        redis.call('HINCRBY', parent_key, 'files_done', delta)
+        local failed_status = is_final(status) and status or old_status
+        if failed_status ~= 'completed' then redis.call('HINCRBY', parent_key, 'files_failed', delta) end
+    end
+
+    local total = tonumber(redis.call('HGET', parent_key, 'total_files') or '0') or 0
+    local done = tonumber(redis.call('HGET', parent_key, 'files_done') or '0') or 0
+    local failed = tonumber(redis.call('HGET', parent_key, 'files_failed') or '0') or 0
+    if total > 0 and done >= total then
+        local final_status = 'completed'
+        if failed == total then final_status = 'failed' end
+        redis.call('HSET', parent_key, 'status', final_status, 'percent_complete', 100, 'current_page', done,
+                   'message', 'Processed ' .. total .. ' files (' .. failed .. ' failed)')
+    else
+        local percent = 0
+        if total > 0 then percent = math.max(0, math.min(100, math.floor(percent_sum / total))) end
+        redis.call('HSET', parent_key, 'status', 'processing', 'percent_complete', percent, 'current_page', done,
+                   'message', 'Processed ' .. done .. ' of ' .. total .. ' files (' .. failed .. ' failed)')
+    end
+    redis.call('EXPIRE', parent_key, ARGV[1])
+    publish_job(parent_key, KEYS[4])
+end
+
+local old_percent = tonumber(redis.call('HGET', KEYS[1], 'percent_complete') or '0') or 0
+local old_status = redis.call('HGET', KEYS[1], 'status') or ''
+"""
+
+# ARGV: ttl, job_id, filename, total_pages, parent_id ('' to keep the existing one). Replaces any previous state.
+# KEYS[3]/KEYS[4] must belong to the resulting parent.
+CREATE_SCRIPT = _LUA_HELPERS + """
+local parent = ARGV[5]
+if parent == '' then parent = redis.call('HGET', KEYS[1], 'parent_id') or '' end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'job_id', ARGV[2], 'filename', ARGV[3], 'current_page', 0, 'total_pages', ARGV[4],
+           'percent_complete', 0, 'status', 'starting', 'message', 'Initializing...')
+if parent ~= '' then redis.call('HSET', KEYS[1], 'parent_id', parent) end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+sync_parent(KEYS[1], old_percent, old_status)
+publish_job(KEYS[1], KEYS[2])
+return 1
+"""
+
+# ARGV: ttl, current_page. Ignored once the job has reached a final status.
+PROGRESS_SCRIPT = _LUA_HELPERS + """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+local total = tonumber(redis.call('HGET', KEYS[1], 'total_pages') or '0') or 0
+if is_final(old_status) then return total end
+local page = tonumber(ARGV[2])
+local percent = 0
+if total > 0 then percent = math.floor(page * 100 / total) end
+percent = math.max(0, math.min(100, percent))
+redis.call('HSET', KEYS[1], 'current_page', page, 'percent_complete', percent, 'status', 'processing',
+           'message', 'Processing item ' .. page .. ' of ' .. total)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+sync_parent(KEYS[1], old_percent, old_status)
+publish_job(KEYS[1], KEYS[2])
+return total
+"""
+
+# ARGV: ttl, status, message, percent_complete ('' to keep), current_page ('' to keep)
+STATUS_SCRIPT = _LUA_HELPERS + """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[1], 'status', ARGV[2], 'message', ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[1], 'percent_complete', math.max(0, math.min(100, tonumber(ARGV[4]))))
+end
+if ARGV[5] ~= '' then redis.call('HSET', KEYS[1], 'current_page', ARGV[5]) end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+sync_parent(KEYS[1], old_percent, old_status)
+publish_job(KEYS[1], KEYS[2])
+return 1
+"""
+
+# ARGV: ttl, job_id, final status, message. Creates the job if it doesn't exist.
+COMPLETE_SCRIPT = _LUA_HELPERS + """
+redis.call('HSET', KEYS[1], 'job_id', ARGV[2], 'status', ARGV[3], 'message', ARGV[4])
+if ARGV[3] == 'completed' then
+    redis.call('HSET', KEYS[1], 'percent_complete', 100)
+    local total = redis.call('HGET', KEYS[1], 'total_pages')
+    if total then redis.call('HSET', KEYS[1], 'current_page', total) end
+else
+    -- Keep existing percentage on failure, or set to 0 if undefined
+    redis.call('HSETNX', KEYS[1], 'percent_complete', 0)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+sync_parent(KEYS[1], old_percent, old_status)
+publish_job(KEYS[1], KEYS[2])
+return 1
+"""
+
+_sync_scripts = {}
+# Async clients are bound to the event loop that created them: loop id -> (loop, client, scripts)
+_async_clients = {}
+
+
+def _job_keys(job_id: str, parent_id: str = ""):
+    keys = [f"job:{job_id}", f"{PROGRESS_CHANNEL_PREFIX}{job_id}"]
+    if parent_id:
+        keys += [f"job:{parent_id}", f"{PROGRESS_CHANNEL_PREFIX}{parent_id}"]
+    return keys
+
+
+async def _parent_of(client, job_id: str) -> str:
+    """Batch job id of a job ('' if none); looked up once per job and process"""
+    if job_id not in _parent_ids:
+        _parent_ids[job_id] = await client.hget(f"job:{job_id}", "parent_id") or ""
+    return _parent_ids[job_id]
+
+
+def _parent_of_sync(job_id: str) -> str:
+    if job_id not in _parent_ids:
+        _parent_ids[job_id] = redis_client.hget(f"job:{job_id}", "parent_id") or ""
+    return _parent_ids[job_id]
+
+
+def _sync_script(name: str):
+    if name not in _sync_scripts:
+        _sync_scripts[name] = redis_client.register_script(globals()[name])
+    return _sync_scripts[name]
+
+
+def _get_async_redis():
+    """redis.asyncio client and scripts for the running event loop"""
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(id(loop))
+    if entry is None or entry[0] is not loop:
+        # Forget clients of loops that have been closed (e.g. one asyncio.run per file in a script)
+        for key in [key for key, (other, _, _) in _async_clients.items() if other.is_closed()]:
+            del _async_clients[key]
+        client = aioredis.from_url(redis_url, socket_connect_timeout=5, socket_timeout=5, decode_responses=True)
+        scripts = {name: client.register_script(globals()[name]) for name in ("CREATE_SCRIPT", "PROGRESS_SCRIPT", "STATUS_SCRIPT", "COMPLETE_SCRIPT")}
+        entry = (loop, client, scripts)
+        _async_clients[id(loop)] = entry
+    return entry[1], entry[2]
+
+
+def _decode_job(job: dict) -> dict:
+    """Converts the numeric hash fields back to ints"""
+    for field in ("percent_complete", "current_page", "total_pages", "total_files", "files_done", "files_failed", "percent_sum"):
+        if job.get(field) not in (None, ""):
+            job[field] = int(job[field])
+    return job
+
 # Define JobStatus model here if not imported from models.py
 from pydantic import BaseModel
 class JobStatus(BaseModel):
@@ -36,6 +230,11 @@ class JobStatus(BaseModel):
     filename: Optional[str] = None
     current_page: Optional[int] = 0
     total_pages: Optional[int] = 0
+    # Batch jobs: children report to their parent, which aggregates their progress
+    parent_id: Optional[str] = None
+    total_files: Optional[int] = None
+    files_done: Optional[int] = None
+    files_failed: Optional[int] = None
 
 
 @router.get("/{job_id}", response_model=JobStatus)
@@ -52,23 +251,18 @@ async def get_progress(job_id: str):
 
     try:
         # Check if job exists
-        job_data = redis_client.get(redis_key)
+        client, _ = _get_async_redis()
+        job = await client.hgetall(redis_key)
 
-        if not job_data:
+        if not job:
             print(f"[{current_dt}] Progress request: Key '{redis_key}' not found in Redis.")
             raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
 
-        # Parse the JSON data from Redis
         try:
-            job = json.loads(job_data)
-            # print(f"[{current_dt}] Progress request successful: {job_id} - Status: {job.get('status', 'N/A')}, Page: {job.get('current_page', 0)}/{job.get('total_pages', 0)}") # Reduce logging noise
             # Ensure the returned data matches the JobStatus model
-            return JobStatus(**job)
-        except json.JSONDecodeError as json_err:
-            print(f"[{current_dt}] ERROR decoding job data for {job_id}. Data: '{job_data}'. Error: {json_err}")
-            raise HTTPException(status_code=500, detail="Invalid job data in Redis")
+            return JobStatus(**_decode_job(job))
         except Exception as pydantic_err: # Catch potential Pydantic validation errors
-             print(f"[{current_dt}] ERROR validating job data for {job_id}. Data: '{job_data}'. Error: {pydantic_err}")
+             print(f"[{current_dt}] ERROR validating job data for {job_id}. Data: '{job}'. Error: {pydantic_err}")
              raise HTTPException(status_code=500, detail="Job data validation error")
 
 
@@ -82,28 +276,111 @@ async def get_progress(job_id: str):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {type(e).__name__}")
 
+@router.get("/{job_id}/children", response_model=List[JobStatus])
+async def get_batch_progress(job_id: str):
+    """Progress of each file in a batch upload (the batch itself is returned by GET /{job_id})"""
+    if not redis_client:
+        raise HTTPException(status_code=503, detail="Backend Redis connection failed")
+    try:
+        client, _ = _get_async_redis()
+        child_ids = await client.lrange(f"job:{job_id}:children", 0, -1)
+        if not child_ids:
+            raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+        pipe = client.pipeline(transaction=False)
+        for child_id in child_ids:
+            pipe.hgetall(f"job:{child_id}")
+        return [JobStatus(**_decode_job(job)) for job in await pipe.execute() if job]
+    except HTTPException:
+         raise
+    except Exception as e:
+        print(f"ERROR: Unexpected error in get_batch_progress for {job_id}: {type(e).__name__}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {type(e).__name__}")
+
 # --- Functions called by background task ---
 
-def create_job(job_id: str, filename: str, total_pages: int) -> None:
-    """Initialize a job in Redis"""
+def get_job(job_id: str) -> Optional[dict]:
+    """Current job data from Redis, or None if the job doesn't exist"""
+    if not redis_client:
+        return None
+    job = redis_client.hgetall(f"job:{job_id}")
+    return _decode_job(job) if job else None
+
+
+def _progress_write_due(job_id: str, current_page: int) -> bool:
+    """
+    Coalesces page updates: at most one write per PROGRESS_MIN_INTERVAL per job,
+    but the last page is always written.
+    """
+    state = _progress_state.get(job_id)
+    if state is None:
+        return True
+    total_pages, last_write = state
+    if total_pages and current_page >= total_pages:
+        return True
+    return time.monotonic() - last_write >= PROGRESS_MIN_INTERVAL
+
+
+async def create_job(job_id: str, filename: str, total_pages: int, parent_id: Optional[str] = None) -> None:
+    """Initialize a job in Redis (a child of a batch keeps its parent_id)"""
     if not redis_client:
         print(f"ERROR: create_job called but Redis client is not initialized.")
         return
     try:
-        job = {
-            "job_id": job_id,
-            "filename": filename,
+        client, scripts = _get_async_redis()
+        parent_id = parent_id or await _parent_of(client, job_id)
+        _parent_ids[job_id] = parent_id
+        # Replace any previous state, store, expire after 24 hours and notify subscribers atomically
+        await scripts["CREATE_SCRIPT"](keys=_job_keys(job_id, parent_id), args=[JOB_TTL, job_id, filename, total_pages, parent_id])
+        _progress_state[job_id] = (total_pages, 0.0)
+        print(f"Created job: {job_id} for file {filename} with {total_pages} pages")
+    except Exception as e:
+        print(f"ERROR in create_job: {type(e).__name__}: {e}")
+
+
+async def create_batch_job(batch_id: str, children: List[Tuple[str, str]]) -> None:
+    """Initialize a batch job and its queued child jobs, given (job_id, filename) pairs"""
+    if not redis_client:
+        print(f"ERROR: create_batch_job called but Redis client is not initialized.")
+        return
+    try:
+        batch_key, channel = _job_keys(batch_id)
+        batch = {
+            "job_id": batch_id,
+            "filename": f"{len(children)} files",
+            "kind": "batch",
             "current_page": 0,
-            "total_pages": total_pages,
+            "total_pages": len(children),
+            "total_files": len(children),
+            "files_done": 0,
+            "files_failed": 0,
+            "percent_sum": 0,
             "percent_complete": 0,
-            "status": "starting", # Change initial status
-            "message": "Initializing..."
+            "status": "queued",
+            "message": f"Queued {len(children)} files"
         }
-        # Store in Redis (expire after 24 hours for active jobs)
-        redis_client.setex(f"job:{job_id}", 86400, json.dumps(job))
-        print(f"Created job: {job_id} for file {filename} with {total_pages} pages")
+        client, _ = _get_async_redis()
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(batch_key, f"{batch_key}:children")
+        pipe.hset(batch_key, mapping=batch)
+        pipe.expire(batch_key, JOB_TTL)
+        for job_id, filename in children:
+            child_key = f"job:{job_id}"
+            pipe.delete(child_key)
+            pipe.hset(child_key, mapping={
+                "job_id": job_id, "filename": filename, "parent_id": batch_id, "current_page": 0, "total_pages": 0,
+                "percent_complete": 0, "status": "queued", "message": "Waiting to be processed..."
+            })
+            pipe.expire(child_key, JOB_TTL)
+        if children:
+            pipe.rpush(f"{batch_key}:children", *[job_id for job_id, _ in children])
+            pipe.expire(f"{batch_key}:children", JOB_TTL)
+        pipe.publish(channel, json.dumps(batch))
+        await pipe.execute()
+        _parent_ids.update((job_id, batch_id) for job_id, _ in children)
+        print(f"Created batch job: {batch_id} with {len(children)} files")
     except Exception as e:
-        print(f"ERROR in create_job: {type(e).__name__}: {e}")
+        print(f"ERROR in create_batch_job: {type(e).__name__}: {e}")
+
 
 async def update_job_status(job_id: str, status: str, message: str, percent_complete: Optional[int] = None, current_page: Optional[int] = None) -> None:
     """Update the status, message, and optionally percentage/page of a job."""
@@ -111,25 +388,15 @@ async def update_job_status(job_id: str, status: str, message: str, percent_comp
         print(f"ERROR: update_job_status called but Redis client is not initialized.")
         return
     try:
-        redis_key = f"job:{job_id}"
-        job_data = redis_client.get(redis_key)
-        if job_data:
-            try:
-                job = json.loads(job_data)
-                job["status"] = status
-                job["message"] = message
-                if percent_complete is not None:
-                    job["percent_complete"] = max(0, min(100, percent_complete))
-                if current_page is not None:
-                     job["current_page"] = current_page
-
-                # Update in Redis
-                redis_client.setex(redis_key, 86400, json.dumps(job))
-                # REMOVE: await broadcast_progress(job_id, job) # No longer broadcast
-            except Exception as e:
-                print(f"ERROR updating job status fields for {job_id}: {e}")
+        client, scripts = _get_async_redis()
+        await scripts["STATUS_SCRIPT"](
+            keys=_job_keys(job_id, await _parent_of(client, job_id)),
+            args=[JOB_TTL, status, message,
+                  "" if percent_complete is None else int(percent_complete),
+                  "" if current_page is None else int(current_page)]
+        )
     except Exception as e:
-        print(f"ERROR retrieving job for status update {job_id}: {e}")
+        print(f"ERROR updating job status for {job_id}: {type(e).__name__}: {e}")
 
 
 async def update_job_progress(job_id: str, current_page: int) -> None:
@@ -137,30 +404,16 @@ async def update_job_progress(job_id: str, current_page: int) -> None:
     if not redis_client:
         print(f"ERROR: update_job_progress called but Redis client is not initialized.")
         return
+    if not _progress_write_due(job_id, current_page):
+        return # Coalesced into the next write
     try:
-        redis_key = f"job:{job_id}"
-        job_data = redis_client.get(redis_key)
-
-        if job_data:
-            try:
-                job = json.loads(job_data)
-                # Update progress only if still in a processing phase
-                if job.get("status") not in ["completed", "failed", "error"]:
-                    job["current_page"] = current_page
-                    percent = 0
-                    if job.get("total_pages", 0) > 0:
-                         percent = int((current_page / job["total_pages"]) * 100)
-                    job["percent_complete"] = max(0, min(100, percent)) # Ensure bounds
-                    job["message"] = f"Processing item {current_page} of {job.get('total_pages', '?')}"
-                    job["status"] = "processing" # Ensure status reflects activity
-
-                    # Update in Redis
-                    redis_client.setex(redis_key, 86400, json.dumps(job))
-                    # REMOVE: await broadcast_progress(job_id, job) # No longer broadcast
-            except Exception as e:
-                print(f"ERROR in update_job_progress logic for {job_id}: {type(e).__name__}: {e}")
+        client, scripts = _get_async_redis()
+        # Update progress only if still in a processing phase (checked inside the script)
+        total_pages = await scripts["PROGRESS_SCRIPT"](keys=_job_keys(job_id, await _parent_of(client, job_id)), args=[JOB_TTL, int(current_page)])
+        if total_pages is not None and int(total_pages) >= 0:
+            _progress_state[job_id] = (int(total_pages), time.monotonic())
     except Exception as e:
-        print(f"ERROR in update_job_progress connection/retrieval for {job_id}: {type(e).__name__}: {e}")
+        print(f"ERROR in update_job_progress for {job_id}: {type(e).__name__}: {e}")
 
 
 async def progress_complete_job(job_id: str, message: str = "Processing complete", final_status: str = "completed") -> None:
@@ -169,33 +422,11 @@ async def progress_complete_job(job_id: str, message: str = "Processing complete
         print(f"ERROR: complete_job called but Redis client is not initialized.")
         return
     try:
-        redis_key = f"job:{job_id}"
-        job_data = redis_client.get(redis_key)
-        job = {}
-
-        if job_data:
-            try:
-                job = json.loads(job_data)
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Could not parse existing job data in complete_job: {e}. Data: {job_data}")
-
-        # Update job fields for final status
-        job["job_id"] = job_id # Ensure job_id is present
-        job["status"] = final_status
-        job["message"] = message
-        if final_status == "completed":
-            job["percent_complete"] = 100
-            # Optionally set current_page to total_pages if meaningful
-            if "total_pages" in job:
-                 job["current_page"] = job.get("total_pages")
-        else:
-            # Keep existing percentage on failure, or set to 0 if undefined
-            job["percent_complete"] = job.get("percent_complete", 0)
-
-        # Store in Redis - use set instead of setex for final states? Or keep expiry? Keep expiry for now.
-        redis_client.setex(redis_key, 86400, json.dumps(job))
-
-        # REMOVE: await broadcast_progress(job_id, job) # No longer broadcast
+        client, scripts = _get_async_redis()
+        # Keep expiry for final states too
+        await scripts["COMPLETE_SCRIPT"](keys=_job_keys(job_id, await _parent_of(client, job_id)), args=[JOB_TTL, job_id, final_status, message])
+        _progress_state.pop(job_id, None)
+        _parent_ids.pop(job_id, None)
 
         completion_dt = datetime.datetime.now().isoformat()
         print(f"[{completion_dt}] Finalized job: {job_id} with status '{final_status}' - {message}")
@@ -212,29 +443,9 @@ def complete_job_sync(job_id: str, message: str = "Processing complete", final_s
         print(f"ERROR: complete_job_sync called but Redis client is not initialized.")
         return
     try:
-        redis_key = f"job:{job_id}"
-        job_data = redis_client.get(redis_key)
-        job = {}
-
-        if job_data:
-            try:
-                job = json.loads(job_data)
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Could not parse existing job data: {e}")
-
-        # Update job fields for final status
-        job["job_id"] = job_id
-        job["status"] = final_status
-        job["message"] = message
-        if final_status == "completed":
-            job["percent_complete"] = 100
-            if "total_pages" in job:
-                job["current_page"] = job["total_pages"]
-        else:
-            job["percent_complete"] = job.get("percent_complete", 0)
-
-        # Store in Redis
-        redis_client.setex(redis_key, 86400, json.dumps(job)) # Keep expiry consistent
+        _sync_script("COMPLETE_SCRIPT")(keys=_job_keys(job_id, _parent_of_sync(job_id)), args=[JOB_TTL, job_id, final_status, message])
+        _progress_state.pop(job_id, None)
+        _parent_ids.pop(job_id, None)
 
         completion_dt = datetime.datetime.now().isoformat()
         print(f"[{completion_dt}] Finalized job (sync): {job_id} with status '{final_status}' - {message}")
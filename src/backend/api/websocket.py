@@ -1,81 +1,173 @@
-# from fastapi import WebSocket, WebSocketDisconnect, APIRouter
-# import json
-# import asyncio
-# from typing import Dict, List
-
-# router = APIRouter()
-
-# # Store active connections by job ID
-# active_connections: Dict[str, List[WebSocket]] = {}
-
-# @router.websocket("/ws/progress/{job_id}")
-# async def websocket_endpoint(websocket: WebSocket, job_id: str):
-#     """
-#     WebSocket endpoint that clients connect to for receiving real-time updates
-#     Each client connects to a specific job_id they want to track
-#     """
-#     print(f"DEBUG: WebSocket connection request received for job: {job_id}")
-#     await websocket.accept()
-#     print(f"DEBUG: WebSocket connection accepted for job: {job_id}")
-    
-#     # Register connection
-#     if job_id not in active_connections:
-#         active_connections[job_id] = []
-#     active_connections[job_id].append(websocket)
-    
-#     print(f"WebSocket: New connection established for job: {job_id}")
-#     print(f"DEBUG: Total active connections: {sum(len(conns) for conns in active_connections.values())}")
-    
-#     try:
-#         # Keep the connection alive and handle client messages
-#         while True:
-#             data = await websocket.receive_text()
-#             # Handle ping messages to keep connection alive
-#             if data == "ping":
-#                 print(f"DEBUG: Ping received from client for job: {job_id}")
-#                 await websocket.send_text("pong")
-#             else:
-#                 print(f"DEBUG: Received message from client: {data[:50]}...")
-            
-#     except WebSocketDisconnect:
-#         print(f"DEBUG: WebSocket disconnect detected for job: {job_id}")
-#         # Clean up when client disconnects
-#         if job_id in active_connections:
-#             active_connections[job_id].remove(websocket)
-#             if not active_connections[job_id]:
-#                 del active_connections[job_id]
-#         print(f"WebSocket: Connection closed for job: {job_id}")
-#     except Exception as e:
-#         print(f"DEBUG: WebSocket error: {type(e).__name__}: {e}")
-#         # Cleanup
-#         if job_id in active_connections and websocket in active_connections[job_id]:
-#             active_connections[job_id].remove(websocket)
-            
-# async def broadcast_progress(job_id: str, data: dict):
-#     """
-#     Broadcasts progress updates to all clients watching a specific job
-#     This function is called by the progress tracking module when progress changes
-#     """
-#     if job_id in active_connections and active_connections[job_id]:
-#         # Log only once per broadcast, not per connection
-#         percent = data.get('percent_complete', -1)
-#         # Log less frequently based on percentage milestones
-#         if percent % 5 == 0 or percent == 1 or percent >= 99:
-#              print(f"DEBUG: Broadcasting progress for job {job_id}: {percent}%")
-
-#         message_json = json.dumps(data) # Serialize once
-#         # Create a list of tasks to send messages concurrently
-#         tasks = [connection.send_text(message_json) for connection in active_connections[job_id]]
-#         results = await asyncio.gather(*tasks, return_exceptions=True)
-
-#         # Handle potential errors during broadcast
-#         for i, result in enumerate(results):
-#             if isinstance(result, Exception):
-#                 connection = active_connections[job_id][i]
-#                 print(f"DEBUG: Error broadcasting to client {connection.client}: {type(result).__name__}: {result}")
-#                 # Optionally remove problematic connections here
-#                 # active_connections[job_id].remove(connection)
-#                 # if not active_connections[job_id]: del active_connections[job_id]
-#     # else:
-#         # Optional: Log if no connections found for a job when trying to broadcast
-#         # print(f"DEBUG: No active WebSocket connections found for job {job_id} during broadcast.")
\ No newline at end of file
+from fastapi import WebSocket, WebSocketDisconnect, APIRouter
+from fastapi.concurrency import run_in_threadpool
+import redis.asyncio as aioredis
+import json
+import os
+import asyncio
+from typing import Dict, Optional, Set
+
+from src.backend.api.progress import PROGRESS_CHANNEL_PREFIX, redis_url, get_job
+
+router = APIRouter()
+
+# --- Per-connection send configuration ---
+WEBSOCKET_SEND_TIMEOUT = float(os.getenv('WEBSOCKET_SEND_TIMEOUT', 10)) # Seconds before a stalled client is dropped
+WEBSOCKET_SEND_QUEUE = int(os.getenv('WEBSOCKET_SEND_QUEUE', 100)) # Messages a slow client may fall behind by
+
+
+class ProgressBroadcaster:
+    """
+    Relays job progress published on Redis to the websockets connected to this backend.
+
+    One pattern subscription (job_progress:*) is shared by every connection in the process,
+    so the Redis cost doesn't grow with the number of watchers or jobs. Each connection has its
+    own outbox and writer task: messages to a websocket are sent one at a time, and a stalled
+    client is dropped without holding up updates to the others.
+    """
+
+    def __init__(self, url: str = redis_url):
+        self.url = url
+        # Store active connections by job ID
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self._outboxes: Dict[WebSocket, asyncio.Queue] = {}
+        self._writers: Dict[WebSocket, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts the subscription task (once per process)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        for writer in self._writers.values():
+            writer.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def register(self, job_id: str, websocket: WebSocket) -> None:
+        self.active_connections.setdefault(job_id, set()).add(websocket)
+        if websocket not in self._outboxes:
+            self._outboxes[websocket] = asyncio.Queue(maxsize=WEBSOCKET_SEND_QUEUE)
+            self._writers[websocket] = asyncio.create_task(self._write(job_id, websocket))
+        print(f"DEBUG: Total active connections: {sum(len(conns) for conns in self.active_connections.values())}")
+
+    def unregister(self, job_id: str, websocket: WebSocket) -> None:
+        connections = self.active_connections.get(job_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                del self.active_connections[job_id]
+        self._outboxes.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+    def send(self, job_id: str, websocket: WebSocket, text: str) -> None:
+        """Queues a message for the connection's writer; a client too far behind is dropped"""
+        outbox = self._outboxes.get(websocket)
+        if outbox is None:
+            return
+        try:
+            outbox.put_nowait(text)
+        except asyncio.QueueFull:
+            print(f"DEBUG: Client {websocket.client} fell {outbox.qsize()} messages behind, dropping it")
+            self._drop(job_id, websocket)
+
+    def _drop(self, job_id: str, websocket: WebSocket) -> None:
+        self.unregister(job_id, websocket)
+        # Closing may block on the same stalled socket, so it runs on its own
+        asyncio.create_task(self._close(websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(), WEBSOCKET_SEND_TIMEOUT)
+        except Exception:
+            pass # Already closed or unreachable
+
+    async def _write(self, job_id: str, websocket: WebSocket) -> None:
+        """Sends the connection's queued messages in order (the only task writing to it)"""
+        outbox = self._outboxes[websocket]
+        while True:
+            text = await outbox.get()
+            try:
+                await asyncio.wait_for(websocket.send_text(text), WEBSOCKET_SEND_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"DEBUG: Error sending to client {websocket.client}: {type(e).__name__}: {e}")
+                self._drop(job_id, websocket)
+                return
+
+    async def _listen(self) -> None:
+        while True:
+            client = aioredis.from_url(self.url, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{PROGRESS_CHANNEL_PREFIX}*")
+                print(f"WebSocket: Subscribed to {PROGRESS_CHANNEL_PREFIX}* on {self.url}")
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    job_id = message["channel"][len(PROGRESS_CHANNEL_PREFIX):]
+                    if job_id in self.active_connections:
+                        self.broadcast_progress(job_id, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Progress subscription failed: {type(e).__name__}: {e}. Reconnecting...")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.close()
+                    await client.close()
+                except Exception:
+                    pass
+
+    def broadcast_progress(self, job_id: str, message_json: str) -> None:
+        """Queues an (already serialized) job update for all clients watching the job"""
+        for connection in list(self.active_connections.get(job_id, ())):
+            self.send(job_id, connection, message_json)
+
+
+broadcaster = ProgressBroadcaster()
+
+
+@router.websocket("/ws/progress/{job_id}")
+async def websocket_endpoint(websocket: WebSocket, job_id: str):
+    """
+    WebSocket endpoint that clients connect to for receiving real-time updates
+    Each client connects to a specific job_id they want to track
+    """
+    await websocket.accept()
+    broadcaster.start()
+    # Register before reading the snapshot so no update falls in between
+    broadcaster.register(job_id, websocket)
+    print(f"WebSocket: New connection established for job: {job_id}")
+
+    try:
+        # Send the current state right away instead of waiting for the next update
+        job = await run_in_threadpool(get_job, job_id)
+        if job is None:
+            broadcaster.send(job_id, websocket, json.dumps({"job_id": job_id, "status": "error", "message": f"Job {job_id} not found"}))
+        else:
+            broadcaster.send(job_id, websocket, json.dumps(job))
+
+        # Keep the connection alive and handle client messages
+        while True:
+            data = await websocket.receive_text()
+            # Handle ping messages to keep connection alive
+            if data == "ping":
+                broadcaster.send(job_id, websocket, "pong")
+
+    except WebSocketDisconnect:
+        print(f"WebSocket: Connection closed for job: {job_id}")
+    except Exception as e:
+        print(f"DEBUG: WebSocket error: {type(e).__name__}: {e}")
+    finally:
+        broadcaster.unregister(job_id, websocket)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from typing import Callable, List, Optional
+
+from src.backend.database.redis_client import get_redis_connection, get_corpus_version
+
+# --- Answer cache configuration ---
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 86400)) # Seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1000)) # Per scope
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0.95)) # Cosine similarity for a semantic hit
+ANSWER_CACHE_SEMANTIC_CANDIDATES = 5 # Most similar cached questions checked for matching key terms
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip('?!. ')
+
+
+def question_key_terms(question: str) -> frozenset:
+    """
+    Terms a semantic hit must share with the cached question: quoted phrases, numbers and
+    anything containing a digit, identifiers (a_b, a-b, a.b, a/b) and capitalized words after
+    the first. Embeddings barely separate "page 12" from "page 21" or one name from another.
+    """
+    terms = {phrase.lower() for phrase in re.findall(r'"([^"]+)"', question)}
+    for position, token in enumerate(re.findall(r"[\w][\w\-./]*", question)):
+        token = token.rstrip('.')
+        if (any(char.isdigit() for char in token) or any(char in '_-./' for char in token)
+                or (position > 0 and token[:1].isupper())):
+            terms.add(token.lower())
+    return frozenset(terms)
+
+
+class AnswerCache:
+    """
+    Redis cache of chat answers in front of the assistants.
+
+    Entries are scoped by corpus version, retrieval mode and LLM parameters, so ingesting new
+    chunks (which bumps the corpus version) makes every earlier answer unreachable; the old
+    keys then expire through their TTL. A lookup first tries the exact normalized question,
+    then the most similar cached question whose embedding is above `similarity_threshold` and
+    that has the same key terms (numbers, names, ids).
+    Each scope keeps at most `max_entries` answers, evicting the least recently used.
+    """
+
+    def __init__(self, embed_query: Callable[[str], List[float]], redis_client=None,
+                 ttl: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.embed_query = embed_query
+        self.redis = redis_client or get_redis_connection(decode_responses=False)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        # Local copy of each scope's question vectors: (generation, keys, matrix, entries of the
+        # :added log applied). New entries are appended from the log; evictions bump the
+        # generation, which reloads the whole :vectors hash.
+        self._matrices = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _scope(self, mode: str, llm_params: dict) -> str:
+        params = ":".join(f"{key}={llm_params[key]}" for key in sorted(llm_params))
+        return f"answer:v{get_corpus_version()}:{mode}:{params}"
+
+    @staticmethod
+    def _question_key(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:32]
+
+    def _load_matrix(self, scope: str):
+        """Returns (keys, unit-normalized vector matrix) for a scope."""
+        generation = self.redis.get(f"{scope}:gen")
+        with self._lock:
+            cached = self._matrices.get(scope)
+        if cached and cached[0] == generation:
+            return self._append_added(scope, *cached)
+
+        pipe = self.redis.pipeline(transaction=True) # Log position and hash from the same moment
+        pipe.llen(f"{scope}:added")
+        pipe.hgetall(f"{scope}:vectors")
+        applied, vectors = pipe.execute()
+        keys = [key.decode() for key in vectors]
+        matrix = np.array([np.frombuffer(value, dtype=np.float32) for value in vectors.values()]) if vectors else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            # Drop matrices of scopes from older corpus versions
+            self._matrices = {s: m for s, m in self._matrices.items() if s.split(":")[1] == scope.split(":")[1]}
+            self._matrices[scope] = (generation, keys, matrix, applied)
+        return keys, matrix
+
+    def _append_added(self, scope: str, generation, keys: List[str], matrix: np.ndarray, applied: int):
+        """Adds the entries put (by any process) since the local matrix was loaded."""
+        added = [key.decode() for key in self.redis.lrange(f"{scope}:added", applied, -1)]
+        if not added:
+            return keys, matrix
+        positions = {key: row for row, key in enumerate(keys)}
+        new_keys = [key for key in dict.fromkeys(added) if key not in positions]
+        if new_keys:
+            values = self.redis.hmget(f"{scope}:vectors", new_keys)
+            rows = [(key, np.frombuffer(value, dtype=np.float32)) for key, value in zip(new_keys, values) if value is not None]
+            if rows:
+                new_matrix = np.array([vector for _, vector in rows])
+                keys = keys + [key for key, _ in rows]
+                matrix = np.concatenate([matrix, new_matrix]) if len(matrix) else new_matrix
+        with self._lock:
+            self._matrices[scope] = (generation, keys, matrix, applied + len(added))
+        return keys, matrix
+
+    def _touch(self, scope: str, key: str) -> None:
+        self.redis.zadd(f"{scope}:lru", {key: time.time()})
+
+    def get(self, question: str, mode: str, llm_params: dict) -> Optional[dict]:
+        """Returns the cached {"answer", "sources"} for the question, or None."""
+        scope = self._scope(mode, llm_params)
+        key = self._question_key(normalize_question(question))
+
+        entry = self.redis.hget(f"{scope}:entries", key)
+        if entry is not None:
+            self._touch(scope, key)
+            self._count(hit=True)
+            return json.loads(entry)
+
+        keys, matrix = self._load_matrix(scope)
+        if len(keys) and self.similarity_threshold < 1.0:
+            query_vector = self._unit(self.embed_query(question))
+            if query_vector.shape[0] == matrix.shape[1]:
+                scores = matrix @ query_vector
+                key_terms = question_key_terms(question)
+                for best in np.argsort(-scores)[:ANSWER_CACHE_SEMANTIC_CANDIDATES]:
+                    if scores[best] < self.similarity_threshold:
+                        break
+                    entry = self.redis.hget(f"{scope}:entries", keys[best])
+                    if entry is None:
+                        continue
+                    cached = json.loads(entry)
+                    if question_key_terms(cached["question"]) != key_terms:
+                        continue # Similar wording, but about a different page, name or id
+                    self._touch(scope, keys[best])
+                    self._count(hit=True, semantic=True)
+                    return cached
+        self._count(hit=False)
+        return None
+
+    def _count(self, hit: bool, semantic: bool = False) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.semantic_hits += semantic
+            else:
+                self.misses += 1
+
+    def put(self, question: str, mode: str, llm_params: dict, answer: str, sources: List[str]) -> None:
+        scope = self._scope(mode, llm_params)
+        normalized = normalize_question(question)
+        key = self._question_key(normalized)
+        vector = self._unit(self.embed_query(question))
+        entry = json.dumps({"question": question, "answer": answer, "sources": sources})
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(f"{scope}:entries", key, entry)
+        pipe.hset(f"{scope}:vectors", key, vector.tobytes())
+        pipe.zadd(f"{scope}:lru", {key: time.time()})
+        pipe.rpush(f"{scope}:added", key) # Other processes append it to their matrix
+        pipe.zcard(f"{scope}:lru")
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        pipe = self.redis.pipeline(transaction=False)
+        if overflow > 0:
+            evicted = [member for member, _ in self.redis.zpopmin(f"{scope}:lru", overflow)]
+            if evicted:
+                pipe.hdel(f"{scope}:entries", *evicted)
+                pipe.hdel(f"{scope}:vectors", *evicted)
+                # Rows can't be removed from the local matrices: every process reloads the scope
+                pipe.delete(f"{scope}:added")
+                pipe.incr(f"{scope}:gen")
+        for suffix in ("entries", "vectors", "lru", "added", "gen"):
+            pipe.expire(f"{scope}:{suffix}", self.ttl)
+        pipe.execute()
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses}
@@ -0,0 +1,117 @@
+import os
+from typing import List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from src.backend.assistant.llm import LLM_CONTEXT_WINDOW, DEFAULT_MAX_TOKENS
+from src.backend.document_processing.embedding_client import estimate_tokens
+
+# --- Context packing configuration ---
+CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', 0)) # Hard cap on context tokens; 0 derives it from the context window
+CONTEXT_SAFETY_TOKENS = int(os.getenv('CONTEXT_SAFETY_TOKENS', 128)) # Headroom for chat template tokens and estimation error
+CHUNK_OVERLAP_CHARS = int(os.getenv('CHUNK_OVERLAP_CHARS', 150)) # TextProcessor chunk_overlap
+MIN_OVERLAP_CHARS = 20 # Shorter matches between neighbours are treated as coincidence
+SECTION_SEPARATOR = "\n\n"
+
+
+def context_token_budget(prompt_text: str, max_tokens: Optional[int] = None) -> int:
+    """Tokens left for retrieved context once the prompt and the answer are accounted for"""
+    if CONTEXT_MAX_TOKENS > 0:
+        return CONTEXT_MAX_TOKENS
+    answer_tokens = max_tokens or DEFAULT_MAX_TOKENS
+    return max(0, LLM_CONTEXT_WINDOW - answer_tokens - estimate_tokens(prompt_text) - CONTEXT_SAFETY_TOKENS)
+
+
+def overlap_length(previous: str, following: str, max_overlap: int = CHUNK_OVERLAP_CHARS * 2) -> int:
+    """Length of the longest suffix of `previous` that `following` starts with"""
+    for length in range(min(len(previous), len(following), max_overlap), MIN_OVERLAP_CHARS - 1, -1):
+        if following.startswith(previous[-length:]):
+            return length
+    return 0
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, preferring to end at a sentence or word boundary"""
+    max_chars = max(0, (max_tokens - 1) * 4) # Inverse of estimate_tokens
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary < max_chars // 2:
+        boundary = cut.rfind(" ")
+    return (cut[:boundary + 1] if boundary > 0 else cut).rstrip()
+
+
+def merge_neighbours(documents: Sequence[Document]) -> List[List[Document]]:
+    """
+    Groups retrieved chunks into sections of consecutive chunks from the same document.
+
+    Sections keep the retrieval order of their best-ranked chunk; chunks without a document id
+    or chunk index stay on their own. Exact duplicate chunks are dropped.
+    """
+    sections = []
+    by_position = {} # (doc_id, chunk_index) -> section
+    seen_texts = set()
+    for doc in documents:
+        if doc.page_content in seen_texts:
+            continue
+        seen_texts.add(doc.page_content)
+        doc_id, chunk_index = doc.metadata.get("doc_id"), doc.metadata.get("chunk_index")
+        if doc_id is None or chunk_index is None:
+            sections.append([doc])
+            continue
+
+        before = by_position.get((doc_id, chunk_index - 1))
+        after = by_position.get((doc_id, chunk_index + 1))
+        if before is not None and after is not None and before is not after:
+            # This chunk bridges two sections: join them at the position of the better-ranked one
+            section = before + [doc] + after
+            positions = sorted(i for i, existing in enumerate(sections) if existing is before or existing is after)
+            sections[positions[0]] = section
+            del sections[positions[1]]
+            for member in section:
+                by_position[(doc_id, member.metadata["chunk_index"])] = section
+        elif before is not None:
+            before.append(doc)
+            section = before
+        elif after is not None:
+            after.insert(0, doc)
+            section = after
+        else:
+            section = [doc]
+            sections.append(section)
+        by_position[(doc_id, chunk_index)] = section
+    return sections
+
+
+def section_text(section: Sequence[Document]) -> str:
+    """Joins consecutive chunks, removing the text each one repeats from its predecessor"""
+    text = section[0].page_content
+    for doc in section[1:]:
+        overlap = overlap_length(text, doc.page_content)
+        text += doc.page_content[overlap:] if overlap else "\n" + doc.page_content
+    return text.strip()
+
+
+def build_context(documents: Sequence[Document], max_tokens: int) -> str:
+    """
+    Packs retrieved chunks into the prompt context without exceeding `max_tokens` (estimated).
+
+    Neighbouring chunks of the same document are merged and their overlap removed. Sections are
+    added in retrieval order; the first one that doesn't fit is truncated and packing stops.
+    """
+    parts = []
+    used_tokens = 0
+    for section in merge_neighbours(documents):
+        text = section_text(section)
+        if not text:
+            continue
+        remaining = max_tokens - used_tokens - (estimate_tokens(SECTION_SEPARATOR) if parts else 0)
+        if estimate_tokens(text) > remaining:
+            text = _truncate_to_tokens(text, remaining)
+            if text:
+                parts.append(text)
+            break
+        parts.append(text)
+        used_tokens += estimate_tokens(text) + (estimate_tokens(SECTION_SEPARATOR) if len(parts) > 1 else 0)
+    return SECTION_SEPARATOR.join(parts)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.backend.assistant.answer_cache import normalize_question
+from src.backend.assistant.hybrid_retriever import FULLTEXT_INDEX_NAME, escape_lucene
+from src.backend.database.redis_client import get_redis_connection
+
+# --- Cypher cache configuration ---
+CYPHER_CACHE_TTL = int(os.getenv('CYPHER_CACHE_TTL', 7 * 86400)) # Seconds; entries are also scoped by schema version
+CYPHER_CACHE_LOCAL_SIZE = int(os.getenv('CYPHER_CACHE_LOCAL_SIZE', 1024))
+TEMPLATE_RESULT_LIMIT = 25
+
+
+def schema_fingerprint(schema: str) -> str:
+    """Short, stable version id for a graph schema string"""
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()[:12]
+
+
+class QueryTemplate:
+    """
+    Parameterized Cypher for one question shape (intent).
+
+    `pattern` is matched against the normalized question; its named groups become query
+    parameters, after passing through `transforms` when given.
+    """
+
+    def __init__(self, intent: str, pattern: str, cypher: str,
+                 transforms: Optional[Dict[str, Callable[[str], str]]] = None):
+        self.intent = intent
+        self.pattern = re.compile(pattern)
+        self.cypher = cypher
+        self.transforms = transforms or {}
+
+    def match(self, normalized_question: str) -> Optional[dict]:
+        match = self.pattern.fullmatch(normalized_question)
+        if match is None:
+            return None
+        params = {"limit": TEMPLATE_RESULT_LIMIT}
+        for name, value in match.groupdict().items():
+            value = (value or "").strip()
+            params[name] = self.transforms[name](value) if name in self.transforms else value
+        return params
+
+
+_DOCUMENTS = r"(?:documents|docs|files|pdfs)"
+_DOCUMENT_MATCH = "WHERE toLower(d.id) = $document OR toLower(d.title) = $document"
+
+# Common questions about the document graph, answered without the Cypher-generation LLM call
+CYPHER_TEMPLATES = [
+    QueryTemplate(
+        "count_documents",
+        rf"how many {_DOCUMENTS}(?: are there| do (?:you|we) have| have been (?:uploaded|ingested|processed))?",
+        "MATCH (d:Document) RETURN count(d) AS documents",
+    ),
+    QueryTemplate(
+        "list_documents",
+        rf"(?:(?:list|show)(?: me)?(?: all)?(?: the)? {_DOCUMENTS})|(?:(?:what|which) {_DOCUMENTS} (?:are there|are available|do (?:you|we) have|have been (?:uploaded|ingested|processed)))",
+        "MATCH (d:Document) RETURN d.id AS document, d.title AS title, d.chunk_count AS chunks ORDER BY d.id LIMIT $limit",
+    ),
+    QueryTemplate(
+        "count_chunks",
+        r"how many chunks(?: are there)?",
+        "MATCH (c:Chunk) RETURN count(c) AS chunks",
+    ),
+    QueryTemplate(
+        "count_document_chunks",
+        r"how many chunks (?:are (?:there )?in|does) (?:the )?(?:document |file )?(?P<document>.+?)(?: have)?",
+        f"MATCH (d:Document) {_DOCUMENT_MATCH} "
+        "OPTIONAL MATCH (d)-[:CONTAINS]->(c:Chunk) RETURN d.title AS document, count(c) AS chunks",
+        transforms={"document": lambda name: name.strip('"\'')},
+    ),
+    QueryTemplate(
+        "documents_mentioning",
+        rf"(?:which|what) {_DOCUMENTS} (?:mention|contain|talk about|discuss|refer to) (?P<terms>.+)",
+        f"CALL db.index.fulltext.queryNodes('{FULLTEXT_INDEX_NAME}', $terms, {{limit: 200}}) YIELD node, score "
+        "MATCH (d:Document)-[:CONTAINS]->(node) "
+        "RETURN d.title AS document, count(node) AS matching_chunks, max(score) AS best_score "
+        "ORDER BY best_score DESC LIMIT $limit",
+        transforms={"terms": escape_lucene},
+    ),
+]
+
+
+def match_template(question: str, templates: List[QueryTemplate] = CYPHER_TEMPLATES) -> Optional[Tuple[QueryTemplate, dict]]:
+    """Returns the first template matching the question and its parameters, if any"""
+    normalized = normalize_question(question)
+    for template in templates:
+        params = template.match(normalized)
+        if params is not None:
+            return template, params
+    return None
+
+
+def validate_cypher(neo4j_client, cypher: str) -> Optional[str]:
+    """
+    Plans the query with EXPLAIN (nothing is executed) and returns an error message if it
+    doesn't compile or isn't read-only; None when it is safe to run.
+    """
+    try:
+        summary = neo4j_client.explain(cypher)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    if summary.query_type != 'r':
+        return f"query is not read-only (type '{summary.query_type}')"
+    return None
+
+
+class CypherCache:
+    """
+    Memoizes validated generated Cypher by normalized question and graph schema version.
+
+    A bounded in-process LRU sits in front of Redis, so repeated questions skip the
+    Cypher-generation LLM call across requests, processes and restarts. Changing the schema
+    changes the version, which makes every earlier entry unreachable (they expire by TTL).
+    """
+
+    def __init__(self, redis_client=None, ttl: int = CYPHER_CACHE_TTL, local_size: int = CYPHER_CACHE_LOCAL_SIZE):
+        self.redis = redis_client or get_redis_connection()
+        self.ttl = ttl
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(question: str, schema_version: str) -> str:
+        digest = hashlib.sha256(normalize_question(question).encode('utf-8')).hexdigest()[:32]
+        return f"cypher:{schema_version}:{digest}"
+
+    def _remember(self, key: str, cypher: str) -> None:
+        with self._lock:
+            self._local[key] = cypher
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, question: str, schema_version: str) -> Optional[str]:
+        key = self._key(question, schema_version)
+        with self._lock:
+            cypher = self._local.get(key)
+            if cypher is not None:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return cypher
+        try:
+            cypher = self.redis.get(key)
+        except Exception as e:
+            print(f"WARNING: Cypher cache lookup failed: {type(e).__name__}: {e}")
+            cypher = None
+        if cypher is None:
+            self.misses += 1
+            return None
+        self._remember(key, cypher)
+        self.hits += 1
+        return cypher
+
+    def set(self, question: str, schema_version: str, cypher: str) -> None:
+        key = self._key(question, schema_version)
+        self._remember(key, cypher)
+        try:
+            self.redis.set(key, cypher, ex=self.ttl)
+        except Exception as e:
+            print(f"WARNING: Failed to store generated Cypher: {type(e).__name__}: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "local_entries": len(self._local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
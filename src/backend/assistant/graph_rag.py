@@ -1,20 +1,23 @@
-from langchain_openai import ChatOpenAI
-from langchain.chains import GraphCypherQAChain
+from langchain_community.chains.graph_qa.cypher import extract_cypher
+from langchain_community.chains.graph_qa.prompts import CYPHER_GENERATION_PROMPT, CYPHER_QA_PROMPT
 from langchain_community.graphs import Neo4jGraph
 from dotenv import load_dotenv
 from langchain_core.language_models.chat_models import BaseChatModel
 from typing import Optional
 import os
+import traceback
+from src.backend.database.neo4j_client import Neo4jClient, adopt_shared_driver
+from src.backend.assistant.llm import get_chat_llm
+from src.backend.assistant.graph_schema import GraphSchemaCache
+from src.backend.assistant.cypher_cache import CypherCache, match_template, schema_fingerprint, validate_cypher
 
 load_dotenv()
 
+GRAPH_QA_TOP_K = 10 # Max graph records passed to the answer prompt (GraphCypherQAChain default)
+
+
 class GraphRAGAssistant:
     def __init__(self, llm: Optional[BaseChatModel] = None):
-        # --- Configuration for Local LM Studio ---
-        # IMPORTANT: Use host.docker.internal for backend running in Docker to reach host
-        lm_studio_api_base = "http://host.docker.internal:1234/v1" # <-- CORRECTED for Docker
-        lm_studio_api_key = "lm-studio" # Dummy key
-
         # --- Neo4j Configuration ---
         # IMPORTANT: Use 'neo4j' as hostname for backend running in Docker
         neo4j_uri = os.getenv('NEO4J_URI', 'bolt://neo4j:7687') # <-- CORRECTED for Docker
@@ -24,78 +27,128 @@ class GraphRAGAssistant:
         # Initialize Neo4j graph
         print("Connecting to Neo4j graph...")
         try:
+            # The schema comes from the Redis snapshot instead of a full refresh on every start
             self.graph = Neo4jGraph(
                 url=neo4j_uri,
                 username=neo4j_user,
-                password=neo4j_password
+                password=neo4j_password,
+                refresh_schema=False
             )
-            # Refresh schema to make it available for the chain
-            self.graph.refresh_schema()
-            print("Neo4j graph connected and schema refreshed.")
+            # Share the process-wide connection pool instead of a private driver
+            adopt_shared_driver(self.graph, neo4j_uri, neo4j_user, neo4j_password)
+            self.neo4j_client = Neo4jClient(neo4j_uri, neo4j_user, neo4j_password) # Same shared driver, for EXPLAIN
+            self.schema_version = None
+            self.schema_cache = GraphSchemaCache(self.graph, on_update=self._on_schema_update)
+            self.schema_cache.load()
+            print(f"Neo4j graph connected (schema snapshot {'loaded' if self.schema_cache.ready else 'refreshing in background'}).")
         except Exception as e:
-            print(f"FATAL: Failed to connect to Neo4j or refresh schema: {e}")
+            print(f"FATAL: Failed to connect to Neo4j: {e}")
             # Depending on your error handling strategy, you might want to raise here
             raise e # Or handle appropriately
 
-        # Initialize LLM using ChatOpenAI pointed to LM Studio
-        print(f"Initializing LLM via LM Studio at: {lm_studio_api_base}")
         # Use the provided LLM if available, otherwise create default
         if llm:
             self.llm = llm
             print("GraphRAG Assistant initialized with provided LLM.")
         else:
-            print(f"Initializing default LLM via LM Studio at: {lm_studio_api_base}")
-            self.llm = ChatOpenAI(
-                openai_api_key=lm_studio_api_key,
-                openai_api_base=lm_studio_api_base,
-                temperature=0 # Default temperature
-            )
+            # Default LLM (LM Studio, deterministic) used when a query doesn't pass parameters
+            self.llm = get_chat_llm(temperature=0)
             print("Default LLM initialized.")
 
-        # Initialize graph QA chain using self.llm
+        # Initialize graph QA chain
         self._create_qa_chain()
         print("Graph RAG Assistant ready.")
 
     def _create_qa_chain(self):
-        """Helper to create/recreate the QA chain."""
-        print("Creating GraphCypherQAChain...")
-        try:
-            # Use GraphCypherQAChain instead
-            self.qa_chain = GraphCypherQAChain.from_llm(
-                cypher_llm=self.llm, # LLM to generate Cypher
-                qa_llm=self.llm,     # LLM to answer based on Cypher results
-                graph=self.graph,
-                verbose=True,
-                allow_dangerous_requests=True, # <-- ADD THIS LINE
-                # You might need to adjust prompts depending on your LLM/data
-                # validate_cypher=True, # Optional: adds a validation step
-            )
-            print("GraphCypherQAChain created/updated.")
-        except Exception as e:
-            print(f"FATAL: Failed to create GraphCypherQAChain: {e}")
-            # Depending on your error handling strategy, you might want to raise here
-            raise e # Or handle appropriately
+        """Helper to set up the Cypher generation and answer prompts (once, at startup)."""
+        # Same two steps as GraphCypherQAChain (generate Cypher, answer from the records), but the
+        # LLM is picked per query so request parameters don't require rebuilding the chain.
+        self.cypher_prompt = CYPHER_GENERATION_PROMPT
+        self.qa_prompt = CYPHER_QA_PROMPT
+        self.top_k = GRAPH_QA_TOP_K
+        # Generated Cypher is memoized per schema version; common question shapes use templates
+        self.cypher_cache = CypherCache()
+        print("Graph QA chain created.")
 
+    def _on_schema_update(self, schema: str):
+        # Cached Cypher stays valid across corpus versions as long as the schema itself is unchanged
+        self.schema_version = schema_fingerprint(schema)
 
     def update_llm(self, llm: BaseChatModel):
-        """Updates the LLM instance and recreates the chain."""
-        print("Updating GraphRAG Assistant LLM...")
+        """Replaces the default LLM. Per-request settings should be passed to query() instead."""
+        print("Updating GraphRAG Assistant default LLM...")
         self.llm = llm
-        self._create_qa_chain() # Recreate the chain with the new LLM
-        print("GraphRAG Assistant LLM updated.")
+        print("GraphRAG Assistant default LLM updated.")
 
+    def _get_llm(self, temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> BaseChatModel:
+        if temperature is None and max_tokens is None:
+            return self.llm
+        return get_chat_llm(temperature, max_tokens)
 
-    def query(self, question):
-        """Query the Graph RAG assistant with a question"""
-        if not hasattr(self, 'qa_chain') or self.qa_chain is None:
-             error_msg = "GraphCypherQAChain is not initialized."
-             print(f"ERROR: {error_msg}")
-             return {"error": error_msg} # Or raise an exception
+    def generate_cypher(self, question, llm: Optional[BaseChatModel] = None) -> str:
+        """Ask the LLM for a Cypher query answering the question, given the graph schema."""
+        llm = llm or self.llm
+        prompt = self.cypher_prompt.format_prompt(schema=self.graph.get_schema, question=question)
+        return extract_cypher(llm.invoke(prompt).content)
+
+    def resolve_cypher(self, question, llm: Optional[BaseChatModel] = None):
+        """
+        Returns (cypher, params) for a question: a matching query template, else previously
+        generated Cypher from the cache, else new Cypher from the LLM (validated with EXPLAIN
+        and cached). cypher is empty if the LLM's query was unusable.
+        """
+        template_match = match_template(question)
+        if template_match:
+            template, params = template_match
+            print(f"Cypher template '{template.intent}' matched with params {params}")
+            return template.cypher, params
+
+        # Cypher generation needs the schema; a newer one is picked up in the background
+        self.schema_cache.check()
+        if not self.schema_cache.ready and not self.schema_cache.wait_ready():
+            print("WARNING: Graph schema not available yet, generating Cypher without it")
+        # Read once so lookup and store use the same key; Cypher generated without a schema isn't cached
+        schema_version = self.schema_version
+        cypher = self.cypher_cache.get(question, schema_version) if schema_version else None
+        if cypher:
+            print(f"Cached Cypher: {cypher}")
+            return cypher, {}
+
+        cypher = self.generate_cypher(question, llm)
+        print(f"Generated Cypher: {cypher}")
+        if not cypher:
+            return "", {}
+        error = validate_cypher(self.neo4j_client, cypher)
+        if error:
+            print(f"WARNING: Rejected generated Cypher ({error})")
+            return "", {}
+        if schema_version:
+            self.cypher_cache.set(question, schema_version, cypher)
+        return cypher, {}
+
+    def prepare(self, question, temperature: Optional[float] = None, max_tokens: Optional[int] = None):
+        """
+        Finds and runs the Cypher query for a question and builds the answer prompt.
+
+        Returns (llm, prompt, context); the caller invokes or streams the LLM.
+        """
+        llm = self._get_llm(temperature, max_tokens)
+        cypher, params = self.resolve_cypher(question, llm)
+        context = self.graph.query(cypher, params)[:self.top_k] if cypher else []
+        print(f"Full Context: {context}")
+        prompt = self.qa_prompt.format_prompt(context=context, question=question)
+        return llm, prompt, context
+
+    def query(self, question, temperature: Optional[float] = None, max_tokens: Optional[int] = None):
+        """
+        Query the Graph RAG assistant with a question.
 
+        temperature/max_tokens apply to this call only; shared state is not modified.
+        """
         print(f"GraphRAG Query: {question}")
         try:
-            # The chain now uses the potentially updated self.llm
-            result = self.qa_chain.invoke({"query": question})
+            llm, prompt, _ = self.prepare(question, temperature, max_tokens)
+            result = {"query": question, "result": llm.invoke(prompt).content}
             print(f"GraphRAG Result: {result}")
             return result
         except Exception as e:
@@ -103,4 +156,4 @@ class GraphRAGAssistant:
              print(f"ERROR: {error_msg}")
              traceback.print_exc() # Print full traceback for debugging
              # Return a dictionary indicating error, or raise exception
-             return {"error": error_msg, "details": traceback.format_exc()}
\ No newline at end of file
+             return {"error": error_msg, "details": traceback.format_exc()}
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from src.backend.database.redis_client import get_redis_connection, get_corpus_version
+
+# --- Graph schema snapshot configuration ---
+GRAPH_SCHEMA_KEY = "graph:schema" # JSON snapshot of Neo4jGraph.schema / structured_schema
+GRAPH_SCHEMA_LOCK_KEY = "graph:schema:lock" # Held by the process refreshing the snapshot
+GRAPH_SCHEMA_LOCK_TTL = int(os.getenv('GRAPH_SCHEMA_LOCK_TTL', 600)) # Seconds; frees the lock if a refresh dies
+GRAPH_SCHEMA_CHECK_INTERVAL = float(os.getenv('GRAPH_SCHEMA_CHECK_INTERVAL', 30)) # Seconds between version checks
+GRAPH_SCHEMA_WAIT = float(os.getenv('GRAPH_SCHEMA_WAIT', 30)) # Max seconds a query waits when there is no schema yet
+
+# Deletes the lock only if it still holds this refresh's token (it may have expired and been taken over)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class GraphSchemaCache:
+    """
+    Serves the Neo4jGraph schema from a snapshot in Redis instead of refreshing it at startup.
+
+    The snapshot is stamped with the corpus version, which ingestion bumps. When the stamp
+    no longer matches, the schema is refreshed in a background thread (APOC meta procedures
+    over the whole graph). A Redis lock makes sure only one backend process does this. Until
+    the refresh finishes, the previous snapshot stays in use. Only the very first start,
+    with no snapshot at all, has to wait for a refresh before generating Cypher.
+    """
+
+    def __init__(self, graph, redis_client=None, on_update: Optional[Callable[[str], None]] = None,
+                 check_interval: float = GRAPH_SCHEMA_CHECK_INTERVAL):
+        self.graph = graph
+        self.redis = redis_client or get_redis_connection()
+        self.on_update = on_update
+        self.check_interval = check_interval
+        self.version = None # Corpus version the schema in use was taken at
+        self._last_check = 0.0
+        self._ready = threading.Event()
+        self._refreshing = threading.Lock()
+        self._release_lock = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _read_snapshot(self) -> Optional[dict]:
+        value = self.redis.get(GRAPH_SCHEMA_KEY)
+        return json.loads(value) if value else None
+
+    def _apply(self, snapshot: dict) -> None:
+        self.graph.schema = snapshot["schema"]
+        self.graph.structured_schema = snapshot["structured_schema"]
+        self.version = snapshot["version"]
+        self._ready.set()
+        if self.on_update:
+            self.on_update(snapshot["schema"])
+
+    def load(self) -> None:
+        """Applies the stored snapshot (if any) and schedules a refresh when it is out of date."""
+        self.check(force=True)
+
+    def check(self, force: bool = False) -> None:
+        """Compares the snapshot's stamp with the corpus version; cheap, and throttled to check_interval."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            current = get_corpus_version()
+            if self.version == current:
+                return
+            snapshot = self._read_snapshot()
+            # An outdated snapshot is still better than no schema while the refresh runs
+            if snapshot and (snapshot["version"] == current or not self.ready):
+                self._apply(snapshot)
+            if self.version != current:
+                self._start_refresh(current)
+        except Exception as e:
+            print(f"WARNING: Graph schema snapshot check failed: {type(e).__name__}: {e}")
+
+    def _start_refresh(self, version: int) -> None:
+        if not self._refreshing.acquire(blocking=False):
+            return # Already refreshing in this process
+        threading.Thread(target=self._refresh, args=(version,), name="graph-schema-refresh", daemon=True).start()
+
+    def _refresh(self, version: int) -> None:
+        try:
+            token = uuid.uuid4().hex # Unique per acquisition; pids repeat across containers
+            if not self.redis.set(GRAPH_SCHEMA_LOCK_KEY, token, nx=True, ex=GRAPH_SCHEMA_LOCK_TTL):
+                return # Another process is refreshing; its snapshot is picked up by a later check()
+            try:
+                start = time.time()
+                self.graph.refresh_schema()
+                snapshot = {
+                    "version": version,
+                    "schema": self.graph.schema,
+                    "structured_schema": self.graph.structured_schema,
+                }
+                self.redis.set(GRAPH_SCHEMA_KEY, json.dumps(snapshot, default=str))
+                self._apply(snapshot)
+                print(f"Graph schema refreshed for corpus version {version} in {time.time() - start:.2f}s")
+            finally:
+                self._release_lock(keys=[GRAPH_SCHEMA_LOCK_KEY], args=[token]) # Don't free another process's lock
+        except Exception as e:
+            print(f"ERROR refreshing graph schema: {type(e).__name__}: {e}")
+        finally:
+            self._refreshing.release()
+
+    def wait_ready(self, timeout: float = GRAPH_SCHEMA_WAIT) -> bool:
+        """Blocks until a schema is available (first start only); returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while not self.ready and time.monotonic() < deadline:
+            self.check(force=True) # Picks up a snapshot written by another process
+            self._ready.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+        return self.ready
@@ -0,0 +1,123 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- Hybrid retrieval configuration ---
+VECTOR_INDEX_NAME = "chunk_embeddings"
+FULLTEXT_INDEX_NAME = "chunk_fulltext" # Created by the ingest pipeline schema / process_documents.py
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', 4)) # Chunks passed to the LLM
+HYBRID_FETCH_K = int(os.getenv('HYBRID_FETCH_K', 20)) # Candidates taken from each index before fusion
+RRF_K = int(os.getenv('RRF_K', 60)) # Reciprocal rank fusion constant
+
+# Both searches return the same columns so their hits can be fused by chunk id
+_CHUNK_COLUMNS = """
+RETURN node.id AS id, node.content AS text, node.chunk_index AS chunk_index,
+       [(d:Document)-[:CONTAINS]->(node) | d.id][0] AS doc_id, score
+"""
+# Neo4jVector retrieval_query for vector-only search: same chunk metadata, so neighbour merging works there too
+VECTOR_RETRIEVAL_QUERY = """
+RETURN node.content AS text, score,
+       {id: node.id, chunk_index: node.chunk_index, doc_id: [(d:Document)-[:CONTAINS]->(node) | d.id][0]} AS metadata
+"""
+VECTOR_SEARCH_QUERY = "CALL db.index.vector.queryNodes($index, $k, $embedding) YIELD node, score" + _CHUNK_COLUMNS
+FULLTEXT_SEARCH_QUERY = "CALL db.index.fulltext.queryNodes($index, $query, {limit: $k}) YIELD node, score" + _CHUNK_COLUMNS
+# Hits from the local vector index only need their chunk looked up by id
+CHUNKS_BY_ID_QUERY = """
+UNWIND range(0, size($ids) - 1) AS i
+MATCH (node:Chunk {id: $ids[i]})
+WITH node, $scores[i] AS score
+ORDER BY score DESC
+""" + _CHUNK_COLUMNS
+
+# Threads for running the two searches side by side (shared by all retrievers)
+_search_executor = ThreadPoolExecutor(max_workers=int(os.getenv('HYBRID_SEARCH_THREADS', 8)), thread_name_prefix="hybrid-search")
+
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def escape_lucene(text: str) -> str:
+    """Makes free text safe for the full-text query parser (keeps terms like part numbers intact)"""
+    # Lowercase so words like AND/OR/NOT aren't parsed as operators; the analyzer lowercases anyway
+    return _LUCENE_SPECIAL.sub(r'\\\1', text.lower()).strip()
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Fuses ranked result lists: each hit scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Returns the hits ordered by fused score, each with 'rrf_score' and its per-list ranks.
+    """
+    fused = {}
+    for list_index, results in enumerate(result_lists):
+        for rank, hit in enumerate(results, start=1):
+            entry = fused.get(hit["id"])
+            if entry is None:
+                entry = fused[hit["id"]] = {**hit, "rrf_score": 0.0, "ranks": {}}
+            entry["rrf_score"] += 1.0 / (k + rank)
+            entry["ranks"][list_index] = rank
+    return sorted(fused.values(), key=lambda hit: hit["rrf_score"], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves chunks from both the vector index and the full-text (BM25) index and fuses the
+    two rankings with reciprocal rank fusion.
+
+    Vector search finds paraphrases; full-text search finds exact terms (part numbers, error
+    codes, names) that embeddings tend to blur. The two searches run concurrently on the
+    vector store's connection pool. If the full-text index is missing, results are vector-only.
+    """
+
+    vector_store: Any # Neo4jVector, used for its query() method and shared driver
+    embeddings: Any # Embeddings used for the question
+    k: int = RAG_TOP_K
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    vector_index: str = VECTOR_INDEX_NAME
+    fulltext_index: str = FULLTEXT_INDEX_NAME
+    local_index: Any = None # Optional LocalIndexSync; vector search runs in process once it is ready
+
+    def vector_search(self, query: str) -> List[Dict[str, Any]]:
+        embedding = self.embeddings.embed_query(query)
+        if self.local_index is not None and self.local_index.ready:
+            hits = self.local_index.index.search(embedding, self.fetch_k)
+            if not hits:
+                return []
+            ids, scores = [chunk_id for chunk_id, _ in hits], [score for _, score in hits]
+            return self.vector_store.query(CHUNKS_BY_ID_QUERY, params={"ids": ids, "scores": scores})
+        return self.vector_store.query(VECTOR_SEARCH_QUERY, params={"index": self.vector_index, "k": self.fetch_k, "embedding": embedding})
+
+    def fulltext_search(self, query: str) -> List[Dict[str, Any]]:
+        lucene_query = escape_lucene(query)
+        if not lucene_query:
+            return []
+        try:
+            return self.vector_store.query(FULLTEXT_SEARCH_QUERY, params={"index": self.fulltext_index, "query": lucene_query, "k": self.fetch_k})
+        except Exception as e:
+            print(f"WARNING: Full-text search failed, using vector results only: {type(e).__name__}: {e}")
+            return []
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_future = _search_executor.submit(self.vector_search, query)
+        fulltext_future = _search_executor.submit(self.fulltext_search, query)
+        vector_hits, fulltext_hits = vector_future.result(), fulltext_future.result()
+
+        documents = []
+        for hit in reciprocal_rank_fusion([vector_hits, fulltext_hits], k=self.rrf_k)[:self.k]:
+            documents.append(Document(
+                page_content=hit["text"] or "",
+                metadata={
+                    "id": hit["id"],
+                    "doc_id": hit["doc_id"],
+                    "chunk_index": hit["chunk_index"],
+                    "rrf_score": hit["rrf_score"],
+                    "vector_rank": hit["ranks"].get(0),
+                    "fulltext_rank": hit["ranks"].get(1),
+                }
+            ))
+        return documents
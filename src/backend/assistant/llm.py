@@ -0,0 +1,39 @@
+from langchain_openai import ChatOpenAI
+from functools import lru_cache
+from typing import Optional
+import os
+
+# --- Configuration for Local LM Studio ---
+# IMPORTANT: Use host.docker.internal for backend running in Docker to reach host
+LM_STUDIO_API_BASE = os.getenv('LM_STUDIO_API_BASE', 'http://host.docker.internal:1234/v1')
+LM_STUDIO_API_KEY = os.getenv('LM_STUDIO_API_KEY', 'lm-studio') # Dummy key, LM Studio doesn't usually need one
+LLM_CLIENT_CACHE_SIZE = int(os.getenv('LLM_CLIENT_CACHE_SIZE', 16))
+
+# Defaults used by /api/chat when the request doesn't override them
+DEFAULT_TEMPERATURE = 0.1
+DEFAULT_MAX_TOKENS = 512
+# Context length the model is loaded with in LM Studio; prompts are packed to fit it
+LLM_CONTEXT_WINDOW = int(os.getenv('LLM_CONTEXT_WINDOW', 4096))
+
+
+@lru_cache(maxsize=LLM_CLIENT_CACHE_SIZE)
+def _cached_chat_llm(temperature: float, max_tokens: Optional[int], api_base: str) -> ChatOpenAI:
+    print(f"Creating LLM client at {api_base} (temperature={temperature}, max_tokens={max_tokens})")
+    return ChatOpenAI(
+        openai_api_key=LM_STUDIO_API_KEY,
+        openai_api_base=api_base,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+
+
+def get_chat_llm(temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                 api_base: str = LM_STUDIO_API_BASE) -> ChatOpenAI:
+    """
+    Returns a shared ChatOpenAI client for the given parameters.
+
+    Clients are cached by (temperature, max_tokens, api_base), so requests with the same settings
+    reuse one client (and its HTTP connection pool) instead of building a new one each time.
+    """
+    temperature = DEFAULT_TEMPERATURE if temperature is None else round(float(temperature), 2)
+    return _cached_chat_llm(temperature, max_tokens, api_base)
@@ -0,0 +1,465 @@
+import json
+import os
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.backend.database.redis_client import create_redis_connection, get_redis_connection
+
+try:
+    import hnswlib # Optional: graph index for sub-linear search; without it the quantized copy is scanned
+except ImportError:
+    hnswlib = None
+
+try:
+    import fcntl # POSIX only; elsewhere each process uses a directory named after its pid
+except ImportError:
+    fcntl = None
+
+# --- Local vector index configuration ---
+LOCAL_VECTOR_INDEX = os.getenv('LOCAL_VECTOR_INDEX', 'false').lower() in ('1', 'true', 'yes') # Also set on ingest workers
+LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', os.path.join('data', 'vector_index')) # One slot-<n> subdirectory per process
+LOCAL_INDEX_MAX_SLOTS = int(os.getenv('LOCAL_INDEX_MAX_SLOTS', 64))
+LOCAL_INDEX_QUANTIZATION = os.getenv('LOCAL_INDEX_QUANTIZATION', 'float16') # 'float16' or 'int8'
+LOCAL_INDEX_CANDIDATES = int(os.getenv('LOCAL_INDEX_CANDIDATES', 100)) # Approximate hits re-scored exactly
+LOCAL_INDEX_SCAN_BLOCK = 65536 # Rows scanned per block when there is no HNSW index
+LOCAL_INDEX_COMPACT_RATIO = 0.25 # Rewrite the files once this share of rows is deleted
+HNSW_M = int(os.getenv('HNSW_M', 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', 200))
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', 128))
+
+# Ingestion publishes chunk vectors here; the API process applies them to its index
+INDEX_CHANGES_STREAM = "vector_index:changes"
+INDEX_CHANGES_MAXLEN = int(os.getenv('INDEX_CHANGES_MAXLEN', 10000))
+INDEX_CHANGES_BLOCK_MS = 5000 # Longest wait for new changes; the sync connection's socket timeout is longer
+
+# Keyset pagination over chunks for the initial build (uses the chunk_id constraint's index)
+CHUNK_EMBEDDINGS_PAGE_QUERY = """
+MATCH (c:Chunk)
+WHERE c.id > $after AND c.embedding IS NOT NULL
+RETURN c.id AS id, c.embedding AS embedding
+ORDER BY c.id
+LIMIT $limit
+"""
+
+
+def publish_index_changes(upserts: Sequence[Tuple[str, Sequence[float]]] = (), deleted_ids: Sequence[str] = ()) -> None:
+    """Sends stored or deleted chunk vectors to the local index of every API process (blocking Redis call)."""
+    if not upserts and not deleted_ids:
+        return
+    fields = {"deleted": json.dumps(list(deleted_ids)), "ids": json.dumps([chunk_id for chunk_id, _ in upserts])}
+    if upserts:
+        vectors = np.asarray([vector for _, vector in upserts], dtype=np.float32)
+        fields["dim"] = vectors.shape[1]
+        fields["vectors"] = vectors.tobytes()
+    get_redis_connection(decode_responses=False).xadd(
+        INDEX_CHANGES_STREAM, fields, maxlen=INDEX_CHANGES_MAXLEN, approximate=True
+    )
+
+
+def _stream_id_tuple(stream_id: str) -> Tuple[int, int]:
+    ms, _, seq = stream_id.partition('-')
+    return int(ms), int(seq or 0)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _lock_dir(path: str):
+    """Takes an exclusive lock on the directory for the life of the process; returns the lock file or None if held."""
+    os.makedirs(path, exist_ok=True)
+    lock_file = open(os.path.join(path, '.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def claim_index_dir(base: str = LOCAL_INDEX_DIR):
+    """
+    Picks a directory under `base` that no other process is writing to; returns (path, lock file).
+
+    Every API process (and uvicorn worker) keeps its own index files. Slots are reused after a
+    restart, so a process usually finds a recent index to load instead of rebuilding.
+    """
+    if fcntl is None:
+        return os.path.join(base, f"pid-{os.getpid()}"), None
+    for slot in range(LOCAL_INDEX_MAX_SLOTS):
+        path = os.path.join(base, f"slot-{slot}")
+        lock_file = _lock_dir(path)
+        if lock_file is not None:
+            return path, lock_file
+    raise RuntimeError(f"All {LOCAL_INDEX_MAX_SLOTS} local vector index slots under {base} are in use")
+
+
+class LocalVectorIndex:
+    """
+    In-process approximate nearest-neighbour index over chunk embeddings.
+
+    Unit-normalized vectors are kept on disk twice: a full-precision float32 copy and a float16 or
+    int8 (per-row scale) quantized copy, both append-only and memory-mapped. Search finds candidates
+    with HNSW (hnswlib, built in memory) or by scanning the quantized copy, then re-scores them
+    exactly against the float32 rows. Updated or deleted chunks leave tombstoned rows behind until
+    the files are compacted. meta.json is written last and is the commit point: rows, ids and
+    tombstones past its counts are ignored on load, and an index whose build from Neo4j never
+    finished (`complete` false) is not loaded at all. The directory is locked, so only one process
+    ever writes to it; without a path, a free slot under LOCAL_INDEX_DIR is claimed.
+    """
+
+    def __init__(self, path: Optional[str] = None, quantization: str = LOCAL_INDEX_QUANTIZATION):
+        if quantization not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported LOCAL_INDEX_QUANTIZATION '{quantization}' (use float16 or int8)")
+        if path is None:
+            path, self._dir_lock = claim_index_dir()
+        else:
+            self._dir_lock = _lock_dir(path) if fcntl is not None else None
+            if fcntl is not None and self._dir_lock is None:
+                raise RuntimeError(f"Local vector index at {path} is in use by another process")
+        self.path = path
+        self.quantization = quantization
+        self.dim = None
+        self.stream_id = "0-0" # Last change from INDEX_CHANGES_STREAM included in the files
+        self.complete = True # False while a rebuild from Neo4j is loading pages
+        self._ids = [] # row -> chunk id (None once deleted)
+        self._rows = {} # chunk id -> row
+        self._tombstones = 0
+        self._deleted = np.zeros(0, dtype=bool) # row -> tombstoned, for masking scans
+        self._full = None
+        self._quantized = None
+        self._scales = None
+        self._hnsw = None
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def close(self) -> None:
+        """Releases the directory lock so another LocalVectorIndex can use the files."""
+        with self._lock:
+            if self._dir_lock is not None:
+                self._dir_lock.close()
+                self._dir_lock = None
+
+    # --- Files ---
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def _quantized_dtype(self):
+        return np.float16 if self.quantization == 'float16' else np.int8
+
+    def _map(self, name: str, dtype, width: Optional[int]):
+        rows = len(self._ids)
+        if not rows:
+            return None
+        shape = (rows, width) if width else (rows,)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=shape)
+
+    def _remap(self) -> None:
+        self._full = self._map('vectors.f32', np.float32, self.dim)
+        self._quantized = self._map('vectors.q', self._quantized_dtype, self.dim)
+        self._scales = self._map('scales.f32', np.float32, None) if self.quantization == 'int8' else None
+
+    def load(self) -> bool:
+        """Opens the files written by a previous run; returns False if there is no usable index."""
+        try:
+            with open(self._file('meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not meta.get("complete"):
+            print(f"WARNING: Local vector index at {self.path} was not fully built, rebuilding")
+            return False
+        if meta.get("quantization") != self.quantization:
+            print(f"WARNING: Local vector index at {self.path} uses {meta.get('quantization')}, rebuilding as {self.quantization}")
+            return False
+        with self._lock:
+            self.dim, self.stream_id = meta["dim"], meta["stream_id"]
+            self._ids, tombstones = [], []
+            if meta["rows"]:
+                with open(self._file('ids.txt'), encoding='utf-8') as f:
+                    self._ids = [line.rstrip('\n') for _, line in zip(range(meta["rows"]), f)]
+            if meta["tombstones"]:
+                with open(self._file('tombstones.txt')) as f:
+                    tombstones = [int(line) for _, line in zip(range(meta["tombstones"]), f)]
+            self._deleted = np.zeros(len(self._ids), dtype=bool)
+            for row in tombstones:
+                self._ids[row] = None
+                self._deleted[row] = True
+            self._tombstones = len(tombstones)
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids) if chunk_id is not None}
+            self._truncate_files()
+            self._remap()
+        print(f"Local vector index loaded: {len(self._rows)} chunks, dim {self.dim}, {self.quantization}")
+        return True
+
+    def reset(self) -> None:
+        with self._lock:
+            self.dim, self.stream_id, self.complete = None, "0-0", False
+            self._ids, self._rows, self._tombstones = [], {}, 0
+            self._deleted = np.zeros(0, dtype=bool)
+            self._full = self._quantized = self._scales = self._hnsw = None
+            for name in ('vectors.f32', 'vectors.q', 'scales.f32', 'ids.txt', 'tombstones.txt', 'meta.json'):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+
+    def _commit(self) -> None:
+        meta = {"dim": self.dim, "rows": len(self._ids), "tombstones": self._tombstones,
+                "quantization": self.quantization, "stream_id": self.stream_id, "complete": self.complete}
+        tmp_path = self._file('meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file('meta.json'))
+
+    def _truncate_files(self) -> None:
+        """Drops bytes and lines past the committed counts (left by an interrupted write)."""
+        rows = len(self._ids)
+        row_bytes = {}
+        if self.dim is not None:
+            row_bytes = {'vectors.f32': 4 * self.dim, 'vectors.q': np.dtype(self._quantized_dtype).itemsize * self.dim, 'scales.f32': 4}
+        for name, width in row_bytes.items():
+            if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > rows * width:
+                with open(self._file(name), 'r+b') as f:
+                    f.truncate(rows * width)
+        for name, count in (('ids.txt', rows), ('tombstones.txt', self._tombstones)):
+            if os.path.exists(self._file(name)):
+                with open(self._file(name), encoding='utf-8') as f:
+                    lines = [line for _, line in zip(range(count), f)]
+                with open(self._file(name), 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+
+    # --- Updates ---
+    def _quantize(self, vectors: np.ndarray):
+        if self.quantization == 'float16':
+            return vectors.astype(np.float16), None
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def apply(self, upserts: Sequence[Tuple[str, Sequence[float]]] = (), deleted_ids: Iterable[str] = (),
+              stream_id: Optional[str] = None) -> None:
+        """Adds or replaces chunk vectors and removes deleted chunks, then commits to disk."""
+        with self._lock:
+            new_tombstones = [self._rows.pop(chunk_id) for chunk_id in deleted_ids if chunk_id in self._rows]
+            if upserts:
+                ids = [chunk_id for chunk_id, _ in upserts]
+                vectors = _normalize(np.asarray([vector for _, vector in upserts], dtype=np.float32))
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match local index dimension {self.dim}")
+                new_tombstones.extend(self._rows.pop(chunk_id) for chunk_id in ids if chunk_id in self._rows)
+                quantized, scales = self._quantize(vectors)
+                with open(self._file('vectors.f32'), 'ab') as f:
+                    f.write(vectors.tobytes())
+                with open(self._file('vectors.q'), 'ab') as f:
+                    f.write(quantized.tobytes())
+                if scales is not None:
+                    with open(self._file('scales.f32'), 'ab') as f:
+                        f.write(scales.tobytes())
+                with open(self._file('ids.txt'), 'a', encoding='utf-8') as f:
+                    f.writelines(f"{chunk_id}\n" for chunk_id in ids)
+                first_row = len(self._ids)
+                for offset, chunk_id in enumerate(ids):
+                    self._rows[chunk_id] = first_row + offset
+                self._ids.extend(ids)
+                self._deleted = np.concatenate([self._deleted, np.zeros(len(ids), dtype=bool)])
+                if self._hnsw is not None:
+                    self._hnsw.resize_index(len(self._ids))
+                    self._hnsw.add_items(vectors, np.arange(first_row, len(self._ids)))
+            if new_tombstones:
+                with open(self._file('tombstones.txt'), 'a') as f:
+                    f.writelines(f"{row}\n" for row in new_tombstones)
+                self._deleted[new_tombstones] = True
+                for row in new_tombstones:
+                    self._ids[row] = None
+                    if self._hnsw is not None:
+                        self._hnsw.mark_deleted(row)
+                self._tombstones += len(new_tombstones)
+            if stream_id is not None:
+                self.stream_id = stream_id
+            self._commit()
+            self._remap()
+            if self._ids and self._tombstones > LOCAL_INDEX_COMPACT_RATIO * len(self._ids):
+                self.compact()
+
+    def compact(self) -> None:
+        """Rewrites the files without deleted rows."""
+        with self._lock:
+            live = np.flatnonzero(~self._deleted)
+            print(f"Compacting local vector index: {len(live)} live of {len(self._ids)} rows")
+            ids = [self._ids[row] for row in live]
+            vectors = np.array(self._full[live]) if len(live) else np.zeros((0, self.dim or 0), dtype=np.float32)
+            stream_id, complete, had_hnsw = self.stream_id, self.complete, self._hnsw is not None
+            self.reset()
+            self.complete = complete
+            if ids:
+                self.apply(list(zip(ids, vectors)), stream_id=stream_id)
+            else:
+                self.stream_id = stream_id
+                self._commit()
+            if had_hnsw:
+                # Searches scan the quantized copy until the new graph is ready
+                threading.Thread(target=self.build_hnsw, name="local-index-hnsw", daemon=True).start()
+
+    def build_hnsw(self) -> None:
+        """Builds the HNSW graph over the stored vectors (no-op without hnswlib)."""
+        if hnswlib is None or self._full is None:
+            return
+        with self._lock:
+            full, rows = self._full, len(self._ids)
+            tombstones = np.flatnonzero(self._deleted)
+        index = hnswlib.Index(space='ip', dim=self.dim) # Vectors are normalized, so inner product is cosine
+        index.init_index(max_elements=max(rows, 1), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        index.add_items(np.asarray(full), np.arange(rows))
+        for row in tombstones:
+            index.mark_deleted(row)
+        built_tombstones = set(tombstones.tolist())
+        index.set_ef(HNSW_EF_SEARCH)
+        with self._lock:
+            # Rows added while the graph was being built are added now
+            if len(self._ids) > rows:
+                index.resize_index(len(self._ids))
+                index.add_items(np.asarray(self._full[rows:]), np.arange(rows, len(self._ids)))
+            for row in np.flatnonzero(self._deleted[:rows]):
+                if row not in built_tombstones:
+                    index.mark_deleted(row)
+            self._hnsw = index
+        print(f"Local vector index: HNSW graph built over {len(self._rows)} chunks")
+
+    # --- Search ---
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    def _scan_candidates(self, query: np.ndarray, count: int) -> np.ndarray:
+        """Top rows by approximate score from a block-wise scan of the quantized copy."""
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        deleted = self._deleted if self._tombstones else None
+        for start in range(0, len(self._ids), LOCAL_INDEX_SCAN_BLOCK):
+            block = np.asarray(self._quantized[start:start + LOCAL_INDEX_SCAN_BLOCK], dtype=np.float32)
+            scores = block @ query
+            if self._scales is not None:
+                scores *= self._scales[start:start + LOCAL_INDEX_SCAN_BLOCK]
+            if deleted is not None:
+                scores[deleted[start:start + LOCAL_INDEX_SCAN_BLOCK]] = -np.inf
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_rows) > count:
+                keep = np.argpartition(-best_scores, count)[:count]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows[np.isfinite(best_scores)]
+
+    def search(self, embedding: Sequence[float], k: int, candidates: int = LOCAL_INDEX_CANDIDATES) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (chunk id, score) pairs, best first. Scores use the same scale as the
+        Neo4j cosine vector index: (1 + cosine) / 2.
+        """
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            if not self._rows:
+                return []
+            count = min(max(candidates, k), len(self._rows))
+            if self._hnsw is not None:
+                labels, _ = self._hnsw.knn_query(query, k=count)
+                rows = labels[0].astype(np.int64)
+            else:
+                rows = self._scan_candidates(query, count)
+            rows = np.sort(rows) # Sequential reads from the memmap
+            exact = np.asarray(self._full[rows]) @ query
+            order = np.argsort(-exact)[:k]
+            return [(self._ids[rows[i]], float((1.0 + exact[i]) / 2.0)) for i in order]
+
+
+class LocalIndexSync:
+    """
+    Keeps a LocalVectorIndex in step with Neo4j from a background thread.
+
+    On start the index is loaded from disk, or rebuilt from Neo4j if it is missing or has fallen
+    behind the trimmed change stream. After that, chunk vectors published by ingestion
+    (publish_index_changes) are applied as they arrive. `ready` is False until the index can
+    answer queries; until then callers should search Neo4j.
+    """
+
+    def __init__(self, index: LocalVectorIndex, neo4j_client, page_size: int = 5000):
+        self.index = index
+        self.neo4j_client = neo4j_client
+        self.page_size = page_size
+        self.ready = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="local-index-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _missed_changes(self, redis_conn) -> bool:
+        """True if changes newer than the index were trimmed from the stream before being applied"""
+        try:
+            info = redis_conn.xinfo_stream(INDEX_CHANGES_STREAM)
+        except Exception:
+            return False # No stream yet: nothing was published
+        trimmed = info.get("max-deleted-entry-id") # Redis 7+
+        if trimmed is None:
+            first_entry = info.get("first-entry")
+            return bool(first_entry) and _stream_id_tuple(first_entry[0].decode()) > _stream_id_tuple(self.index.stream_id)
+        return _stream_id_tuple(trimmed.decode()) > _stream_id_tuple(self.index.stream_id)
+
+    def rebuild(self, redis_conn) -> bool:
+        """
+        Loads every chunk embedding from Neo4j (keyset pagination) into a fresh index. Returns
+        False if stopped first; the partial index stays marked incomplete and is rebuilt next start.
+        """
+        print("Building local vector index from Neo4j...")
+        latest = redis_conn.xrevrange(INDEX_CHANGES_STREAM, count=1)
+        # Changes published during the scan are replayed afterwards (upserts are idempotent)
+        stream_id = latest[0][0].decode() if latest else "0-0"
+        self.index.reset()
+        after, loaded = "", 0
+        while not self._stop.is_set():
+            records = self.neo4j_client.run_query(CHUNK_EMBEDDINGS_PAGE_QUERY, {"after": after, "limit": self.page_size})
+            if not records:
+                break
+            self.index.apply([(record["id"], record["embedding"]) for record in records])
+            after = records[-1]["id"]
+            loaded += len(records)
+        if self._stop.is_set():
+            print(f"Local vector index build stopped after {loaded} chunks")
+            return False
+        self.index.complete = True
+        self.index.apply(stream_id=stream_id)
+        print(f"Local vector index built: {loaded} chunks")
+        return True
+
+    def _apply_entries(self, entries) -> None:
+        for entry_id, fields in entries:
+            ids = json.loads(fields[b"ids"])
+            upserts = []
+            if ids:
+                vectors = np.frombuffer(fields[b"vectors"], dtype=np.float32).reshape(len(ids), int(fields[b"dim"]))
+                upserts = list(zip(ids, vectors))
+            self.index.apply(upserts, json.loads(fields[b"deleted"]), stream_id=entry_id.decode())
+
+    def _run(self) -> None:
+        # Own connection: the shared one's 5s socket timeout would cut the blocking XREAD short
+        redis_conn = create_redis_connection(decode_responses=False, socket_timeout=INDEX_CHANGES_BLOCK_MS / 1000 + 10)
+        while not self._stop.is_set():
+            try:
+                if not self.ready:
+                    if not self.index.load() or self._missed_changes(redis_conn):
+                        if not self.rebuild(redis_conn):
+                            break
+                    self.ready = True
+                    threading.Thread(target=self.index.build_hnsw, name="local-index-hnsw", daemon=True).start()
+                response = redis_conn.xread({INDEX_CHANGES_STREAM: self.index.stream_id}, count=100, block=INDEX_CHANGES_BLOCK_MS)
+                for _, entries in response or []:
+                    self._apply_entries(entries)
+            except Exception as e:
+                print(f"ERROR in local vector index sync: {type(e).__name__}: {e}")
+                self._stop.wait(5)
@@ -0,0 +1,186 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.backend.document_processing.embedding_cache import EmbeddingCache, chunk_hash
+
+# --- Query embedding cache configuration ---
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 2048))
+QUERY_EMBEDDING_CACHE_REDIS = os.getenv('QUERY_EMBEDDING_CACHE_REDIS', 'false').lower() in ('1', 'true', 'yes')
+QUERY_BATCH_WINDOW_MS = float(os.getenv('QUERY_BATCH_WINDOW_MS', 5)) # How long to wait for more questions; 0 disables batching
+QUERY_BATCH_MAX_SIZE = int(os.getenv('QUERY_BATCH_MAX_SIZE', 32))
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent embed_query calls into batched embed_documents calls.
+
+    Callers block on a Future while a single background thread collects the questions that
+    arrive within `window_ms` of the first one (up to `max_batch_size`), embeds them in one
+    call and hands each caller its vector. Sentence-transformer models are much faster on a
+    batch than on the same texts one at a time, so this pays off when chat requests overlap.
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = QUERY_BATCH_WINDOW_MS,
+                 max_batch_size: int = QUERY_BATCH_MAX_SIZE):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_thread(self) -> None:
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def embed(self, text: str) -> List[float]:
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Identical questions in the same window are embedded once
+            unique_texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = self.embeddings.embed_documents(unique_texts)
+                by_text = dict(zip(unique_texts, vectors))
+                for text, future in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                print(f"ERROR embedding query batch of {len(unique_texts)}: {type(e).__name__}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.texts += len(unique_texts)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with a bounded in-memory LRU of question text -> vector.
+
+    Repeated questions (and retries from the frontend) skip the CPU model entirely.
+    With `use_redis`, misses also consult a shared Redis tier so the cache survives
+    restarts and is shared between backend processes. Document embedding is not cached.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 use_redis: bool = QUERY_EMBEDDING_CACHE_REDIS, batch_window_ms: float = QUERY_BATCH_WINDOW_MS):
+        self.embeddings = embeddings
+        # Cache misses from concurrent requests are embedded together
+        self.batcher = QueryEmbeddingBatcher(embeddings, window_ms=batch_window_ms) if batch_window_ms > 0 else None
+        self.model_name = model_name
+        self.max_size = max_size
+        self.redis_cache = EmbeddingCache(f"query:{model_name}") if use_redis else None
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _remember(self, text: str, vector: List[float]) -> None:
+        with self._lock:
+            self._lru[text] = vector
+            self._lru.move_to_end(text)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def _lookup(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._lru.get(text)
+            if vector is not None:
+                self._lru.move_to_end(text)
+                self.hits += 1
+            return vector
+
+    def _redis_lookup(self, text: str) -> Optional[List[float]]:
+        if self.redis_cache is None:
+            return None
+        try:
+            return self.redis_cache.get_many([self._redis_key(text)])[0]
+        except Exception as e:
+            print(f"WARNING: Query embedding Redis lookup failed: {type(e).__name__}: {e}")
+            return None
+
+    def _redis_store(self, text: str, vector: List[float]) -> None:
+        if self.redis_cache is None:
+            return
+        try:
+            self.redis_cache.set_many([self._redis_key(text)], [vector])
+        except Exception as e:
+            print(f"WARNING: Failed to store query embedding in Redis: {type(e).__name__}: {e}")
+
+    @staticmethod
+    def _redis_key(text: str) -> str:
+        return chunk_hash(text)
+
+    def _compute(self, text: str) -> List[float]:
+        if self.batcher is not None:
+            return self.batcher.embed(text)
+        return self.embeddings.embed_query(text)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._lookup(text)
+        if vector is not None:
+            return vector
+
+        vector = self._redis_lookup(text)
+        if vector is not None:
+            with self._lock:
+                self.redis_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            vector = self._compute(text)
+            self._redis_store(text, vector)
+        self._remember(text, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+                "size": len(self._lru),
+                "batching": self.batcher.stats() if self.batcher else None,
+            }
@@ -1,22 +1,36 @@
-from langchain_openai import ChatOpenAI # Changed from OpenAI
 from langchain_community.embeddings import HuggingFaceEmbeddings # Use local embeddings
 from langchain_community.vectorstores import Neo4jVector
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import Neo4jVector
+from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
-from langchain.chains import RetrievalQA
 from langchain_core.language_models.chat_models import BaseChatModel # Import base class
 import os
 from typing import Optional
+from src.backend.database.neo4j_client import adopt_shared_driver, Neo4jClient
+from src.backend.assistant.llm import get_chat_llm
+from src.backend.assistant.query_embeddings import CachedQueryEmbeddings
+from src.backend.assistant.hybrid_retriever import HybridRetriever, RAG_TOP_K, HYBRID_FETCH_K, VECTOR_RETRIEVAL_QUERY
+from src.backend.assistant.local_index import LocalVectorIndex, LocalIndexSync, LOCAL_VECTOR_INDEX
+from src.backend.assistant.context_builder import build_context, context_token_budget
+from src.backend.assistant.reranker import CrossEncoderReranker, RerankingRetriever, RERANK_CANDIDATES
 
 load_dotenv()
 
+# Fuse vector search with the chunk_fulltext (BM25) index; set to false for vector-only retrieval
+RAG_HYBRID_SEARCH = os.getenv('RAG_HYBRID_SEARCH', 'true').lower() in ('1', 'true', 'yes')
+# Rerank RERANK_CANDIDATES retrieved chunks with a cross-encoder and keep the best RAG_TOP_K
+RAG_RERANK = os.getenv('RAG_RERANK', 'true').lower() in ('1', 'true', 'yes')
+# Default LLM endpoint when RAGAssistant is used outside Docker (e.g. test/test_rag.py); /api/chat passes its own settings
+RAG_DEFAULT_LLM_API_BASE = os.getenv('LM_STUDIO_API_BASE', 'http://localhost:1234/v1')
+
+# Same prompt RetrievalQA's "stuff" chain uses for chat models
+QA_SYSTEM_PROMPT = """Use the following pieces of context to answer the user's question.
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+----------------
+{context}"""
+
+
 class RAGAssistant:
     def __init__(self, llm: Optional[BaseChatModel] = None):
-        # --- Configuration for Local LM Studio ---
-        lm_studio_api_base = "http://localhost:1234/v1" # Default LM Studio endpoint
-        lm_studio_api_key = "lm-studio" # Dummy key, LM Studio doesn't usually need one
-
         # --- Configuration for Local Embeddings ---
         # Choose a model from Hugging Face suitable for embeddings
         # Make sure you have sentence-transformers installed: pip install sentence-transformers
@@ -29,9 +43,13 @@ class RAGAssistant:
 
         # Initialize embeddings using HuggingFaceEmbeddings
         print(f"Initializing local embeddings model: {embedding_model_name}")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=embedding_model_name,
-            model_kwargs={'device': 'cpu'} # Or 'cuda' if you have GPU support and PyTorch installed
+        # Questions are embedded through an LRU so repeated questions skip the CPU model
+        self.embeddings = CachedQueryEmbeddings(
+            HuggingFaceEmbeddings(
+                model_name=embedding_model_name,
+                model_kwargs={'device': 'cpu'} # Or 'cuda' if you have GPU support and PyTorch installed
+            ),
+            model_name=embedding_model_name
         )
         print("Embeddings model initialized.")
 
@@ -45,58 +63,85 @@ class RAGAssistant:
             index_name="chunk_embeddings", # CHANGE index name
             node_label="Chunk",            # CHANGE node label
             text_node_properties=["content"],
-            embedding_node_property="embedding"
+            embedding_node_property="embedding",
+            retrieval_query=VECTOR_RETRIEVAL_QUERY # Chunk ids and positions for reranking and neighbour merging
         )
+        # Share the process-wide connection pool instead of a private driver
+        adopt_shared_driver(self.vector_store, neo4j_uri, neo4j_user, neo4j_password)
         print("Neo4j vector store connected.")
 
-        # Initialize LLM using ChatOpenAI pointed to LM Studio
-        print(f"Initializing LLM via LM Studio at: {lm_studio_api_base}")
-        self.llm = ChatOpenAI(
-            openai_api_key=lm_studio_api_key,
-            openai_api_base=lm_studio_api_base,
-            # model_name is often ignored by LM Studio but can be kept
-            # model_name="PrunaAI/mistralai-Mistral-7B-Instruct-v0.2-GGUF-smashed",
-            temperature=0
-        )
-        print("LLM initialized.")
+        # Optional in-process ANN index, kept up to date from the ingest change stream
+        self.local_index_sync = None
+        if LOCAL_VECTOR_INDEX:
+            self.local_index_sync = LocalIndexSync(LocalVectorIndex(), Neo4jClient(neo4j_uri, neo4j_user, neo4j_password))
+            self.local_index_sync.start()
 
         if llm:
             self.llm = llm
             print("RAG Assistant initialized with provided LLM.")
         else:
-            # Initialize default LLM using ChatOpenAI pointed to LM Studio
-            print(f"Initializing default LLM via LM Studio at: {lm_studio_api_base}")
-            self.llm = ChatOpenAI(
-                openai_api_key=lm_studio_api_key,
-                openai_api_base=lm_studio_api_base,
-                temperature=0 # Default temperature
-            )
+            # Default LLM (LM Studio, deterministic) used when a query doesn't pass parameters
+            self.llm = get_chat_llm(temperature=0, api_base=RAG_DEFAULT_LLM_API_BASE)
             print("Default LLM initialized.")
 
-        # Initialize retrieval chain using self.llm
+        # Build the retriever and prompt once; the LLM is chosen per query
         self._create_qa_chain()
         print("RAG Assistant ready.")
 
     def _create_qa_chain(self):
-        """Helper to create/recreate the QA chain."""
-        self.qa = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff", # Or "map_reduce", etc.
-            retriever=self.vector_store.as_retriever(),
-            return_source_documents=True # Ensure sources are returned
-        )
-        print("RetrievalQA chain created/updated.")
+        """Helper to create the retrieval and prompt parts of the QA chain (once, at startup)."""
+        # Over-fetch when a reranker picks the final chunks
+        candidates = max(RERANK_CANDIDATES, RAG_TOP_K) if RAG_RERANK else RAG_TOP_K
+        if RAG_HYBRID_SEARCH:
+            self.retriever = HybridRetriever(vector_store=self.vector_store, embeddings=self.embeddings,
+                                             k=candidates, fetch_k=max(HYBRID_FETCH_K, candidates),
+                                             local_index=self.local_index_sync)
+        else:
+            self.retriever = self.vector_store.as_retriever(search_kwargs={"k": candidates})
+        self.reranker = None
+        if RAG_RERANK:
+            self.reranker = CrossEncoderReranker()
+            self.retriever = RerankingRetriever(base_retriever=self.retriever, reranker=self.reranker, k=RAG_TOP_K)
+        self.qa_prompt = ChatPromptTemplate.from_messages([
+            ("system", QA_SYSTEM_PROMPT),
+            ("human", "{question}"),
+        ])
+        print("RAG retriever and prompt created.")
 
     def update_llm(self, llm: BaseChatModel):
-        """Updates the LLM instance and recreates the chain."""
+        """Replaces the default LLM. Per-request settings should be passed to query() instead."""
         self.llm = llm
-        self._create_qa_chain()
-        print("RAG Assistant LLM updated.")
+        print("RAG Assistant default LLM updated.")
+
+    def _get_llm(self, temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> BaseChatModel:
+        if temperature is None and max_tokens is None:
+            return self.llm
+        return get_chat_llm(temperature, max_tokens)
+
+    def prepare(self, question, temperature: Optional[float] = None, max_tokens: Optional[int] = None):
+        """
+        Retrieves the context for a question and builds the answer prompt.
+
+        Returns (llm, messages, source_documents); the caller invokes or streams the LLM.
+        """
+        llm = self._get_llm(temperature, max_tokens)
+        source_documents = self.retriever.invoke(question)
+        # Merge neighbouring chunks and cap the context so the prompt fits the model's window
+        budget = context_token_budget(QA_SYSTEM_PROMPT + question, max_tokens)
+        context = build_context(source_documents, budget)
+        messages = self.qa_prompt.format_messages(context=context, question=question)
+        return llm, messages, source_documents
+
+    def query(self, question, temperature: Optional[float] = None, max_tokens: Optional[int] = None):
+        """
+        Query the RAG assistant with a question.
 
-    def query(self, question):
-        """Query the RAG assistant with a question"""
+        temperature/max_tokens apply to this call only; the shared chain is not modified,
+        so concurrent queries with different settings are safe.
+        """
         print(f"RAG Query: {question}")
-        # The chain now uses the potentially updated self.llm
-        result = self.qa.invoke({"query": question})
+        llm, messages, source_documents = self.prepare(question, temperature, max_tokens)
+        answer = llm.invoke(messages).content
+        result = {"query": question, "result": answer, "source_documents": source_documents}
         print(f"RAG Result: {result}")
-        return result
\ No newline at end of file
+        return result
@@ -0,0 +1,144 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.backend.document_processing.embedding_cache import chunk_hash
+from src.backend.document_processing.embedding_client import estimate_tokens
+
+# --- Reranking configuration ---
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2') # Small enough for CPU
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', 20)) # Chunks fetched from the retriever before reranking
+RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', 16)) # (question, chunk) pairs scored per forward pass
+RERANK_MAX_LENGTH = int(os.getenv('RERANK_MAX_LENGTH', 512)) # Model input limit in tokens
+RERANK_MIN_SCORE = os.getenv('RERANK_MIN_SCORE') # Optional: drop chunks scoring below this (raw model logit)
+RERANK_MAX_CONTEXT_TOKENS = int(os.getenv('RERANK_MAX_CONTEXT_TOKENS', 0)) # Optional token budget for kept chunks; 0 disables
+RERANK_SCORE_CACHE_SIZE = int(os.getenv('RERANK_SCORE_CACHE_SIZE', 8192))
+
+
+def document_key(doc: Document) -> str:
+    """Chunk id from the retriever metadata, or a content hash when the store didn't return one"""
+    return doc.metadata.get("id") or chunk_hash(doc.page_content)
+
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk) pairs with a sentence-transformers cross-encoder on the CPU.
+
+    Pairs are scored in batches of `batch_size`, and scores are kept in a bounded LRU keyed by
+    (question, chunk id), so repeated questions only score chunks they haven't seen. The model
+    is loaded on first use; if it can't be loaded, rank() keeps the retriever's order.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 max_length: int = RERANK_MAX_LENGTH, cache_size: int = RERANK_SCORE_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self._model = None
+        self._model_failed = False
+        self._model_lock = threading.Lock()
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None and not self._model_failed:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    print(f"DEBUG: Loading cross-encoder '{self.model_name}' for reranking...")
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                except Exception as e:
+                    print(f"WARNING: Could not load cross-encoder '{self.model_name}', reranking disabled: {type(e).__name__}: {e}")
+                    self._model_failed = True
+            return self._model
+
+    def score(self, query: str, documents: Sequence[Document]) -> Optional[List[float]]:
+        """Returns one relevance score per document, or None if the model is unavailable"""
+        scores = [None] * len(documents)
+        missing = []
+        with self._lock:
+            for i, doc in enumerate(documents):
+                key = (query, document_key(doc))
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[i] = self._scores[key]
+                    self.hits += 1
+                else:
+                    missing.append(i)
+            self.misses += len(missing)
+
+        if missing:
+            model = self._get_model()
+            if model is None:
+                return None
+            pairs = [(query, documents[i].page_content) for i in missing]
+            predicted = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            with self._lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self._scores[(query, document_key(documents[i]))] = scores[i]
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def rank(self, query: str, documents: Sequence[Document], top_k: int, min_score: Optional[float] = None,
+             max_tokens: int = 0) -> List[Document]:
+        """
+        Keeps the best `top_k` documents by cross-encoder score, optionally dropping those under
+        `min_score` and stopping once `max_tokens` (estimated) of chunk text is reached.
+        The best document is always kept so the prompt never ends up without context.
+        """
+        if not documents:
+            return []
+        scores = self.score(query, documents)
+        if scores is None:
+            return list(documents[:top_k])
+
+        ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)
+        kept = []
+        used_tokens = 0
+        for doc, score in ranked[:top_k]:
+            if kept and min_score is not None and score < min_score:
+                break
+            tokens = estimate_tokens(doc.page_content)
+            if kept and max_tokens and used_tokens + tokens > max_tokens:
+                break
+            used_tokens += tokens
+            kept.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": score}))
+        return kept
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "cached_scores": len(self._scores),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Over-fetches candidates from `base_retriever` (configure it to return RERANK_CANDIDATES
+    chunks) and keeps the top `k` by cross-encoder score. Fewer, better chunks in the prompt
+    mean less prefill work for the local LLM.
+    """
+
+    base_retriever: BaseRetriever
+    reranker: Any # CrossEncoderReranker
+    k: int
+    min_score: Optional[float] = float(RERANK_MIN_SCORE) if RERANK_MIN_SCORE else None
+    max_tokens: int = RERANK_MAX_CONTEXT_TOKENS
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        candidates = self.base_retriever.invoke(query)
+        return self.reranker.rank(query, candidates, self.k, min_score=self.min_score, max_tokens=self.max_tokens)
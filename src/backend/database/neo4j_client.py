@@ -1,17 +1,115 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase, Driver
+import asyncio
+import os
+import threading
+
+# --- Shared driver pool configuration ---
+NEO4J_MAX_POOL_SIZE = int(os.getenv('NEO4J_MAX_POOL_SIZE', 50))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv('NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 30)) # Seconds to wait for a free connection
+NEO4J_LIVENESS_CHECK_TIMEOUT = float(os.getenv('NEO4J_LIVENESS_CHECK_TIMEOUT', 60)) # Ping connections idle longer than this before reuse
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', 3600))
+
+# One driver (and connection pool) per (uri, user) for the whole process
+_drivers = {}
+_async_drivers = {} # (uri, user, id(loop)) -> (loop, driver); holding the loop keeps its id from being reused
+_drivers_lock = threading.Lock()
+
+
+def _driver_config():
+    return {
+        'max_connection_pool_size': NEO4J_MAX_POOL_SIZE,
+        'connection_acquisition_timeout': NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+        'liveness_check_timeout': NEO4J_LIVENESS_CHECK_TIMEOUT,
+        'max_connection_lifetime': NEO4J_MAX_CONNECTION_LIFETIME,
+    }
+
+
+def get_driver(uri, user, password):
+    """Return the process-wide driver for (uri, user), creating it on first use."""
+    key = (uri, user)
+    with _drivers_lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(uri, auth=(user, password), **_driver_config())
+            _drivers[key] = driver
+            print(f"Created shared Neo4j driver for {uri} (pool size {NEO4J_MAX_POOL_SIZE})")
+        return driver
+
+
+def get_async_driver(uri, user, password):
+    """Return the shared async driver for (uri, user) bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (uri, user, id(loop)) # Async drivers can't be shared across event loops
+    with _drivers_lock:
+        # Loops that ended without close_async_drivers() can't close their drivers any more
+        for closed_key in [other for other, (other_loop, _) in _async_drivers.items() if other_loop.is_closed()]:
+            del _async_drivers[closed_key]
+            print("WARNING: Dropped async Neo4j driver of a closed event loop; call close_async_drivers() before the loop ends")
+        entry = _async_drivers.get(key)
+        if entry is None:
+            entry = (loop, AsyncGraphDatabase.driver(uri, auth=(user, password), **_driver_config()))
+            _async_drivers[key] = entry
+            print(f"Created shared async Neo4j driver for {uri} (pool size {NEO4J_MAX_POOL_SIZE})")
+        return entry[1]
+
+
+def adopt_shared_driver(store, uri, user, password):
+    """
+    Point a LangChain Neo4j object (Neo4jVector, Neo4jGraph) at the shared driver.
+
+    Those classes open a private driver in their constructor and have no parameter to pass one
+    in, so the private `_driver` attribute is replaced. If a LangChain version no longer has it,
+    the object keeps its own connection pool and a warning is printed.
+    """
+    private = getattr(store, '_driver', None)
+    if not isinstance(private, Driver):
+        print(f"WARNING: {type(store).__name__} has no replaceable driver; it keeps its own Neo4j connection pool")
+        return store
+    shared = get_driver(uri, user, password)
+    if private is not shared:
+        store._driver = shared
+        private.close()
+    return store
+
+
+def close_drivers():
+    """Close every shared sync driver (call on shutdown)."""
+    with _drivers_lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+    for driver in drivers:
+        driver.close()
+
+
+async def close_async_drivers():
+    """Close the shared async drivers bound to the running event loop (call on shutdown)."""
+    loop = asyncio.get_running_loop()
+    with _drivers_lock:
+        keys = [key for key, (driver_loop, _) in _async_drivers.items() if driver_loop is loop]
+        drivers = [_async_drivers.pop(key)[1] for key in keys]
+    for driver in drivers:
+        await driver.close()
+
 
 class Neo4jClient:
     def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        # Uses the shared driver; constructing a client no longer opens new connections
+        self.driver = get_driver(uri, user, password)
 
     def close(self):
-        self.driver.close()
+        # The driver is shared by the whole process; it is closed by close_drivers() on shutdown
+        pass
 
     def run_query(self, query, parameters=None):
         with self.driver.session() as session:
             result = session.run(query, parameters or {})
             return [record for record in result]
 
+    def explain(self, query, parameters=None):
+        """Plans the query without running it; returns the result summary (query_type, notifications)."""
+        with self.driver.session() as session:
+            return session.run(f"EXPLAIN {query}", parameters or {}).consume()
+
     def create_node(self, label, properties):
         query = f"CREATE (n:{label} $properties) RETURN n"
         return self.run_query(query, {"properties": properties})
@@ -22,4 +120,47 @@ class Neo4jClient:
 
     def delete_node(self, label, properties):
         query = f"MATCH (n:{label} $properties) DELETE n"
-        return self.run_query(query, {"properties": properties})
\ No newline at end of file
+        return self.run_query(query, {"properties": properties})
+
+
+class AsyncNeo4jClient:
+    """Async counterpart of Neo4jClient for code running on the event loop (FastAPI handlers, ingest jobs)."""
+
+    def __init__(self, uri, user, password):
+        # Must be created inside a running event loop; the driver is shared per loop
+        self.driver = get_async_driver(uri, user, password)
+
+    async def close(self):
+        # The driver is shared; it is closed by close_async_drivers() on shutdown
+        pass
+
+    async def run_query(self, query, parameters=None):
+        async with self.driver.session() as session:
+            result = await session.run(query, parameters or {})
+            return [record async for record in result]
+
+    async def run_batched(self, query, rows, batch_size=1000, param_name='batch'):
+        """
+        Runs an UNWIND write query over `rows` in batches, one managed transaction per batch.
+
+        The query must reference the rows as ${param_name}. Transient failures are retried by the driver.
+        Returns the number of rows written.
+        """
+        async def _write(tx, batch):
+            result = await tx.run(query, {param_name: batch})
+            await result.consume()
+
+        written = 0
+        async with self.driver.session() as session:
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                await session.execute_write(_write, batch)
+                written += len(batch)
+        return written
+
+    async def stream_query(self, query, parameters=None):
+        """Yields records as they arrive instead of materializing the whole result."""
+        async with self.driver.session() as session:
+            result = await session.run(query, parameters or {})
+            async for record in result:
+                yield record
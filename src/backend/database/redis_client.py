@@ -21,4 +21,40 @@ class RedisClient:
         return self.client.exists(key) > 0
 
     def close(self):
-        self.client.close()
\ No newline at end of file
+        self.client.close()
+
+# --- Shared connections for the backend caches ---
+_shared_connections = {}
+
+
+def create_redis_connection(decode_responses: bool = True, socket_timeout: float = 5) -> Redis:
+    """Return a new Redis connection for REDIS_URL (for blocking reads that outlast the shared timeout)."""
+    redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+    return Redis.from_url(
+        redis_url,
+        socket_connect_timeout=5,
+        socket_timeout=socket_timeout,
+        decode_responses=decode_responses
+    )
+
+
+def get_redis_connection(decode_responses: bool = True) -> Redis:
+    """Return a process-wide Redis connection for REDIS_URL (one per decode mode)."""
+    if decode_responses not in _shared_connections:
+        _shared_connections[decode_responses] = create_redis_connection(decode_responses)
+    return _shared_connections[decode_responses]
+
+
+# --- Corpus version ---
+# Bumped whenever ingestion changes the stored chunks; caches derived from the corpus include it in their keys.
+CORPUS_VERSION_KEY = "corpus:version"
+
+
+def get_corpus_version() -> int:
+    value = get_redis_connection().get(CORPUS_VERSION_KEY)
+    return int(value) if value else 0
+
+
+def bump_corpus_version() -> int:
+    """Mark the corpus as changed, invalidating caches keyed on the previous version."""
+    return int(get_redis_connection().incr(CORPUS_VERSION_KEY))
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from typing import List, Optional, Sequence
+
+from src.backend.database.redis_client import get_redis_connection
+
+# --- Cache configuration ---
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 500000))
+EMBEDDING_CACHE_TTL = int(os.getenv('EMBEDDING_CACHE_TTL', 30 * 86400)) # Seconds; refreshed on every hit
+DIMENSION_PROBE_TEXT = "embedding dimension probe"
+
+
+def normalize_chunk_text(text: str) -> str:
+    """Normalizes chunk text so insignificant whitespace/unicode differences hash identically."""
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash of a chunk (sha256 of the normalized text)."""
+    return hashlib.sha256(normalize_chunk_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache in Redis keyed by (model name, chunk hash).
+
+    Vectors are stored as packed float32 bytes with a TTL. A sorted set per model tracks
+    last access time so the cache can be trimmed back to `max_entries` least-recently-used first.
+    """
+
+    def __init__(self, model_name: str, redis_client=None, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, ttl: int = EMBEDDING_CACHE_TTL):
+        self.model_name = model_name
+        self.redis = redis_client or get_redis_connection(decode_responses=False)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lru_key = f"emb:{model_name}:lru"
+
+    def _key(self, text_hash: str) -> str:
+        return f"emb:{self.model_name}:{text_hash}"
+
+    def get_many(self, hashes: Sequence[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each hash, or None where it is missing."""
+        if not hashes:
+            return []
+        values = self.redis.mget([self._key(h) for h in hashes])
+        hit_hashes = [h for h, value in zip(hashes, values) if value is not None]
+        if hit_hashes:
+            # Refresh recency and TTL of the entries we just used
+            now = time.time()
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(self._lru_key, {h: now for h in hit_hashes})
+            for h in hit_hashes:
+                pipe.expire(self._key(h), self.ttl)
+            pipe.execute()
+        return [array('f', value).tolist() if value is not None else None for value in values]
+
+    def set_many(self, hashes: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Stores vectors and evicts least-recently-used entries beyond max_entries."""
+        if not hashes:
+            return
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for h, vector in zip(hashes, vectors):
+            pipe.set(self._key(h), array('f', vector).tobytes(), ex=self.ttl)
+        pipe.zadd(self._lru_key, {h: now for h in hashes})
+        pipe.zcard(self._lru_key)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = [member for member, _ in self.redis.zpopmin(self._lru_key, overflow)]
+            if evicted:
+                self.redis.delete(*[self._key(h.decode() if isinstance(h, bytes) else h) for h in evicted])
+
+
+class CachedEmbeddings:
+    """
+    Wraps an embeddings client (e.g. OpenAIEmbeddings) and serves repeated chunks from an EmbeddingCache.
+
+    Only cache misses are sent to the embedding server. Cache failures are logged and
+    fall back to embedding everything, so Redis being down never blocks ingestion.
+
+    The cache namespace is EMBEDDING_MODEL_NAME plus the vector dimension the server returns
+    (probed with one short request on first use). The client's own model setting says nothing
+    about the model LM Studio actually serves, so it is not used.
+    """
+
+    def __init__(self, embeddings_client, cache: Optional[EmbeddingCache] = None, model_name: Optional[str] = None):
+        self.embeddings_client = embeddings_client
+        self.model_name = model_name or os.getenv('EMBEDDING_MODEL_NAME')
+        if not self.model_name and cache is None:
+            print("WARNING: EMBEDDING_MODEL_NAME is not set; the embedding cache can only tell models apart by dimension")
+            self.model_name = "unnamed"
+        self.cache = cache # Created on first use, once the dimension is known
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+
+    def _get_cache(self) -> EmbeddingCache:
+        if self.cache is None:
+            with self._cache_lock:
+                if self.cache is None:
+                    dimension = len(self.embeddings_client.embed_documents([DIMENSION_PROBE_TEXT])[0])
+                    self.cache = EmbeddingCache(f"{self.model_name}:{dimension}")
+        return self.cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [chunk_hash(text) for text in texts]
+        cache = self._get_cache() # The probe fails like any request if the embedding server is down
+        try:
+            cached = cache.get_many(hashes)
+        except Exception as e:
+            print(f"WARNING: Embedding cache lookup failed, embedding without cache: {type(e).__name__}: {e}")
+            cached = [None] * len(texts)
+
+        miss_positions = [i for i, vector in enumerate(cached) if vector is None]
+        with self._lock:
+            self.hits += len(texts) - len(miss_positions)
+            self.misses += len(miss_positions)
+        if not miss_positions:
+            return cached
+
+        # Embed each distinct missing chunk once, even if it repeats within the batch
+        unique_hashes = list(dict.fromkeys(hashes[i] for i in miss_positions))
+        text_by_hash = {hashes[i]: texts[i] for i in miss_positions}
+        new_vectors = self.embeddings_client.embed_documents([text_by_hash[h] for h in unique_hashes])
+        if len(new_vectors) != len(unique_hashes):
+            raise ValueError(f"Embedding count mismatch: expected {len(unique_hashes)}, got {len(new_vectors)}")
+
+        try:
+            cache.set_many(unique_hashes, new_vectors)
+        except Exception as e:
+            print(f"WARNING: Failed to store embeddings in cache: {type(e).__name__}: {e}")
+
+        vector_by_hash = dict(zip(unique_hashes, new_vectors))
+        for i in miss_positions:
+            cached[i] = vector_by_hash[hashes[i]]
+        return cached
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        """Returns cumulative cache hit/miss counts."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import threading
+import time
+from typing import List, Optional, Sequence
+
+# --- Embedding request configuration ---
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv('EMBEDDING_MAX_IN_FLIGHT', 4)) # Concurrent requests to the embedding server
+EMBEDDING_TARGET_LATENCY = float(os.getenv('EMBEDDING_TARGET_LATENCY', 2.0)) # Seconds per request we aim for
+EMBEDDING_MIN_BATCH_TOKENS = int(os.getenv('EMBEDDING_MIN_BATCH_TOKENS', 500))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv('EMBEDDING_MAX_BATCH_TOKENS', 7500)) # Stay under the 8000 token input limit
+
+
+def estimate_tokens(text):
+    """Estimate token count in a text (rough approximation)"""
+    # Average of ~4 characters per token in English
+    return len(text) // 4 + 1
+
+
+def create_token_aware_batches(texts: Sequence[str], max_tokens: int) -> List[List[int]]:
+    """Groups text positions into batches whose estimated token count stays under max_tokens."""
+    batches = []
+    current_batch = []
+    current_token_count = 0
+
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        # If adding this text would exceed the token limit, start a new batch
+        if current_token_count + tokens > max_tokens and current_batch:
+            batches.append(current_batch)
+            current_batch = [i]
+            current_token_count = tokens
+        else:
+            current_batch.append(i)
+            current_token_count += tokens
+
+    # Add the last batch if it's not empty
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+class AdaptiveBatchSizer:
+    """
+    Picks the token budget of each embedding request from measured latency.
+
+    Additive increase while requests finish well under the target latency,
+    multiplicative decrease when they run over it or fail.
+    """
+
+    def __init__(self, initial_tokens: int = 2000, min_tokens: int = EMBEDDING_MIN_BATCH_TOKENS,
+                 max_tokens: int = EMBEDDING_MAX_BATCH_TOKENS, target_latency: float = EMBEDDING_TARGET_LATENCY):
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.target_latency = target_latency
+        self.token_budget = max(min_tokens, min(initial_tokens, max_tokens))
+        self._lock = threading.Lock()
+
+    def split(self, texts: Sequence[str]) -> List[List[int]]:
+        return create_token_aware_batches(texts, self.token_budget)
+
+    def record(self, tokens: int, latency: float) -> None:
+        """Feeds back the size and latency of a finished request."""
+        with self._lock:
+            if latency > self.target_latency:
+                self.token_budget = max(self.min_tokens, int(self.token_budget * 0.5))
+            elif latency < self.target_latency * 0.5 and tokens >= self.token_budget * 0.8:
+                # Only grow when the request actually used most of the budget
+                self.token_budget = min(self.max_tokens, self.token_budget + max(250, self.token_budget // 4))
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.token_budget = max(self.min_tokens, int(self.token_budget * 0.5))
+
+
+class AsyncEmbeddingClient:
+    """
+    Async front end for a synchronous embeddings client (OpenAIEmbeddings, CachedEmbeddings...).
+
+    Texts are split into token-aware requests sized by an AdaptiveBatchSizer and sent
+    concurrently, with at most `max_in_flight` requests outstanding across all callers.
+    """
+
+    def __init__(self, embeddings_client, max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT, batch_sizer: Optional[AdaptiveBatchSizer] = None):
+        self.embeddings_client = embeddings_client
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_sizer = batch_sizer or AdaptiveBatchSizer()
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.requests = 0
+        self.total_latency = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Semaphores are bound to a loop; scripts may call asyncio.run() once per file
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _embed_request(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        async with self._get_semaphore():
+            start = time.time()
+            try:
+                vectors = await loop.run_in_executor(None, self.embeddings_client.embed_documents, texts)
+            except Exception:
+                self.batch_sizer.record_failure()
+                raise
+            latency = time.time() - start
+        self.batch_sizer.record(sum(estimate_tokens(text) for text in texts), latency)
+        self.requests += 1
+        self.total_latency += latency
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedding count mismatch: expected {len(texts)}, got {len(vectors)}")
+        return vectors
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts using concurrent, adaptively sized requests; results keep input order."""
+        if not texts:
+            return []
+        batches = self.batch_sizer.split(texts)
+        results = await asyncio.gather(*[self._embed_request([texts[i] for i in batch]) for batch in batches])
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def batch_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "avg_latency": self.total_latency / self.requests if self.requests else 0.0,
+            "token_budget": self.batch_sizer.token_budget,
+        }
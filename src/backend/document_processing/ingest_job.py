@@ -0,0 +1,168 @@
+import asyncio
+import os
+import traceback
+from typing import Optional
+import openai
+import redis
+from langchain_openai import OpenAIEmbeddings
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+from src.backend.api.progress import progress_complete_job, update_job_status
+from src.backend.assistant.llm import LM_STUDIO_API_BASE, LM_STUDIO_API_KEY
+from src.backend.database.neo4j_client import AsyncNeo4jClient
+from src.backend.database.redis_client import get_redis_connection
+from src.backend.document_processing.text_processor import TextProcessor
+from src.backend.document_processing.ingest_pipeline import IngestPipeline, iter_document_pages
+from src.backend.document_processing.embedding_cache import CachedEmbeddings
+
+
+def get_async_neo4j_client() -> AsyncNeo4jClient:
+    """Neo4j client on the shared async driver pool (use 'neo4j' as hostname in Docker)"""
+    return AsyncNeo4jClient(
+        os.getenv('NEO4J_URI', 'bolt://neo4j:7687'),
+        os.getenv('NEO4J_USERNAME', 'neo4j'),
+        os.getenv('NEO4J_PASSWORD', 'vaggpinel')
+    )
+
+
+# --- Upload dedup ---
+# SHA-256 of an uploaded file -> id of the document it was ingested as. Redis answers repeat
+# uploads quickly; the hash is also stored on the Document node, which stays authoritative.
+DOCUMENT_HASH_KEY_PREFIX = "doc:sha256:"
+FIND_BY_CONTENT_HASH_QUERY = "MATCH (d:Document {content_hash: $content_hash}) RETURN d.id AS id LIMIT 1"
+SET_CONTENT_HASH_QUERY = "MATCH (d:Document {id: $doc_id}) SET d.content_hash = $content_hash RETURN count(d) AS updated"
+
+
+async def find_ingested_document(content_hash: str) -> Optional[str]:
+    """Returns the id of the document already ingested from identical content, if any"""
+    loop = asyncio.get_running_loop()
+    redis_conn = get_redis_connection()
+    try:
+        doc_id = await loop.run_in_executor(None, redis_conn.get, f"{DOCUMENT_HASH_KEY_PREFIX}{content_hash}")
+        if doc_id:
+            return doc_id
+    except Exception as e:
+        print(f"WARNING: Redis lookup of content hash failed: {type(e).__name__}: {e}")
+
+    records = await get_async_neo4j_client().run_query(FIND_BY_CONTENT_HASH_QUERY, {"content_hash": content_hash})
+    if not records:
+        return None
+    doc_id = records[0]["id"]
+    try:
+        await loop.run_in_executor(None, redis_conn.set, f"{DOCUMENT_HASH_KEY_PREFIX}{content_hash}", doc_id)
+    except Exception as e:
+        print(f"WARNING: Failed to cache content hash: {type(e).__name__}: {e}")
+    return doc_id
+
+
+async def record_ingested_document(neo4j_client: AsyncNeo4jClient, doc_id: str, content_hash: str) -> None:
+    """Marks a fully ingested document as the copy of its content hash (call only after a complete ingest)"""
+    records = await neo4j_client.run_query(SET_CONTENT_HASH_QUERY, {"doc_id": doc_id, "content_hash": content_hash})
+    if not records or not records[0]["updated"]:
+        # No Document node: a cached hash would make every later upload of the file a "duplicate"
+        print(f"WARNING: Document {doc_id} not found, content hash not recorded")
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, get_redis_connection().set, f"{DOCUMENT_HASH_KEY_PREFIX}{content_hash}", doc_id
+        )
+    except Exception as e:
+        print(f"WARNING: Failed to cache content hash: {type(e).__name__}: {e}")
+
+
+def store_upload(file_path: str, filename: str) -> None:
+    """
+    Moves a processed upload from its job-specific temporary name to its real name (for
+    process_documents.py). Done after ingestion, so it never replaces a file a job is reading.
+    """
+    target = os.path.join(os.path.dirname(file_path), filename)
+    if os.path.abspath(file_path) != os.path.abspath(target) and os.path.exists(file_path):
+        os.replace(file_path, target)
+
+
+# Failures caused by a service being briefly unavailable; a queued job is worth retrying after these
+RETRYABLE_ERRORS = (
+    ServiceUnavailable, SessionExpired, TransientError, # Neo4j
+    redis.exceptions.ConnectionError, redis.exceptions.TimeoutError,
+    openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, openai.InternalServerError, # LM Studio embeddings
+)
+
+
+# --- PDF/TXT Processing Job ---
+# Runs in the API process (FairJobScheduler) or in a queue worker (src/backend/worker.py)
+async def process_document(file_path, filename, job_id, content_hash: Optional[str] = None, raise_retryable: bool = False):
+    """
+    Process PDF or TXT document with progress tracking (content_hash: SHA-256 of the file, for upload dedup).
+
+    With raise_retryable, RETRYABLE_ERRORS are re-raised instead of failing the job, so the
+    queue worker can leave the job unacknowledged for another attempt.
+    """
+    is_pdf = filename.lower().endswith(".pdf")
+    retrying = False
+
+    try:
+        print(f"Background task started for job {job_id}, file {filename}")
+
+        # Connect to Neo4j (shared async driver pool, so writes don't block the event loop)
+        neo4j_client = get_async_neo4j_client()
+
+        # Initialize Embeddings client pointing to LM Studio (same as process_documents.py)
+        # Repeated chunks (re-uploads, near-duplicate files) are served from the Redis embedding cache
+        embeddings_client = CachedEmbeddings(OpenAIEmbeddings(
+            openai_api_key=LM_STUDIO_API_KEY,
+            openai_api_base=LM_STUDIO_API_BASE,
+            chunk_size=50 # Or make configurable
+        ))
+
+        # --- Streaming extraction -> chunking -> embedding -> Neo4j ingestion ---
+        # Pages are chunked and embedded while later pages are still being extracted
+        doc_id = filename.rsplit('.', 1)[0] # More robust way to remove extension
+        pipeline = IngestPipeline(neo4j_client, embeddings_client, TextProcessor())
+        pages = iter_document_pages(file_path, filename, job_id) # Creates the progress job
+        chunks_added_count = await pipeline.run(doc_id, filename, pages, job_id)
+
+        if pipeline.chunks_produced == 0:
+            print(f"Job {job_id}: No chunks generated from {filename}.")
+            if is_pdf:
+                await progress_complete_job(job_id, "Failed: No text could be extracted from PDF", final_status="failed")
+            else:
+                await progress_complete_job(job_id, "Completed: No text chunks generated after processing.", final_status="completed") # Consider completed if no chunks
+            return
+
+        print(f"Job {job_id}: Finished Neo4j ingestion. Added/Updated {chunks_added_count}/{pipeline.chunks_produced} chunks "
+              f"({pipeline.chunks_unchanged} unchanged, {pipeline.chunks_deleted} removed).")
+        cache_report = f"embedding cache: {pipeline.cache_hits} hits, {pipeline.cache_misses} misses"
+        if content_hash and pipeline.complete:
+            # Later uploads of the same bytes are skipped, so only a document stored in full may claim the hash
+            await record_ingested_document(neo4j_client, doc_id, content_hash)
+
+        # --- Final Step: Create Vector Index ---
+        # This should ideally be done once after processing, maybe not per-job
+        # Or ensure it's idempotent. Let's keep it in process_documents.py for now.
+
+        await progress_complete_job(job_id, f"Processing complete - ready for querying ({cache_report})", final_status="completed")
+        print(f"Background task finished successfully for job: {job_id}")
+
+    except RETRYABLE_ERRORS as e:
+        if not raise_retryable:
+            await _fail_job(job_id, e)
+            return
+        retrying = True
+        print(f"WARNING: Job {job_id} hit a transient error, leaving it for a retry: {type(e).__name__}: {e}")
+        await update_job_status(job_id, status="queued", message=f"Retrying after {type(e).__name__}...")
+        raise
+    except Exception as e:
+        await _fail_job(job_id, e)
+    finally:
+        if not retrying: # A retry reads the file from the same path again
+            try:
+                store_upload(file_path, filename)
+            except OSError as e:
+                print(f"WARNING: Could not store {filename} under its own name: {e}")
+
+
+async def _fail_job(job_id: str, e: Exception) -> None:
+    error_message = f"Error during processing: {type(e).__name__}: {str(e)}"
+    print(f"ERROR in background task for job {job_id}: {error_message}")
+    traceback.print_exc() # Called from an except block
+    await progress_complete_job(job_id, error_message, final_status="failed")
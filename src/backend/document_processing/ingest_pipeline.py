@@ -0,0 +1,458 @@
+import asyncio
+import os
+import time
+import chardet
+from typing import AsyncIterator, List, Optional
+
+from src.backend.api.progress import create_job, update_job_progress, update_job_status
+from src.backend.assistant.local_index import publish_index_changes, LOCAL_VECTOR_INDEX
+from src.backend.database.neo4j_client import AsyncNeo4jClient
+from src.backend.database.redis_client import bump_corpus_version
+from src.backend.document_processing.pdf_loader import PDFLoader
+from src.backend.document_processing.text_processor import TextProcessor, ChunkBuffer
+from src.backend.document_processing.embedding_cache import chunk_hash
+from src.backend.document_processing.embedding_client import AsyncEmbeddingClient
+
+# --- Pipeline configuration ---
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 50)) # Chunks per embedding request / Neo4j write
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 4)) # Max batches buffered between two stages
+TXT_BLOCK_CHARS = 64 * 1024 # TXT files are streamed in blocks of roughly this size
+
+_END = object() # Sentinel closing a stage queue
+
+# Full-text (BM25) index used by the hybrid retriever next to the chunk_embeddings vector index
+FULLTEXT_INDEX_QUERY = "CREATE FULLTEXT INDEX chunk_fulltext IF NOT EXISTS FOR (c:Chunk) ON EACH [c.content]"
+
+SCHEMA_QUERIES = [
+    # MERGE/MATCH by id must not scan every node as the corpus grows
+    "CREATE CONSTRAINT document_id IF NOT EXISTS FOR (d:Document) REQUIRE d.id IS UNIQUE",
+    "CREATE CONSTRAINT chunk_id IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE",
+    # Upload dedup looks documents up by the SHA-256 of the uploaded file
+    "CREATE INDEX document_content_hash IF NOT EXISTS FOR (d:Document) ON (d.content_hash)",
+    FULLTEXT_INDEX_QUERY,
+]
+
+MANIFEST_QUERY = """
+MATCH (d:Document {id: $doc_id})
+RETURN d.chunk_hashes AS chunk_hashes, d.chunk_ids AS chunk_ids, d.chunk_indexes AS chunk_indexes
+"""
+
+CHUNK_WRITE_QUERY = """
+UNWIND $batch as row
+MATCH (d:Document {id: row.doc_id})
+MERGE (c:Chunk {id: row.chunk_id})
+SET c.content = row.content, c.embedding = row.embedding, c.hash = row.hash, c.chunk_index = row.chunk_index
+MERGE (d)-[:CONTAINS]->(c)
+"""
+
+# Unchanged chunks that moved only get their position updated; their embedding is left alone
+CHUNK_REINDEX_QUERY = """
+UNWIND $batch as row
+MATCH (c:Chunk {id: row.chunk_id})
+SET c.chunk_index = row.chunk_index
+"""
+
+# Store the new manifest and drop chunks that are no longer part of the document
+MANIFEST_WRITE_QUERY = """
+MATCH (d:Document {id: $doc_id})
+SET d.chunk_hashes = $chunk_hashes, d.chunk_ids = $keep_ids, d.chunk_indexes = $chunk_indexes,
+    d.chunk_count = size($chunk_hashes)
+WITH d
+OPTIONAL MATCH (d)-[:CONTAINS]->(c:Chunk)
+WHERE NOT c.id IN $keep_ids
+WITH c, c.id AS chunk_id
+DETACH DELETE c
+RETURN count(c) AS deleted, collect(chunk_id) AS deleted_ids
+"""
+
+
+def chunk_ids_for_hashes(doc_id: str, chunk_hashes: List[str]) -> List[str]:
+    """
+    Derives content-addressed chunk ids from an ordered list of chunk hashes.
+
+    Chunks that repeat inside a document get an occurrence suffix, so the same
+    hash list always maps to the same ids no matter where the chunks moved.
+    """
+    seen = {}
+    chunk_ids = []
+    for h in chunk_hashes:
+        occurrence = seen.get(h, 0)
+        seen[h] = occurrence + 1
+        chunk_ids.append(make_chunk_id(doc_id, h, occurrence))
+    return chunk_ids
+
+
+def make_chunk_id(doc_id: str, h: str, occurrence: int = 0) -> str:
+    """Chunk id for the n-th occurrence (0-based) of a chunk hash inside a document."""
+    chunk_id = f"{doc_id}_{h[:16]}"
+    return chunk_id if occurrence == 0 else f"{chunk_id}_{occurrence}"
+
+
+
+
+async def iter_document_pages(file_path: str, filename: str, job_id: Optional[str] = None, max_pages: Optional[int] = None) -> AsyncIterator[str]:
+    """Yields the text of a PDF page by page, or of a TXT file block by block."""
+    if filename.lower().endswith(".pdf"):
+        pdf_loader = PDFLoader(os.path.dirname(file_path), max_pages=max_pages)
+        async for _, page_text in pdf_loader.iter_page_texts(file_path, job_id): # Creates the progress job
+            if page_text:
+                yield page_text
+        return
+
+    # --- TXT Reading ---
+    with open(file_path, 'rb') as f:
+        # Detect encoding from the head of the file so large files aren't read twice
+        detected_encoding = chardet.detect(f.read(1024 * 1024))['encoding'] or 'utf-8' # Default to utf-8
+    if job_id:
+        await create_job(job_id, filename, total_pages=1) # TXT files count as a single page
+    with open(file_path, 'r', encoding=detected_encoding) as f:
+        block = []
+        block_len = 0
+        for line in f:
+            block.append(line)
+            block_len += len(line)
+            if block_len >= TXT_BLOCK_CHARS:
+                yield "".join(block)
+                block, block_len = [], 0
+                await asyncio.sleep(0) # Yield control
+        if block:
+            yield "".join(block)
+    if job_id:
+        await update_job_progress(job_id, 1) # Mark reading as complete (1/1 page)
+
+
+class IngestPipeline:
+    """
+    Streams a document into Neo4j through bounded stages:
+    pages -> cleaned text -> chunks -> embedding batches -> Neo4j writes.
+
+    Each stage runs as its own task connected by small asyncio queues, so embedding of the
+    first chunks starts while later pages are still being extracted, and at most a few
+    batches are held in memory regardless of document size.
+
+    Ingestion is incremental: chunk ids are derived from content hashes, and the ids, hashes and
+    stored positions of the chunks in Neo4j are kept on the Document node (d.chunk_ids,
+    d.chunk_hashes, d.chunk_indexes). On re-ingestion, chunks already in the
+    manifest are neither embedded nor rewritten, new chunks are inserted and chunks that
+    disappeared from the document are deleted.
+    """
+
+    _schema_ready = False
+
+    def __init__(self, neo4j_client, embeddings_client, text_processor: Optional[TextProcessor] = None,
+                 batch_size: int = INGEST_BATCH_SIZE, queue_size: int = INGEST_QUEUE_SIZE,
+                 incremental: bool = True, verbose: bool = False):
+        self.neo4j_client = neo4j_client
+        if isinstance(embeddings_client, AsyncEmbeddingClient):
+            self.embedder = embeddings_client
+            self.embeddings_client = embeddings_client.embeddings_client
+        else:
+            self.embedder = AsyncEmbeddingClient(embeddings_client)
+            self.embeddings_client = embeddings_client
+        self.text_processor = text_processor or TextProcessor()
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.incremental = incremental
+        self.verbose = verbose
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.chunks_unchanged = 0
+        self.chunks_deleted = 0
+
+    async def _run_query(self, query, parameters=None):
+        """Runs a Neo4j query without blocking the event loop (AsyncNeo4jClient or Neo4jClient)."""
+        if isinstance(self.neo4j_client, AsyncNeo4jClient):
+            return await self.neo4j_client.run_query(query, parameters)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.neo4j_client.run_query, query, parameters)
+
+    async def _write_rows(self, query, rows):
+        """Runs an UNWIND $batch write query for `rows`."""
+        if isinstance(self.neo4j_client, AsyncNeo4jClient):
+            return await self.neo4j_client.run_batched(query, rows, batch_size=len(rows))
+        return await self._run_query(query, {'batch': rows})
+
+    async def _ensure_schema(self) -> None:
+        if IngestPipeline._schema_ready:
+            return
+        for query in SCHEMA_QUERIES:
+            try:
+                await self._run_query(query)
+            except Exception as e:
+                print(f"WARNING: Could not create Neo4j constraint: {type(e).__name__}: {e}")
+        IngestPipeline._schema_ready = True
+
+    async def _load_manifest(self) -> dict:
+        """Returns {chunk_id: chunk_index} for the chunks currently stored for the document."""
+        if not self.incremental:
+            return {}
+        records = await self._run_query(MANIFEST_QUERY, {'doc_id': self._doc_id})
+        if not records:
+            return {}
+        if records[0]["chunk_ids"] is not None:
+            # Stored ids, not re-derived: occurrence suffixes depend on chunks that may have failed
+            return dict(zip(records[0]["chunk_ids"], records[0]["chunk_indexes"]))
+        # Documents ingested before ids were stored
+        chunk_hashes = records[0]["chunk_hashes"] or []
+        return {chunk_id: index for index, chunk_id in enumerate(chunk_ids_for_hashes(self._doc_id, chunk_hashes))}
+
+    async def run(self, doc_id: str, title: str, pages: AsyncIterator[str], job_id: Optional[str] = None) -> int:
+        """
+        Runs the pipeline for one document and returns the number of chunks written (new or changed).
+
+        If an embedding or write batch failed, the first such error is raised once the other
+        batches are stored, so the caller can retry the document or fail the job.
+        """
+        self._doc_id = doc_id
+        self._title = title
+        self._job_id = job_id
+        self._doc_created = False
+        self._chunks_produced = 0
+        self._chunks_stored = 0
+        self._producer_done = False
+        self._first_chunk_time = None
+        self._start_time = time.time()
+        self._hash_counts = {}
+        self._batch_errors = [] # Exceptions of embedding/write batches that were skipped
+        self._present = {} # chunk_index -> (hash, chunk_id, chunk_index in Neo4j) of every chunk stored after this run
+        self.chunks_unchanged = 0
+        self.chunks_deleted = 0
+        cache_stats_before = self._cache_stats()
+
+        await self._ensure_schema()
+        self._existing = await self._load_manifest()
+        self._doc_created = bool(self._existing)
+
+        chunk_queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue = asyncio.Queue(maxsize=self.queue_size)
+        stages = [
+            asyncio.ensure_future(self._chunk_stage(pages, chunk_queue, write_queue)),
+            asyncio.ensure_future(self._embed_stage(chunk_queue, write_queue)),
+            asyncio.ensure_future(self._write_stage(write_queue)),
+        ]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            # Stop the other stages if one of them fails
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            raise
+
+        if self._chunks_produced and self._doc_created:
+            # Also after failed batches: the chunks that were stored are skipped on the retry
+            await self._write_manifest()
+        if self._chunks_stored or self.chunks_deleted:
+            self._bump_corpus_version()
+        if self._batch_errors:
+            print(f"Document {doc_id}: {len(self._batch_errors)} batches failed, "
+                  f"{self._chunks_stored + self.chunks_unchanged}/{self._chunks_produced} chunks stored")
+            # Raised as is, so callers can tell a transient outage (worth a retry) from a bug
+            raise self._batch_errors[0]
+
+        cache_stats_after = self._cache_stats()
+        self.cache_hits = cache_stats_after["hits"] - cache_stats_before["hits"]
+        self.cache_misses = cache_stats_after["misses"] - cache_stats_before["misses"]
+        if cache_stats_after["hits"] or cache_stats_after["misses"]:
+            print(f"Document {doc_id}: embedding cache {self.cache_hits} hits, {self.cache_misses} misses")
+
+        print(f"Document {doc_id}: {self._chunks_stored} chunks written, {self.chunks_unchanged} unchanged, "
+              f"{self.chunks_deleted} deleted in {time.time() - self._start_time:.2f}s")
+        if self.verbose:
+            print(f"Document {doc_id}: embedding requests {self.embedder.batch_stats()}")
+        if self._first_chunk_time is not None:
+            print(f"Document {doc_id}: first chunk searchable after {self._first_chunk_time - self._start_time:.2f}s")
+        return self._chunks_stored
+
+    @property
+    def chunks_produced(self) -> int:
+        return self._chunks_produced
+
+    @property
+    def complete(self) -> bool:
+        """True when every chunk of the last run is stored (written now or unchanged)"""
+        return self._chunks_stored + self.chunks_unchanged == self._chunks_produced
+
+    def _bump_corpus_version(self) -> None:
+        """Invalidates answer caches built on the previous version of the corpus."""
+        try:
+            version = bump_corpus_version()
+            if self.verbose:
+                print(f"Document {self._doc_id}: corpus version is now {version}")
+        except Exception as e:
+            print(f"WARNING: Could not bump corpus version: {type(e).__name__}: {e}")
+
+    async def _publish_index_changes(self, upserts=(), deleted_ids=()) -> None:
+        """Sends written/deleted chunk vectors to the API processes' local vector indexes (LOCAL_VECTOR_INDEX)."""
+        if not LOCAL_VECTOR_INDEX:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, publish_index_changes, upserts, deleted_ids)
+        except Exception as e:
+            # Local indexes miss this change until they are rebuilt (delete meta.json in each data/vector_index slot)
+            print(f"WARNING: Could not publish local vector index changes: {type(e).__name__}: {e}")
+
+    def _cache_stats(self) -> dict:
+        """Cumulative hit/miss counts of the embeddings client, if it is cached (see CachedEmbeddings)."""
+        if hasattr(self.embeddings_client, 'stats'):
+            return self.embeddings_client.stats()
+        return {"hits": 0, "misses": 0}
+
+    def _make_chunk(self, chunk_text: str) -> dict:
+        """Assigns the next chunk index and its content-addressed id."""
+        h = chunk_hash(chunk_text)
+        occurrence = self._hash_counts.get(h, 0)
+        self._hash_counts[h] = occurrence + 1
+        chunk = {
+            'doc_id': self._doc_id,
+            'chunk_id': make_chunk_id(self._doc_id, h, occurrence),
+            'chunk_index': self._chunks_produced,
+            'hash': h,
+            'content': chunk_text,
+        }
+        self._chunks_produced += 1
+        return chunk
+
+    async def _chunk_stage(self, pages: AsyncIterator[str], chunk_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+        """Cleans and chunks pages as they arrive; only new chunks are sent on for embedding."""
+        chunk_buffer = ChunkBuffer(self.text_processor)
+        batch = []
+        moved = [] # Unchanged chunks whose position changed
+
+        async def route(chunk_text):
+            nonlocal batch, moved
+            chunk = self._make_chunk(chunk_text)
+            old_index = self._existing.get(chunk['chunk_id'])
+            if old_index is None:
+                batch.append(chunk)
+            else:
+                self.chunks_unchanged += 1
+                # Keeps its old position until the reindex write succeeds
+                self._present[chunk['chunk_index']] = (chunk['hash'], chunk['chunk_id'], old_index)
+                if old_index != chunk['chunk_index']:
+                    moved.append({'chunk_id': chunk['chunk_id'], 'chunk_index': chunk['chunk_index']})
+            if len(batch) >= self.batch_size:
+                await chunk_queue.put(batch)
+                batch = []
+            if len(moved) >= self.batch_size:
+                await write_queue.put(('reindex', moved))
+                moved = []
+
+        async for page_text in pages:
+            for chunk_text in chunk_buffer.feed(page_text):
+                await route(chunk_text)
+        for chunk_text in chunk_buffer.flush():
+            await route(chunk_text)
+        if batch:
+            await chunk_queue.put(batch)
+        if moved:
+            await write_queue.put(('reindex', moved))
+        self._producer_done = True
+        if self.verbose:
+            print(f"Document {self._doc_id}: produced {self._chunks_produced} chunks ({self.chunks_unchanged} unchanged)")
+        await chunk_queue.put(_END)
+
+    async def _embed_stage(self, chunk_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+        """
+        Embeds chunk batches concurrently and hands Neo4j parameter batches to the writer.
+
+        Up to `max_in_flight` batches are embedded at once while the writer stores earlier
+        ones, so the embedding server and Neo4j are busy at the same time.
+        """
+        in_flight = set()
+        slots = asyncio.Semaphore(self.embedder.max_in_flight) # Bounds batches held in memory
+        try:
+            while True:
+                batch = await chunk_queue.get()
+                if batch is _END:
+                    break
+                await slots.acquire()
+                task = asyncio.ensure_future(self._embed_batch(batch, write_queue))
+                in_flight.add(task)
+                task.add_done_callback(lambda t: (in_flight.discard(t), slots.release()))
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            raise
+        await write_queue.put(_END)
+
+    async def _embed_batch(self, batch: List[dict], write_queue: asyncio.Queue) -> None:
+        batch_texts = [chunk['content'] for chunk in batch]
+        try:
+            batch_embeddings = await self.embedder.embed_documents(batch_texts)
+        except Exception as emb_e:
+            print(f"Job {self._job_id}: Error generating embeddings for batch starting at index {batch[0]['chunk_index']}: {emb_e}")
+            self._batch_errors.append(emb_e)
+            return # Skip this batch; it is left out of the manifest and run() raises once the stages drain
+
+        await write_queue.put(('chunks', [dict(chunk, embedding=embedding) for chunk, embedding in zip(batch, batch_embeddings)]))
+
+    async def _write_stage(self, write_queue: asyncio.Queue) -> None:
+        """Writes embedded chunk batches to Neo4j and reports progress."""
+        while True:
+            item = await write_queue.get()
+            if item is _END:
+                break
+            kind, batch_params = item
+            try:
+                if kind == 'reindex':
+                    await self._write_rows(CHUNK_REINDEX_QUERY, batch_params)
+                    for row in batch_params:
+                        h, chunk_id, _ = self._present[row['chunk_index']]
+                        self._present[row['chunk_index']] = (h, chunk_id, row['chunk_index'])
+                    continue
+                if not self._doc_created:
+                    # Create the document node lazily so empty documents leave nothing behind
+                    await self._run_query(
+                        "MERGE (d:Document {id: $doc_id}) ON CREATE SET d.title = $title",
+                        {'doc_id': self._doc_id, 'title': self._title}
+                    )
+                    self._doc_created = True
+                # Use MERGE for idempotency
+                await self._write_rows(CHUNK_WRITE_QUERY, batch_params)
+            except Exception as neo_e:
+                print(f"Job {self._job_id}: Error executing Neo4j {kind} batch query for chunk {batch_params[0]['chunk_id']}: {neo_e}")
+                self._batch_errors.append(neo_e)
+                continue # Skip this batch
+
+            for row in batch_params:
+                self._present[row['chunk_index']] = (row['hash'], row['chunk_id'], row['chunk_index'])
+            await self._publish_index_changes(upserts=[(row['chunk_id'], row['embedding']) for row in batch_params])
+            self._chunks_stored += len(batch_params)
+            if self._first_chunk_time is None:
+                self._first_chunk_time = time.time()
+            if self._job_id:
+                await self._report_progress()
+
+    async def _write_manifest(self) -> None:
+        """Stores the ids, hashes and positions of the chunks now in Neo4j and deletes vanished chunks."""
+        present = [self._present[index] for index in sorted(self._present)]
+        records = await self._run_query(MANIFEST_WRITE_QUERY, {
+            'doc_id': self._doc_id,
+            'chunk_hashes': [h for h, _, _ in present],
+            'keep_ids': [chunk_id for _, chunk_id, _ in present],
+            'chunk_indexes': [stored_index for _, _, stored_index in present],
+        })
+        self.chunks_deleted = records[0]["deleted"] if records else 0
+        if self.chunks_deleted:
+            await self._publish_index_changes(deleted_ids=records[0]["deleted_ids"])
+
+    async def _report_progress(self) -> None:
+        done = self._chunks_stored + self.chunks_unchanged
+        if self._producer_done and self._chunks_produced:
+            # Chunk total is only known once extraction has finished
+            await update_job_status(
+                self._job_id,
+                status="embedding_neo4j",
+                message=f"Storing chunk {done}/{self._chunks_produced}",
+                percent_complete=int((done / self._chunks_produced) * 100),
+                current_page=done # Re-use current_page for chunks processed
+            )
+        else:
+            await update_job_status(
+                self._job_id,
+                status="embedding_neo4j",
+                message=f"Stored {self._chunks_stored} chunks while extracting..."
+            )
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from typing import List, Optional, Tuple
+
+# --- Ingest queue configuration ---
+INGEST_STREAM = os.getenv('INGEST_STREAM', 'ingest:jobs')
+INGEST_GROUP = os.getenv('INGEST_GROUP', 'ingest-workers')
+INGEST_VISIBILITY_TIMEOUT = int(os.getenv('INGEST_VISIBILITY_TIMEOUT', 300)) # Seconds before an unacknowledged job is redelivered
+INGEST_MAX_DELIVERIES = int(os.getenv('INGEST_MAX_DELIVERIES', 3)) # Deliveries before a job is dead-lettered
+INGEST_STREAM_MAXLEN = int(os.getenv('INGEST_STREAM_MAXLEN', 10000)) # Approximate cap on retained job entries
+
+INGEST_WAKEUP_BACKLOG = 100 # Cap on wake-up signals kept for idle workers
+
+Message = Tuple[str, dict]
+
+# --- Fair dispatch scripts ---
+# Jobs wait in a sorted set before entering the stream. A job's score is its group's round:
+# a group's first job joins the current round, each further job goes one round later, so
+# taking the lowest score serves groups (batches, single uploads) round-robin. Members are
+# "<enqueue time ns> <fields JSON>", which keeps jobs of one round in arrival order.
+# KEYS: ready set, group rounds, current round, wake-up list. ARGV: group, member, wake-up backlog.
+ENQUEUE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[3]) or '0')
+local round = math.max(tonumber(redis.call('ZSCORE', KEYS[2], ARGV[1]) or '0'), current)
+redis.call('ZADD', KEYS[1], round, ARGV[2])
+redis.call('ZADD', KEYS[2], round + 1, ARGV[1])
+redis.call('LPUSH', KEYS[4], 1)
+redis.call('LTRIM', KEYS[4], 0, tonumber(ARGV[3]) - 1)
+return round
+"""
+
+# Moves the next job into the stream right before a worker reads it, so the stream only holds
+# jobs that are being taken. Returns 0 when no job is waiting.
+# KEYS: ready set, group rounds, current round, stream. ARGV: stream maxlen.
+DISPATCH_SCRIPT = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if not popped[1] then return 0 end
+local round = tonumber(popped[2])
+redis.call('SET', KEYS[3], round)
+-- Groups that would join the current round anyway don't need their entry any more
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', round)
+local fields = cjson.decode(string.sub(popped[1], string.find(popped[1], ' ') + 1))
+local flat = {}
+for name, value in pairs(fields) do
+    flat[#flat + 1] = name
+    flat[#flat + 1] = value
+end
+redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[1], '*', unpack(flat))
+return 1
+"""
+
+
+class IngestQueue:
+    """
+    Durable document ingestion queue on a Redis Stream with a consumer group.
+
+    Enqueued jobs first wait in a sorted set that hands them out round-robin across groups (see
+    ENQUEUE_SCRIPT), so a single upload doesn't wait behind every file of a large batch; a job
+    enters the stream when a worker takes it. Each job is delivered to one worker and stays in
+    the group's pending list until the worker acknowledges it. If a worker dies, the job becomes claimable by any other worker once it has
+    been idle for `visibility_timeout` seconds. Workers processing long jobs call `heartbeat()`
+    to keep their claim. Jobs delivered more than `max_deliveries` times are moved to a
+    dead-letter stream instead of being retried forever.
+    """
+
+    def __init__(self, redis_client=None, stream: str = INGEST_STREAM, group: str = INGEST_GROUP,
+                 visibility_timeout: int = INGEST_VISIBILITY_TIMEOUT, max_deliveries: int = INGEST_MAX_DELIVERIES):
+        self.redis = redis_client or aioredis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'), decode_responses=True)
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = f"{stream}:dead"
+        self.ready_keys = [f"{stream}:ready", f"{stream}:ready:groups", f"{stream}:ready:round"]
+        self.wakeup_key = f"{stream}:wakeup"
+        self._enqueue_script = self.redis.register_script(ENQUEUE_SCRIPT)
+        self._dispatch_script = self.redis.register_script(DISPATCH_SCRIPT)
+        self.visibility_timeout_ms = visibility_timeout * 1000
+        self.max_deliveries = max_deliveries
+        self._group_ready = False
+
+    async def ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            print(f"Created consumer group '{self.group}' on stream '{self.stream}'")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e): # Group already exists
+                raise
+        self._group_ready = True
+
+    async def enqueue(self, file_path: str, filename: str, job_id: str, content_hash: str = "", group: str = "") -> int:
+        """Queues a document job in its group (a batch id; defaults to the job itself) and returns its round."""
+        await self.ensure_group()
+        group = group or job_id
+        fields = {"file_path": file_path, "filename": filename, "job_id": job_id, "content_hash": content_hash or "",
+                  "group": group, "enqueued_at": str(time.time())}
+        member = f"{time.time_ns():020d} {json.dumps(fields)}"
+        return await self._enqueue_script(keys=self.ready_keys + [self.wakeup_key], args=[group, member, INGEST_WAKEUP_BACKLOG])
+
+    async def claim_stale(self, consumer: str, count: int = 1) -> List[Message]:
+        """Takes over jobs whose worker stopped acknowledging or heartbeating them."""
+        await self.ensure_group()
+        result = await self.redis.xautoclaim(self.stream, self.group, consumer, self.visibility_timeout_ms,
+                                             start_id="0-0", count=count)
+        # [next_start_id, messages] (Redis 7 adds a list of deleted ids)
+        messages = result[1] if result else []
+        # Entries trimmed from the stream come back without fields; drop them from the pending list
+        for message_id, fields in messages:
+            if not fields:
+                await self.ack(message_id)
+        return [(message_id, fields) for message_id, fields in messages if fields]
+
+    async def take(self, consumer: str) -> List[Message]:
+        """Takes the next job in round-robin order, if any, without waiting."""
+        await self.ensure_group()
+        await self._dispatch_script(keys=self.ready_keys + [self.stream], args=[INGEST_STREAM_MAXLEN])
+        # Reads the oldest undelivered entry: the one just moved, or one left by a worker that died in between
+        response = await self.redis.xreadgroup(self.group, consumer, {self.stream: ">"}, count=1)
+        if not response:
+            return []
+        return list(response[0][1])
+
+    async def read(self, consumer: str, block_ms: int = 5000) -> List[Message]:
+        """Waits up to block_ms for a new job."""
+        messages = await self.take(consumer)
+        if not messages:
+            # Woken by the next enqueue; the timeout covers wake-ups taken by other workers
+            await self.redis.brpop([self.wakeup_key], timeout=max(1, block_ms // 1000))
+            messages = await self.take(consumer)
+        return messages
+
+    async def next_job(self, consumer: str, block_ms: int = 5000) -> Optional[Message]:
+        """Returns a stale job to retry if there is one, otherwise waits for a new job."""
+        messages = await self.claim_stale(consumer) or await self.read(consumer, block_ms=block_ms)
+        return messages[0] if messages else None
+
+    async def delivery_count(self, message_id: str) -> int:
+        pending = await self.redis.xpending_range(self.stream, self.group, min=message_id, max=message_id, count=1)
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def heartbeat(self, consumer: str, message_id: str) -> None:
+        """Resets the job's idle time so other workers don't claim it while it is still being processed."""
+        await self.redis.xclaim(self.stream, self.group, consumer, 0, [message_id], justid=True)
+
+    async def pending(self) -> int:
+        """Jobs waiting to be taken by a worker"""
+        return await self.redis.zcard(self.ready_keys[0])
+
+    async def ack(self, message_id: str) -> None:
+        await self.redis.xack(self.stream, self.group, message_id)
+
+    async def dead_letter(self, message_id: str, fields: dict, reason: str) -> None:
+        """Moves a job that keeps failing to the dead-letter stream and acknowledges it."""
+        await self.redis.xadd(self.dead_letter_stream, {**fields, "message_id": message_id, "reason": reason},
+                              maxlen=INGEST_STREAM_MAXLEN, approximate=True)
+        await self.ack(message_id)
+
+    async def close(self) -> None:
+        await self.redis.close()
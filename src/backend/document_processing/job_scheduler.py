@@ -0,0 +1,60 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable
+
+# --- In-process ingest scheduling ---
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv('INGEST_MAX_CONCURRENT_JOBS', max(2, (os.cpu_count() or 2) // 2)))
+
+
+class FairJobScheduler:
+    """
+    Runs document jobs on the event loop with at most `max_concurrent` in flight.
+
+    Jobs are queued per group (a batch upload, or a single upload on its own) and groups are
+    served round-robin, so a single upload submitted behind a 500-file batch starts as soon as
+    a slot frees up instead of waiting for the whole batch. PDF extraction runs in the shared
+    process pool, so several concurrent jobs keep every core busy.
+    """
+
+    def __init__(self, run_job: Callable[..., Awaitable[None]], max_concurrent: int = INGEST_MAX_CONCURRENT_JOBS):
+        self.run_job = run_job
+        self.max_concurrent = max(1, max_concurrent)
+        self._groups = OrderedDict() # group -> deque of job argument tuples
+        self._running = 0
+        self._tasks = set() # Keep references so running jobs aren't garbage collected
+
+    def submit(self, group: str, *job_args) -> None:
+        """Queues a job; must be called from the event loop."""
+        self._groups.setdefault(group, deque()).append(job_args)
+        self._dispatch()
+
+    @property
+    def pending(self) -> int:
+        return sum(len(jobs) for jobs in self._groups.values())
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrent and self._groups:
+            # Take one job from the group at the front, then move that group to the back
+            group, jobs = self._groups.popitem(last=False)
+            job_args = jobs.popleft()
+            if jobs:
+                self._groups[group] = jobs
+            self._running += 1
+            task = asyncio.create_task(self._run(job_args))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_args) -> None:
+        try:
+            await self.run_job(*job_args)
+        except Exception as e:
+            # run_job reports its own failures to the job's progress; keep the scheduler going
+            print(f"ERROR in scheduled ingest job {job_args}: {type(e).__name__}: {e}")
+        finally:
+            self._running -= 1
+            self._dispatch()
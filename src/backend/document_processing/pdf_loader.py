@@ -6,61 +6,164 @@ from tqdm import tqdm
 import json
 import redis
 import asyncio
+import inspect
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Callable, List, Optional, Tuple
 
 # Import the progress tracking module
 from src.backend.api.progress import create_job, update_job_progress, progress_complete_job, complete_job_sync # <-- Corrected this line
+from src.backend.document_processing.pdf_pages import count_pages, extract_page_range
+
+# --- Parallel extraction configuration ---
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 4)) # Small ranges let the first pages reach the consumer early
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 16)) # Below this the pool overhead isn't worth it
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared page extraction pool, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        # Use 'spawn' so workers don't inherit the API process' threads, sockets and locks
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        print(f"PDF extraction process pool started with {PDF_EXTRACT_WORKERS} workers")
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Shut down the shared page extraction pool (called on backend shutdown)."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
 
 class PDFLoader:
-    def __init__(self, pdf_directory, max_pages=None):
+    def __init__(self, pdf_directory, max_pages=None, parallel: Optional[bool] = None, pages_per_task: Optional[int] = None):
+        """
+        Args:
+            pdf_directory (str): Directory the PDFs live in.
+            max_pages (int): Optional cap on the number of pages extracted per PDF.
+            parallel (bool): Force (True) or disable (False) process pool extraction.
+                None picks parallel mode for documents with at least PDF_PARALLEL_MIN_PAGES pages.
+            pages_per_task (int): Number of pages each worker task extracts.
+        """
         self.pdf_directory = pdf_directory
         self.max_pages = max_pages
-        
-    async def extract_text_from_pdf(self, file_path, job_id=None): # <-- Make method async
-        text = ""
-        start_time = time.time()
-        try:
+        self.parallel = parallel
+        self.pages_per_task = max(1, pages_per_task or PDF_PAGES_PER_TASK)
+
+    def _use_parallel(self, pages_to_process: int) -> bool:
+        if self.parallel is not None:
+            return self.parallel and PDF_EXTRACT_WORKERS > 1
+        return PDF_EXTRACT_WORKERS > 1 and pages_to_process >= PDF_PARALLEL_MIN_PAGES
+
+    async def _report_progress(self, job_id, pages_done, pages_to_process, progress_callback):
+        """Push per-page progress to Redis and to the optional caller callback."""
+        if job_id:
+            await update_job_progress(job_id, pages_done)
+            # Log progress less frequently
+            if pages_done % max(1, pages_to_process // 20) == 0 or pages_done == pages_to_process:
+                percent = int((pages_done / pages_to_process) * 100)
+                print(f"  PDF Extract Progress: {pages_done}/{pages_to_process} ({percent}%)")
+        if progress_callback:
+            result = progress_callback(pages_done, pages_to_process)
+            if inspect.isawaitable(result):
+                await result
+
+    async def iter_page_texts(self, file_path, job_id=None, progress_callback: Optional[Callable] = None) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yields (page_index, page_text) tuples in page order.
+
+        Large documents are split into page ranges that run on the shared process pool,
+        each worker opening its own PdfReader. Only a bounded window of ranges is in flight
+        ahead of the consumer, so pages are not buffered faster than they are used.
+        progress_callback(pages_done, total_pages) may be sync or async.
+        """
+        loop = asyncio.get_running_loop()
+        total_pages = await loop.run_in_executor(None, count_pages, file_path)
+        pages_to_process = min(total_pages, self.max_pages) if self.max_pages else total_pages
+
+        # Create a progress tracking job
+        if job_id:
+            file_name = os.path.basename(file_path)
+            await create_job(job_id, file_name, pages_to_process)
+            print(f"Progress tracking initialized for job: {job_id} with {pages_to_process} pages")
+
+        if pages_to_process == 0:
+            return
+
+        if not self._use_parallel(pages_to_process):
+            # --- Sequential extraction, off the event loop ---
+            print(f"Starting PDF extraction of {pages_to_process} pages...")
             with open(file_path, 'rb') as file:
                 reader = PdfReader(file)
-                total_pages = len(reader.pages)
-                pages_to_process = min(total_pages, self.max_pages) if self.max_pages else total_pages
-
-                # Create a progress tracking job
-                if job_id:
-                    file_name = os.path.basename(file_path)
-                    create_job(job_id, file_name, pages_to_process)
-                    print(f"Progress tracking initialized for job: {job_id} with {pages_to_process} pages")
-
-                print(f"Starting PDF extraction of {pages_to_process} pages...")
-                # Use non-blocking tqdm if available, or remove if causing issues
-                # For simplicity, let's remove tqdm for now in the async context
-                # for i in tqdm(range(pages_to_process), desc="Extracting pages"):
                 for i in range(pages_to_process):
-                    # Extract text from page
-                    page = reader.pages[i]
-                    page_text = page.extract_text()
-                    if page_text: # Append only if text was extracted
-                        text += page_text + "\n"
+                    page_text = await loop.run_in_executor(None, lambda: reader.pages[i].extract_text() or "")
+                    await self._report_progress(job_id, i + 1, pages_to_process, progress_callback)
+                    yield i, page_text
+            return
 
-                    # Update progress after each page
-                    if job_id:
-                        current_page = i + 1
-                        # Properly await the async function
-                        await update_job_progress(job_id, current_page)
+        # --- Parallel extraction across the process pool ---
+        ranges = [(start, min(start + self.pages_per_task, pages_to_process))
+                  for start in range(0, pages_to_process, self.pages_per_task)]
+        max_in_flight = PDF_EXTRACT_WORKERS * 2
+        print(f"Starting parallel PDF extraction of {pages_to_process} pages in {len(ranges)} tasks...")
 
-                        # Log progress less frequently
-                        if current_page % max(1, pages_to_process // 20) == 0 or current_page == pages_to_process:
-                            percent = int((current_page / pages_to_process) * 100)
-                            print(f"  PDF Extract Progress: {current_page}/{pages_to_process} ({percent}%)")
+        pool = get_process_pool()
+        submitted = deque() # (future, start, end) in page order
+        next_range = 0
+        pages_done = 0
+        try:
+            while submitted or next_range < len(ranges):
+                # Keep a bounded window of ranges running ahead of the consumer
+                while next_range < len(ranges) and len(submitted) < max_in_flight:
+                    start, end = ranges[next_range]
+                    future = loop.run_in_executor(pool, extract_page_range, file_path, start, end)
+                    submitted.append((future, start, end))
+                    next_range += 1
+
+                future, start, end = submitted[0]
+                page_texts = await future
+                submitted.popleft()
+                # Progress advances page by page as the pages are handed on, like the sequential path
+                for offset, page_text in enumerate(page_texts):
+                    pages_done += 1
+                    await self._report_progress(job_id, pages_done, pages_to_process, progress_callback)
+                    yield start + offset, page_text
+        except BrokenProcessPool:
+            # A crashed worker poisons the pool; drop it so the next job gets a fresh one
+            shutdown_process_pool()
+            raise
+        finally:
+            for future, _, _ in submitted:
+                future.cancel()
 
-                    # Yield control to the event loop
-                    await asyncio.sleep(0) # <-- Add this line
+    async def extract_pages(self, file_path, job_id=None, progress_callback: Optional[Callable] = None) -> List[str]:
+        """Returns the text of every page, in page order."""
+        return [page_text async for _, page_text in self.iter_page_texts(file_path, job_id, progress_callback)]
 
-                print(f"PDF extraction completed in {time.time() - start_time:.2f} seconds")
+    async def extract_text_from_pdf(self, file_path, job_id=None, progress_callback: Optional[Callable] = None): # <-- Make method async
+        text = ""
+        start_time = time.time()
+        try:
+            page_texts = await self.extract_pages(file_path, job_id, progress_callback)
+            # Append only pages that produced text
+            text = "\n".join(page_text for page_text in page_texts if page_text)
+            print(f"PDF extraction completed in {time.time() - start_time:.2f} seconds")
 
         except Exception as e:
             print(f"ERROR extracting text from PDF: {type(e).__name__}: {str(e)}")
             if job_id:
                 # Use the sync version in exception handlers
-                complete_job_sync(job_id, f"Error during PDF extraction: {str(e)}", final_status="failed") 
+                complete_job_sync(job_id, f"Error during PDF extraction: {str(e)}", final_status="failed")
 
-        return text.strip()
\ No newline at end of file
+        return text.strip()
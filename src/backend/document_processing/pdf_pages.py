@@ -0,0 +1,26 @@
+from PyPDF2 import PdfReader
+from typing import List
+
+# NOTE: This module is imported by the page extraction worker processes.
+# Keep it free of backend imports (Redis, Neo4j, FastAPI) so spawning a worker stays cheap.
+
+
+def count_pages(file_path: str) -> int:
+    """Return the number of pages in a PDF file."""
+    with open(file_path, 'rb') as file:
+        return len(PdfReader(file).pages)
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) with a private PdfReader (runs inside a worker process)."""
+    texts = []
+    with open(file_path, 'rb') as file:
+        reader = PdfReader(file)
+        for i in range(start, end):
+            try:
+                texts.append(reader.pages[i].extract_text() or "")
+            except Exception as e:
+                # One broken page should not fail the whole range
+                print(f"ERROR extracting page {i + 1} of {file_path}: {type(e).__name__}: {e}")
+                texts.append("")
+    return texts
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, Iterator, List, Optional
 import re
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
@@ -50,4 +50,52 @@ class TextProcessor:
         if verbose:
             print(f"Returning {len(cleaned_chunks)} non-empty chunks.")
 
-        return cleaned_chunks
\ No newline at end of file
+        return cleaned_chunks
+
+    def iter_chunks(self, texts: Iterable[str]) -> Iterator[str]:
+        """Chunks a stream of texts (e.g. pages) incrementally, without joining them into one string."""
+        buffer = ChunkBuffer(self)
+        for text in texts:
+            yield from buffer.feed(text)
+        yield from buffer.flush()
+
+
+class ChunkBuffer:
+    """
+    Incremental chunker used by the streaming ingestion pipeline.
+
+    Cleaned text is buffered until it is a few chunks long, split, and every chunk except the
+    last is emitted. The last (possibly partial) chunk is carried over and re-split together
+    with the next text, so chunk boundaries match what a single split would have produced
+    closely while memory stays bounded by `flush_chars`.
+    """
+
+    def __init__(self, processor: TextProcessor, flush_chars: Optional[int] = None):
+        self.processor = processor
+        self.flush_chars = flush_chars or processor.chunk_size * 8
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Adds text to the buffer and returns any chunks that are complete."""
+        cleaned = self.processor.clean_text(text)
+        if not cleaned:
+            return []
+        self._buffer = f"{self._buffer}\n{cleaned}" if self._buffer else cleaned
+        if len(self._buffer) < self.flush_chars:
+            return []
+
+        chunks = self.processor.splitter.split_text(self._buffer)
+        if not chunks:
+            self._buffer = ""
+            return []
+        # Keep the last chunk: it may continue in the next text
+        self._buffer = chunks[-1]
+        return [chunk.strip() for chunk in chunks[:-1] if chunk.strip()]
+
+    def flush(self) -> List[str]:
+        """Returns the remaining chunks once the input is exhausted."""
+        if not self._buffer:
+            return []
+        chunks = self.processor.splitter.split_text(self._buffer)
+        self._buffer = ""
+        return [chunk.strip() for chunk in chunks if chunk.strip()]
@@ -5,8 +5,11 @@ from typing import Optional
 # Import assistant classes directly
 from src.backend.assistant.rag import RAGAssistant
 from src.backend.assistant.graph_rag import GraphRAGAssistant
+from src.backend.assistant.answer_cache import AnswerCache
+from src.backend.document_processing.pdf_loader import shutdown_process_pool
+from src.backend.database.neo4j_client import close_drivers, close_async_drivers
+from src.backend.api.websocket import router as websocket_router, broadcaster as progress_broadcaster
 # Import router AFTER app creation below
-# REMOVE: from src.backend.api.websocket import router as websocket_router
 
 app = FastAPI(title="Intelligent PDF Retriever Backend")
 
@@ -23,6 +26,7 @@ app.add_middleware(
 class AppState:
     rag_assistant_instance: Optional[RAGAssistant] = None
     graph_rag_assistant_instance: Optional[GraphRAGAssistant] = None
+    answer_cache: Optional[AnswerCache] = None
 
 app.state = AppState() # Initialize state
 
@@ -33,19 +37,29 @@ async def startup_event():
     # Store instances in app.state
     app.state.rag_assistant_instance = RAGAssistant()
     app.state.graph_rag_assistant_instance = GraphRAGAssistant()
+    # Answer cache shares the RAG assistant's query embedding model for similarity lookups
+    app.state.answer_cache = AnswerCache(embed_query=app.state.rag_assistant_instance.embeddings.embed_query)
     print("Assistants initialized.")
+    # One Redis subscription per backend feeds all progress websockets
+    progress_broadcaster.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # Add cleanup logic if needed
+    await progress_broadcaster.stop()
+    if app.state.rag_assistant_instance and app.state.rag_assistant_instance.local_index_sync:
+        app.state.rag_assistant_instance.local_index_sync.stop()
+    shutdown_process_pool()
+    close_drivers()
+    await close_async_drivers()
     print("Shutting down backend.")
 
 # Import and include the router AFTER app and state are defined
 from src.backend.api.endpoints import router as api_router
 app.include_router(api_router, prefix="/api")
 
-# REMOVE: Mount WebSocket routes directly (without the /api prefix)
-# REMOVE: app.include_router(websocket_router)
+# Mount WebSocket routes directly (without the /api prefix)
+app.include_router(websocket_router)
 
 @app.get("/")
 async def read_root():
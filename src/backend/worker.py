@@ -0,0 +1,113 @@
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import traceback
+
+from src.backend.api.progress import progress_complete_job
+from src.backend.document_processing.ingest_job import process_document, RETRYABLE_ERRORS
+from src.backend.document_processing.job_queue import IngestQueue, INGEST_VISIBILITY_TIMEOUT
+from src.backend.document_processing.pdf_loader import shutdown_process_pool
+from src.backend.database.neo4j_client import close_drivers, close_async_drivers
+
+# Load environment variables
+load_dotenv()
+
+# Standalone ingestion worker: consumes upload jobs from the Redis Stream queue so PDF parsing and
+# embedding don't compete with chat requests in the API process. Run any number of these, on any
+# machine that can reach Redis, Neo4j and the uploaded files (data/pdf_files):
+#   python -m src.backend.worker --concurrency 2
+
+
+async def _keep_claim(queue: IngestQueue, consumer: str, message_id: str) -> None:
+    """Heartbeats the job well within the visibility timeout while it is processed."""
+    interval = max(1, queue.visibility_timeout_ms / 1000 / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await queue.heartbeat(consumer, message_id)
+        except Exception as e:
+            print(f"WARNING: Heartbeat for {message_id} failed: {type(e).__name__}: {e}")
+
+
+async def handle_job(queue: IngestQueue, consumer: str, message_id: str, fields: dict) -> None:
+    job_id = fields.get("job_id")
+    deliveries = await queue.delivery_count(message_id)
+    if deliveries > queue.max_deliveries:
+        # Worker(s) crashed or hit transient errors on this job repeatedly; stop retrying it
+        reason = f"Gave up after {deliveries - 1} attempts"
+        print(f"ERROR: Job {job_id} ({message_id}): {reason}, moving to dead-letter stream")
+        await queue.dead_letter(message_id, fields, reason)
+        await progress_complete_job(job_id, f"Failed: {reason}", final_status="failed")
+        return
+
+    print(f"[{consumer}] Processing job {job_id} ({fields.get('filename')}), attempt {deliveries}")
+    heartbeat = asyncio.create_task(_keep_claim(queue, consumer, message_id))
+    try:
+        # Marks the job completed/failed in progress.py itself; transient errors are raised
+        # while attempts remain (the last attempt marks the job failed instead)
+        await process_document(fields["file_path"], fields["filename"], job_id, fields.get("content_hash") or None,
+                               raise_retryable=deliveries < queue.max_deliveries)
+    except RETRYABLE_ERRORS as e:
+        # Not acknowledged: claimed again by a worker once the visibility timeout has passed
+        print(f"WARNING: Job {job_id} ({message_id}) will be retried after {type(e).__name__}: {e}")
+        return
+    finally:
+        heartbeat.cancel()
+    await queue.ack(message_id)
+
+
+async def consume(queue: IngestQueue, consumer: str, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            job = await queue.next_job(consumer)
+            if job is not None:
+                await handle_job(queue, consumer, *job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Unacknowledged jobs are retried by whichever worker claims them after the timeout
+            print(f"ERROR in worker {consumer}: {type(e).__name__}: {e}")
+            traceback.print_exc()
+            await asyncio.sleep(1)
+
+
+async def run_worker(name: str, concurrency: int) -> None:
+    queue = IngestQueue()
+    await queue.ensure_group()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            # Finish the current jobs, then exit
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass # Not supported on Windows event loops
+
+    print(f"Ingest worker '{name}' started with {concurrency} consumer(s), visibility timeout {INGEST_VISIBILITY_TIMEOUT}s")
+    consumers = [asyncio.create_task(consume(queue, f"{name}-{i}", stop)) for i in range(concurrency)]
+    try:
+        await asyncio.gather(*consumers)
+    finally:
+        await queue.close()
+        await close_async_drivers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consume document ingestion jobs from the Redis queue')
+    parser.add_argument('--name', default=os.getenv('INGEST_WORKER_NAME', socket.gethostname()), help='Consumer name prefix (default: hostname)')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('INGEST_WORKER_CONCURRENCY', 1)), help='Jobs processed at the same time by this worker (default: 1)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_worker(args.name, args.concurrency))
+    finally:
+        shutdown_process_pool()
+        close_drivers()
+        print("Ingest worker stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,12 @@ import os
 import json
 from datetime import datetime
 import logging
-from typing import Optional
+from typing import Callable, Optional
+
+try:
+    import websocket # websocket-client; progress falls back to polling without it
+except ImportError:
+    websocket = None
 
 
 try:
@@ -20,6 +25,7 @@ except Exception as e:
 
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8000")
 print(f"Using backend URL: {BACKEND_URL}")
+BACKEND_WS_URL = BACKEND_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
 
 
 def check_services_ready():
@@ -66,6 +72,33 @@ def call_chat_api(question: str, use_graph: bool = False, temperature: Optional[
         return None
 
 
+def stream_chat_api(question: str, use_graph: bool = False, temperature: Optional[float] = None, max_tokens: Optional[int] = None):
+    """
+    Calls the streaming chat endpoint and yields (event, data) pairs as they arrive.
+
+    The backend sends 'sources' first, then 'token' events, then 'done' or 'error'.
+    """
+    chat_url = f"{BACKEND_URL}/api/chat/stream"
+    payload = {"question": question, "use_graph": use_graph}
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+
+    print(f"DEBUG: Calling streaming chat API with payload: {payload}")
+    # (connect timeout, read timeout between events)
+    with requests.post(chat_url, json=payload, stream=True, timeout=(10, 180)) as response:
+        response.raise_for_status()
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = "message" # Blank line ends an event
+                continue
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):].strip())
+
 def poll_progress(job_id):
     try:
         progress_url = f"{BACKEND_URL}/api/progress/{job_id}"
@@ -123,6 +156,43 @@ def poll_progress(job_id):
         return True # Continue polling loop
 
 
+def watch_progress_ws(job_id: str, on_update: Callable[[dict], None]) -> bool:
+    """
+    Follows a job over the backend's progress websocket, calling on_update for every pushed update.
+
+    Returns True once the job reaches a final status, False if the websocket is unavailable
+    (the caller then falls back to polling).
+    """
+    if websocket is None:
+        return False
+    ws_url = f"{BACKEND_WS_URL}/ws/progress/{job_id}"
+    try:
+        ws = websocket.create_connection(ws_url, timeout=30)
+    except Exception as e:
+        print(f"DEBUG: Progress websocket unavailable ({e}), falling back to polling.")
+        return False
+    try:
+        while True:
+            try:
+                message = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                ws.send("ping") # Keep the connection alive while a long step runs
+                continue
+            if message == "pong":
+                continue
+            data = json.loads(message)
+            st.session_state.progress_data = data
+            on_update(data)
+            if data.get("status") in ["completed", "failed", "error"]:
+                print(f"DEBUG: Job {job_id} status is {data.get('status')}. Stopping processing.")
+                st.session_state.processing_active = False
+                return True
+    except Exception as e:
+        print(f"DEBUG: Progress websocket error: {e}, falling back to polling.")
+        return False
+    finally:
+        ws.close()
+
 def main():
 
     wait_placeholder = st.empty()
@@ -146,6 +216,7 @@ def main():
         ("chat_history", []),
         ("user_question", ""),
         ("last_poll_time", 0),
+        ("progress_ws_failed", False),
     ]:
         if key not in st.session_state:
             st.session_state[key] = default
@@ -153,7 +224,8 @@ def main():
 
 
     needs_rerun_for_poll = False
-    if st.session_state.processing_active and st.session_state.current_job_id:
+    # Progress is pushed over a websocket (see the end of main); poll only if that isn't available
+    if st.session_state.processing_active and st.session_state.current_job_id and st.session_state.progress_ws_failed:
         current_time = time.time()
         # Poll every 2 seconds
         if current_time - st.session_state.last_poll_time >= 2.0:
@@ -200,9 +272,10 @@ def main():
 
         if st.session_state.uploaded_file_info is None or st.session_state.uploaded_file_info["name"] != uploaded_file.name:
             print(f"DEBUG: New file selected: {uploaded_file.name}")
+            # Only metadata is kept; the bytes stay in the uploader widget and are streamed on upload
             st.session_state.uploaded_file_info = {
                 "name": uploaded_file.name,
-                "bytes": uploaded_file.getvalue()
+                "size": uploaded_file.size
             }
 
             st.session_state.current_job_id = None
@@ -210,6 +283,7 @@ def main():
             st.session_state.processing_active = False
             st.session_state.chat_history = []
             st.session_state.last_poll_time = 0
+            st.session_state.progress_ws_failed = False
             st.rerun()
 
 
@@ -232,12 +306,19 @@ def main():
             st.session_state.progress_data = None
             st.session_state.chat_history = []
             st.session_state.last_poll_time = 0
+            st.session_state.progress_ws_failed = False
             st.rerun()
 
 
     if st.session_state.processing_active and st.session_state.current_job_id is None and st.session_state.uploaded_file_info:
         print("DEBUG: Entering upload logic block.")
-        files = {"file": (st.session_state.uploaded_file_info["name"], st.session_state.uploaded_file_info["bytes"], "application/pdf")}
+        if uploaded_file is None:
+            st.error("The selected file is no longer available. Please select it again.")
+            st.session_state.processing_active = False
+            st.session_state.uploaded_file_info = None
+            st.rerun()
+        uploaded_file.seek(0)
+        files = {"file": (st.session_state.uploaded_file_info["name"], uploaded_file, uploaded_file.type or "application/octet-stream")}
         upload_container = st.empty()
         with upload_container, st.status("Uploading file...", expanded=True) as status:
             try:
@@ -251,13 +332,21 @@ def main():
                     print(f"DEBUG: Upload successful, job ID: {job_id}")
                     st.session_state.current_job_id = job_id
 
-                    st.session_state.progress_data = {
-                        "job_id": job_id, "status": "starting",
-                        "message": "Upload successful. Starting processing...",
-                        "percent_complete": 0
-                    }
+                    if resp_json.get("duplicate"):
+                        # Same content was ingested before; the backend skipped processing
+                        st.session_state.progress_data = {
+                            "job_id": job_id, "status": "completed",
+                            "message": f"Already processed as document '{resp_json.get('document_id')}'",
+                            "percent_complete": 100
+                        }
+                    else:
+                        st.session_state.progress_data = {
+                            "job_id": job_id, "status": "starting",
+                            "message": "Upload successful. Starting processing...",
+                            "percent_complete": 0
+                        }
                     st.session_state.last_poll_time = time.time()
-                    st.session_state.processing_active = True
+                    st.session_state.processing_active = not resp_json.get("duplicate", False)
                     status.update(label="✅ Upload successful", state="complete", expanded=False)
                     print("DEBUG: Triggering rerun to start polling.")
                     st.rerun()
@@ -297,11 +386,18 @@ def main():
         progress_container = st.container()
         with progress_container:
             if status_value not in ["completed", "failed", "error"]:
-                st.info(f"Status: {status_value} - {message}")
-
-                progress_value_int = max(0, min(100, int(percent)))
-                st.progress(progress_value_int / 100.0)
-                st.text(f"{progress_value_int}%")
+                # Placeholders so websocket updates can redraw in place without a rerun
+                status_placeholder = st.empty()
+                bar_placeholder = st.empty()
+                percent_placeholder = st.empty()
+
+                def render_progress(update: dict):
+                    progress_value_int = max(0, min(100, int(update.get("percent_complete", 0))))
+                    status_placeholder.info(f"Status: {update.get('status', 'processing')} - {update.get('message', 'Processing...')}")
+                    bar_placeholder.progress(progress_value_int / 100.0)
+                    percent_placeholder.text(f"{progress_value_int}%")
+
+                render_progress(data)
             elif status_value == "completed":
                 st.success("✅ Processing Complete!")
                 st.progress(1.0)
@@ -372,20 +468,41 @@ def main():
                 "timestamp": user_msg_timestamp # Add timestamp for unique keys
             })
 
-            # Call API with parameters from sidebar
-            with st.spinner("Thinking..."):
-                response_data = call_chat_api(
-                    st.session_state.user_question,
-                    use_graph=False, # Add toggle later if needed
-                    temperature=st.session_state.llm_temp,
-                    max_tokens=st.session_state.llm_max_tokens
-                )
+            # Stream the answer into the chat as tokens arrive
+            answer = ""
+            sources = []
+            error_message = None
+            with chat_container:
+                with st.chat_message("user"):
+                    st.markdown(st.session_state.user_question)
+                with st.chat_message("assistant"):
+                    answer_placeholder = st.empty()
+                    answer_placeholder.markdown("Thinking...")
+                    try:
+                        for event, data in stream_chat_api(
+                            st.session_state.user_question,
+                            use_graph=False, # Add toggle later if needed
+                            temperature=st.session_state.llm_temp,
+                            max_tokens=st.session_state.llm_max_tokens
+                        ):
+                            if event == "sources":
+                                sources = data.get("sources", [])
+                            elif event == "token":
+                                answer += data.get("text", "")
+                                answer_placeholder.markdown(answer + "▌")
+                            elif event == "error":
+                                error_message = data.get("detail", "Error communicating with the backend.")
+                        answer_placeholder.markdown(answer)
+                    except requests.exceptions.RequestException as e:
+                        st.error(f"Chat API error: {e}")
+                        error_message = "Error communicating with the backend."
+                    except Exception as e:
+                        st.error(f"An unexpected error occurred: {e}")
+                        error_message = "Error communicating with the backend."
 
             # Append assistant response
             assistant_msg_timestamp = time.time()
-            if response_data:
-                answer = response_data.get("answer", "Sorry, I couldn't find an answer.")
-                sources = response_data.get("sources", [])
+            if answer:
                 st.session_state.chat_history.append({
                     "role": "assistant",
                     "content": answer,
@@ -395,7 +512,7 @@ def main():
             else:
                  st.session_state.chat_history.append({
                      "role": "assistant",
-                     "content": "Error communicating with the backend.",
+                     "content": error_message or "Sorry, I couldn't find an answer.",
                      "timestamp": assistant_msg_timestamp
                  })
 
@@ -403,6 +520,13 @@ def main():
             st.rerun() # Rerun to display new messages
 
 
+    # Follow the running job over the websocket; the UI above is updated in place
+    if st.session_state.processing_active and st.session_state.current_job_id and not st.session_state.progress_ws_failed \
+            and st.session_state.progress_data and st.session_state.progress_data.get("status") not in ["completed", "failed", "error"]:
+        if not watch_progress_ws(st.session_state.current_job_id, render_progress):
+            st.session_state.progress_ws_failed = True
+        st.rerun() # Show the final state (or start polling)
+
     if needs_rerun_for_poll:
         time.sleep(0.5)
         st.rerun()
@@ -0,0 +1,71 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("requests")
+pytest.importorskip("tqdm")
+
+from add_embeddings import TokenBucket, vector_index_dimensions
+
+
+def test_burst_up_to_capacity_is_immediate():
+    bucket = TokenBucket(rate=1.0, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+def test_acquire_waits_for_the_refill():
+    bucket = TokenBucket(rate=20.0, capacity=1)
+    bucket.acquire()
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start == pytest.approx(0.05, abs=0.04)
+
+
+def test_oversized_requests_wait_for_a_full_bucket():
+    bucket = TokenBucket(rate=100.0, capacity=10)
+    start = time.monotonic()
+    bucket.acquire(1000) # Would otherwise never be satisfied
+    assert time.monotonic() - start < 0.1
+
+
+def test_drain_pauses_every_caller():
+    bucket = TokenBucket(rate=100.0, capacity=10)
+    bucket.drain(0.1)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.1
+
+
+def test_rate_holds_across_threads():
+    bucket = TokenBucket(rate=50.0, capacity=1)
+    bucket.acquire()
+    start = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 10 more tokens at 50/s take about 0.2s however the threads interleave
+    assert time.monotonic() - start >= 0.18
+
+
+def test_vector_index_dimensions():
+    class Neo4j:
+        def __init__(self, records):
+            self.records = records
+
+        def run_query(self, query, parameters=None):
+            return self.records
+
+    assert vector_index_dimensions(Neo4j([{"dimensions": 384}]), "chunk_embeddings") == 384
+    assert vector_index_dimensions(Neo4j([]), "chunk_embeddings") is None
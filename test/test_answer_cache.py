@@ -0,0 +1,99 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import src.backend.assistant.answer_cache as answer_cache
+from src.backend.assistant.answer_cache import AnswerCache
+
+PARAMS = {"temperature": 0.1}
+VOCABULARY = ["warranty", "period", "shipping", "returns", "pricing", "policy", "page", "12"]
+
+
+def embed(question):
+    """Bag of words over a small vocabulary: rewordings of a question get the same vector"""
+    vector = np.full(len(VOCABULARY), 0.01, dtype=np.float32)
+    for word in question.lower().replace("?", "").split():
+        if word in VOCABULARY:
+            vector[VOCABULARY.index(word)] += 1.0
+    return vector
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(answer_cache, "get_corpus_version", lambda: 0)
+    return fakeredis.FakeServer()
+
+
+def cache(server, **kwargs):
+    return AnswerCache(embed, redis_client=fakeredis.FakeRedis(server=server), **kwargs)
+
+
+class ReloadCounter:
+    """Counts full reloads of the :vectors hash (HGETALL, sent in a pipeline)"""
+
+    def __init__(self, client):
+        self.calls = 0
+        pipeline = client.pipeline
+
+        def counting_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            hgetall = pipe.hgetall
+
+            def counting_hgetall(*hgetall_args):
+                self.calls += 1
+                return hgetall(*hgetall_args)
+
+            pipe.hgetall = counting_hgetall
+            return pipe
+
+        client.pipeline = counting_pipeline
+
+
+def test_exact_and_semantic_hits(server):
+    answers = cache(server, similarity_threshold=0.9)
+    answers.put("What is the warranty period?", "rag", PARAMS, "Two years", ["a.pdf"])
+    assert answers.get("what is the warranty period", "rag", PARAMS)["answer"] == "Two years"
+    assert answers.get("What's the warranty period?", "rag", PARAMS)["answer"] == "Two years"
+    assert answers.get("What is on page 12?", "rag", PARAMS) is None
+    assert answers.stats() == {"hits": 2, "semantic_hits": 1, "misses": 1}
+
+
+def test_entries_from_other_processes_are_appended_without_reloading(server):
+    writer, reader = cache(server, similarity_threshold=0.9), cache(server, similarity_threshold=0.9)
+    writer.put("What is the warranty period?", "rag", PARAMS, "Two years", [])
+    assert reader.get("What's the warranty period?", "rag", PARAMS) is not None
+    reloads = ReloadCounter(reader.redis)
+
+    for topic in ("shipping", "returns", "pricing"):
+        writer.put(f"What is the {topic} policy?", "rag", PARAMS, topic, [])
+    assert reader.get("What's the returns policy?", "rag", PARAMS)["answer"] == "returns"
+    assert reader.get("What's the pricing policy?", "rag", PARAMS)["answer"] == "pricing"
+    assert reloads.calls == 0
+    assert server_generation(reader) is None # Puts alone never bump the generation
+
+
+def test_eviction_reloads_the_matrix(server):
+    writer, reader = cache(server, max_entries=2, similarity_threshold=0.9), cache(server, similarity_threshold=0.9)
+    writer.put("What is the warranty period?", "rag", PARAMS, "Two years", [])
+    assert reader.get("What's the warranty period?", "rag", PARAMS) is not None
+    writer.put("What is the shipping policy?", "rag", PARAMS, "shipping", [])
+    writer.put("What is the returns policy?", "rag", PARAMS, "returns", []) # Evicts the warranty answer
+    reloads = ReloadCounter(reader.redis)
+
+    assert reader.get("What's the warranty period?", "rag", PARAMS) is None
+    assert reader.get("What's the returns policy?", "rag", PARAMS)["answer"] == "returns"
+    assert reloads.calls == 1
+    keys, _ = reader._load_matrix(reader._scope("rag", PARAMS))
+    assert len(keys) == 2
+
+
+def server_generation(answers):
+    return answers.redis.get(f"{answers._scope('rag', PARAMS)}:gen")
@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("langchain_openai")
+
+from langchain_core.documents import Document
+from src.backend.assistant.context_builder import build_context, merge_neighbours, section_text, overlap_length
+from src.backend.document_processing.embedding_client import estimate_tokens
+
+OVERLAP = "the shared overlap between neighbouring chunks "
+
+
+def chunk(doc_id, chunk_index, text):
+    return Document(page_content=text, metadata={"doc_id": doc_id, "chunk_index": chunk_index})
+
+
+def test_consecutive_chunks_are_merged_in_document_order():
+    docs = [chunk("d1", 2, "third"), chunk("other", 0, "elsewhere"), chunk("d1", 1, "second")]
+    sections = merge_neighbours(docs)
+    assert [[doc.page_content for doc in section] for section in sections] == [["second", "third"], ["elsewhere"]]
+
+
+def test_bridging_chunk_joins_two_sections():
+    docs = [chunk("d1", 0, "a"), chunk("d1", 2, "c"), chunk("d1", 1, "b")]
+    sections = merge_neighbours(docs)
+    assert [[doc.page_content for doc in section] for section in sections] == [["a", "b", "c"]]
+
+
+def test_duplicates_and_unpositioned_chunks():
+    docs = [chunk("d1", 0, "same"), chunk("d2", 5, "same"), Document(page_content="loose", metadata={})]
+    assert [[doc.page_content for doc in section] for section in merge_neighbours(docs)] == [["same"], ["loose"]]
+
+
+def test_overlap_is_removed_when_merging():
+    first = "Beginning of the section, " + OVERLAP
+    second = OVERLAP + "and the rest of it."
+    assert overlap_length(first, second) == len(OVERLAP)
+    assert section_text([chunk("d1", 0, first), chunk("d1", 1, second)]) == \
+        "Beginning of the section, " + OVERLAP + "and the rest of it."
+
+
+def test_context_stays_within_budget():
+    docs = [chunk(f"d{i}", 0, f"Sentence number {i}. " * 20) for i in range(10)]
+    context = build_context(docs, max_tokens=300)
+    assert 0 < estimate_tokens(context) <= 300
+    # Sections are packed in retrieval order
+    assert context.startswith("Sentence number 0.")
+    assert "Sentence number 9." not in context
+
+
+def test_context_fits_everything_under_a_large_budget():
+    docs = [chunk("d1", 0, "alpha"), chunk("d2", 0, "beta")]
+    assert build_context(docs, max_tokens=1000) == "alpha\n\nbeta"
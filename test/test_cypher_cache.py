@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("langchain_core")
+
+from src.backend.assistant.cypher_cache import match_template, TEMPLATE_RESULT_LIMIT
+
+
+def intent(question):
+    matched = match_template(question)
+    return matched[0].intent if matched else None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("How many documents are there?", "count_documents"),
+    ("how many PDFs have been uploaded", "count_documents"),
+    ("List all the files", "list_documents"),
+    ("Which documents are available?", "list_documents"),
+    ("How many chunks?", "count_chunks"),
+    ("How many chunks are in report.pdf?", "count_document_chunks"),
+    ("Which docs mention vector indexes?", "documents_mentioning"),
+])
+def test_common_questions_match_their_template(question, expected):
+    assert intent(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    "What does the report say about revenue?",
+    "How many documents mention budgets in 2023 and why?",
+    "Tell me how many documents there are and summarize them",
+])
+def test_other_questions_fall_back_to_the_llm(question):
+    assert intent(question) is None
+
+
+def test_parameters_are_extracted_and_transformed():
+    _, params = match_template('How many chunks does the document "Annual Report" have?')
+    assert params == {"document": "annual report", "limit": TEMPLATE_RESULT_LIMIT}
+
+    _, params = match_template("Which files talk about C++ AND part-no: 12?")
+    # Lucene operators in the question can't change the full-text query
+    assert params["terms"] == "c\\+\\+ and part\\-no\\: 12"
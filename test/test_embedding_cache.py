@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import src.backend.document_processing.embedding_cache as embedding_cache
+from src.backend.document_processing.embedding_cache import CachedEmbeddings, chunk_hash
+
+
+class Embeddings:
+    """Stands in for OpenAIEmbeddings pointed at LM Studio"""
+    model = "text-embedding-ada-002" # The client default, whatever LM Studio serves
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.requests = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        return [[float(len(text))] * self.dimension for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(embedding_cache, "get_redis_connection", lambda decode_responses=True: client)
+    monkeypatch.delenv("EMBEDDING_MODEL_NAME", raising=False)
+    return client
+
+
+def test_repeated_chunks_are_served_from_the_cache():
+    client = Embeddings(4)
+    cached = CachedEmbeddings(client, model_name="minilm")
+    first = cached.embed_documents(["alpha", "beta", "alpha"])
+    again = cached.embed_documents(["beta", "alpha  "]) # Same text after whitespace normalization
+    assert again == [first[1], first[0]]
+    # One dimension probe, then only distinct misses
+    assert client.requests[1:] == [["alpha", "beta"]]
+    assert cached.stats() == {"hits": 2, "misses": 3}
+    assert chunk_hash("alpha") == chunk_hash("alpha  ")
+
+
+def test_swapped_model_of_another_dimension_misses():
+    CachedEmbeddings(Embeddings(4)).embed_documents(["alpha"])
+    swapped = Embeddings(8)
+    vectors = CachedEmbeddings(swapped).embed_documents(["alpha"])
+    assert len(vectors[0]) == 8
+    assert swapped.requests[-1] == ["alpha"]
+
+
+def test_model_name_setting_namespaces_the_cache(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "model-a")
+    CachedEmbeddings(Embeddings(4)).embed_documents(["alpha"])
+    monkeypatch.setenv("EMBEDDING_MODEL_NAME", "model-b")
+    other = Embeddings(4)
+    CachedEmbeddings(other).embed_documents(["alpha"])
+    assert other.requests[-1] == ["alpha"]
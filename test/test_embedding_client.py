@@ -0,0 +1,59 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+from src.backend.document_processing.embedding_client import AdaptiveBatchSizer, AsyncEmbeddingClient, create_token_aware_batches
+
+
+def sizer(initial_tokens=2000):
+    return AdaptiveBatchSizer(initial_tokens=initial_tokens, min_tokens=500, max_tokens=4000, target_latency=2.0)
+
+
+def test_budget_grows_on_fast_full_requests():
+    batch_sizer = sizer()
+    batch_sizer.record(tokens=2000, latency=0.5)
+    assert batch_sizer.token_budget == 2500
+    # Fast but mostly empty requests say nothing about larger ones
+    batch_sizer.record(tokens=100, latency=0.1)
+    assert batch_sizer.token_budget == 2500
+
+
+def test_budget_halves_on_slow_requests_and_failures():
+    batch_sizer = sizer()
+    batch_sizer.record(tokens=2000, latency=5.0)
+    assert batch_sizer.token_budget == 1000
+    batch_sizer.record_failure()
+    batch_sizer.record_failure()
+    assert batch_sizer.token_budget == 500 # Never below the minimum
+
+
+def test_budget_is_capped():
+    batch_sizer = sizer(initial_tokens=3900)
+    for _ in range(5):
+        batch_sizer.record(tokens=batch_sizer.token_budget, latency=0.1)
+    assert batch_sizer.token_budget == 4000
+
+
+def test_batches_respect_the_token_budget():
+    texts = ["x" * 400] * 10 # ~101 tokens each
+    batches = create_token_aware_batches(texts, 250)
+    assert [len(batch) for batch in batches] == [2, 2, 2, 2, 2]
+    assert [i for batch in batches for i in batch] == list(range(10))
+    # A text over the budget still gets a batch of its own
+    assert create_token_aware_batches(["x" * 4000, "y"], 250) == [[0], [1]]
+
+
+def test_async_client_keeps_input_order():
+    class Embeddings:
+        def embed_documents(self, texts):
+            return [[float(text)] for text in texts]
+
+    client = AsyncEmbeddingClient(Embeddings(), max_in_flight=3, batch_sizer=sizer(initial_tokens=500))
+    texts = [str(i) * 300 for i in range(1, 10)]
+    vectors = asyncio.run(client.embed_documents(texts))
+    assert vectors == [[float(text)] for text in texts]
+    assert client.requests > 1
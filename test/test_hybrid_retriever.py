@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("langchain_core")
+
+from src.backend.assistant.hybrid_retriever import reciprocal_rank_fusion, escape_lucene
+
+
+def hits(*ids):
+    return [{"id": chunk_id, "text": f"text {chunk_id}"} for chunk_id in ids]
+
+
+def test_hits_in_both_lists_rank_first():
+    fused = reciprocal_rank_fusion([hits("a", "b", "c"), hits("c", "d")], k=60)
+    assert [hit["id"] for hit in fused][:1] == ["c"]
+    assert fused[0]["ranks"] == {0: 3, 1: 1}
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_single_list_keeps_its_order():
+    fused = reciprocal_rank_fusion([hits("a", "b", "c"), []])
+    assert [hit["id"] for hit in fused] == ["a", "b", "c"]
+    assert fused[0]["text"] == "text a"
+
+
+def test_fusion_ignores_raw_scores():
+    vector = [{"id": "a", "score": 0.99}, {"id": "b", "score": 0.98}]
+    fulltext = [{"id": "b", "score": 42.0}, {"id": "a", "score": 0.1}]
+    fused = reciprocal_rank_fusion([vector, fulltext])
+    # Same ranks in mirrored order: a tie, whatever the score scales
+    assert fused[0]["rrf_score"] == pytest.approx(fused[1]["rrf_score"])
+
+
+def test_escape_lucene_keeps_terms_and_neutralises_operators():
+    assert escape_lucene("AND part-no 12/34?") == "and part\\-no 12\\/34\\?"
@@ -0,0 +1,148 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("langchain")
+pytest.importorskip("tqdm")
+pytest.importorskip("chardet")
+
+import src.backend.document_processing.ingest_pipeline as ingest_pipeline
+from src.backend.document_processing.ingest_pipeline import IngestPipeline, chunk_ids_for_hashes, make_chunk_id
+from src.backend.document_processing.text_processor import TextProcessor
+from src.backend.document_processing.embedding_cache import chunk_hash
+
+
+class LineSplitter:
+    """One chunk per line, so the chunks of a test document are known in advance"""
+
+    def split_text(self, text):
+        return [line for line in text.split("\n") if line]
+
+
+class FakeNeo4j:
+    """Just enough of Neo4jClient.run_query for the pipeline's queries"""
+
+    def __init__(self):
+        self.documents = {}
+        self.chunks = {}
+        self.written_ids = []
+
+    def run_query(self, query, parameters=None):
+        parameters = parameters or {}
+        if query == ingest_pipeline.MANIFEST_QUERY:
+            document = self.documents.get(parameters["doc_id"])
+            return [{key: document.get(key) for key in ("chunk_hashes", "chunk_ids", "chunk_indexes")}] if document is not None else []
+        if query.startswith("MERGE (d:Document"):
+            self.documents.setdefault(parameters["doc_id"], {})
+        elif query == ingest_pipeline.CHUNK_WRITE_QUERY:
+            for row in parameters["batch"]:
+                self.chunks[row["chunk_id"]] = dict(row)
+                self.written_ids.append(row["chunk_id"])
+        elif query == ingest_pipeline.CHUNK_REINDEX_QUERY:
+            for row in parameters["batch"]:
+                self.chunks[row["chunk_id"]]["chunk_index"] = row["chunk_index"]
+        elif query == ingest_pipeline.MANIFEST_WRITE_QUERY:
+            self.documents[parameters["doc_id"]].update(chunk_hashes=parameters["chunk_hashes"], chunk_ids=parameters["keep_ids"],
+                                                        chunk_indexes=parameters["chunk_indexes"])
+            deleted = [chunk_id for chunk_id in self.chunks if chunk_id not in parameters["keep_ids"]]
+            for chunk_id in deleted:
+                del self.chunks[chunk_id]
+            return [{"deleted": len(deleted), "deleted_ids": deleted}]
+        return []
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.embedded = []
+        self.failing = set() # Texts the "server" errors on
+
+    def embed_documents(self, texts):
+        if self.failing.intersection(texts):
+            raise ConnectionError("embedding server unavailable")
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, "bump_corpus_version", lambda: 1)
+    monkeypatch.setattr(ingest_pipeline, "LOCAL_VECTOR_INDEX", False)
+    monkeypatch.setattr(IngestPipeline, "_schema_ready", True)
+    text_processor = TextProcessor(chunk_size=50, chunk_overlap=0)
+    text_processor.splitter = LineSplitter()
+    return IngestPipeline(FakeNeo4j(), FakeEmbeddings(), text_processor=text_processor, batch_size=2)
+
+
+def ingest(pipeline, lines):
+    async def pages():
+        yield "\n".join(lines)
+    return asyncio.run(pipeline.run("doc", "Doc", pages()))
+
+
+def stored_lines(neo4j):
+    return [chunk["content"] for chunk in sorted(neo4j.chunks.values(), key=lambda chunk: chunk["chunk_index"])]
+
+
+def test_repeated_hashes_get_stable_distinct_ids():
+    ids = chunk_ids_for_hashes("doc", ["h1", "h2", "h1"])
+    assert ids == [make_chunk_id("doc", "h1"), make_chunk_id("doc", "h2"), make_chunk_id("doc", "h1", 1)]
+    assert len(set(ids)) == 3
+    assert chunk_ids_for_hashes("doc", ["h2", "h1", "h1"])[1:] == [ids[0], ids[2]]
+
+
+def test_reingest_only_writes_the_difference(pipeline):
+    neo4j, embeddings = pipeline.neo4j_client, pipeline.embeddings_client
+    assert ingest(pipeline, ["alpha", "beta", "gamma"]) == 3
+
+    neo4j.written_ids.clear()
+    embeddings.embedded.clear()
+    assert ingest(pipeline, ["alpha", "gamma", "delta"]) == 1
+
+    assert embeddings.embedded == ["delta"] # Unchanged chunks are not embedded again
+    assert (pipeline.chunks_unchanged, pipeline.chunks_deleted) == (2, 1)
+    assert stored_lines(neo4j) == ["alpha", "gamma", "delta"] # gamma moved up a position
+    # The manifest lists exactly the chunks left in the store, in order
+    assert [neo4j.chunks[chunk_id]["content"] for chunk_id in neo4j.documents["doc"]["chunk_ids"]] == ["alpha", "gamma", "delta"]
+    assert neo4j.documents["doc"]["chunk_indexes"] == [0, 1, 2]
+
+
+def test_unchanged_document_writes_nothing(pipeline):
+    ingest(pipeline, ["alpha", "alpha", "beta"])
+    pipeline.embeddings_client.embedded.clear()
+    assert ingest(pipeline, ["alpha", "alpha", "beta"]) == 0
+    assert pipeline.embeddings_client.embedded == []
+    assert stored_lines(pipeline.neo4j_client) == ["alpha", "alpha", "beta"]
+
+
+def test_failed_batches_are_raised_after_storing_the_rest(pipeline):
+    pipeline.embeddings_client.failing = {"beta"}
+    with pytest.raises(ConnectionError):
+        ingest(pipeline, ["alpha", "beta", "gamma", "delta"])
+    assert pipeline.chunks_produced == 4
+
+    # The retry only embeds what is missing
+    pipeline.embeddings_client.failing = set()
+    pipeline.embeddings_client.embedded.clear()
+    ingest(pipeline, ["alpha", "beta", "gamma", "delta"])
+    assert sorted(pipeline.embeddings_client.embedded) == ["alpha", "beta"]
+    assert stored_lines(pipeline.neo4j_client) == ["alpha", "beta", "gamma", "delta"]
+
+
+def test_repeated_chunk_is_written_after_its_first_copy_failed(pipeline):
+    lines = ["alpha", "dup", "beta", "dup"]
+    pipeline.embeddings_client.failing = {"alpha"} # Fails the batch holding the first "dup"
+    with pytest.raises(ConnectionError):
+        ingest(pipeline, lines)
+    # Only the second copy was stored
+    assert set(pipeline.neo4j_client.chunks) == {make_chunk_id("doc", chunk_hash("beta")), make_chunk_id("doc", chunk_hash("dup"), 1)}
+
+    pipeline.embeddings_client.failing = set()
+    ingest(pipeline, lines)
+    assert pipeline.complete
+    assert stored_lines(pipeline.neo4j_client) == lines
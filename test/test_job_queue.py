@@ -0,0 +1,101 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("fakeredis")
+pytest.importorskip("lupa") # fakeredis runs the Lua scripts with lupa
+
+from fakeredis import aioredis as fake_aioredis
+from src.backend.document_processing.job_queue import IngestQueue
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def take_all(queue, consumer="w1"):
+    """Job ids in the order workers receive them (acknowledging each)"""
+    order = []
+    while True:
+        job = await queue.next_job(consumer, block_ms=0)
+        if job is None:
+            return order
+        order.append(job[1]["job_id"])
+        await queue.ack(job[0])
+
+
+async def take_n(queue, count):
+    order = []
+    for _ in range(count):
+        job = await queue.next_job("w1", block_ms=0)
+        order.append(job[1]["job_id"])
+        await queue.ack(job[0])
+    return order
+
+
+def test_groups_are_served_round_robin():
+    async def scenario():
+        queue = IngestQueue(fake_aioredis.FakeRedis(decode_responses=True))
+        for i in range(4):
+            await queue.enqueue(f"/b{i}.pdf", f"b{i}.pdf", f"batch-{i}", group="batch")
+        await queue.enqueue("/single.pdf", "single.pdf", "single")
+        return await take_all(queue)
+
+    # The single upload goes right after the batch's first file instead of after all four
+    assert run(scenario()) == ["batch-0", "single", "batch-1", "batch-2", "batch-3"]
+
+
+def test_late_group_joins_the_current_round():
+    async def scenario():
+        queue = IngestQueue(fake_aioredis.FakeRedis(decode_responses=True))
+        for i in range(4):
+            await queue.enqueue(f"/b{i}.pdf", f"b{i}.pdf", f"batch-{i}", group="batch")
+        first = await take_n(queue, 2)
+        await queue.enqueue("/single.pdf", "single.pdf", "single")
+        return first + await take_all(queue)
+
+    assert run(scenario()) == ["batch-0", "batch-1", "single", "batch-2", "batch-3"]
+
+
+def test_fields_survive_dispatch():
+    async def scenario():
+        queue = IngestQueue(fake_aioredis.FakeRedis(decode_responses=True))
+        await queue.enqueue("/x.pdf", "x.pdf", "j1", content_hash="abc", group="g")
+        return await queue.next_job("w1", block_ms=0)
+
+    _, fields = run(scenario())
+    assert {key: fields[key] for key in ("file_path", "filename", "job_id", "content_hash", "group")} == {
+        "file_path": "/x.pdf", "filename": "x.pdf", "job_id": "j1", "content_hash": "abc", "group": "g"}
+
+
+def test_unacknowledged_job_is_redelivered():
+    async def scenario():
+        queue = IngestQueue(fake_aioredis.FakeRedis(decode_responses=True), visibility_timeout=0)
+        await queue.enqueue("/x.pdf", "x.pdf", "j1")
+        message_id, _ = await queue.next_job("w1", block_ms=0)
+        await asyncio.sleep(0.01)
+        reclaimed = await queue.next_job("w2", block_ms=0)
+        return message_id, reclaimed, await queue.delivery_count(message_id)
+
+    message_id, reclaimed, deliveries = run(scenario())
+    assert reclaimed[0] == message_id
+    assert deliveries == 2
+
+
+def test_waiting_worker_is_woken_by_enqueue():
+    async def scenario():
+        queue = IngestQueue(fake_aioredis.FakeRedis(decode_responses=True))
+        await queue.ensure_group()
+        waiting = asyncio.ensure_future(queue.read("w1", block_ms=5000))
+        await asyncio.sleep(0.05)
+        await queue.enqueue("/x.pdf", "x.pdf", "j1")
+        return await asyncio.wait_for(waiting, 2)
+
+    messages = run(scenario())
+    assert [fields["job_id"] for _, fields in messages] == ["j1"]
@@ -0,0 +1,64 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+from src.backend.document_processing.job_scheduler import FairJobScheduler
+
+
+def run_jobs(submissions, max_concurrent):
+    """Submits (group, job) pairs and returns the order the jobs started in and the peak concurrency"""
+    started, active, peak = [], [0], [0]
+
+    async def run_job(job):
+        started.append(job)
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+
+    async def scenario():
+        scheduler = FairJobScheduler(run_job, max_concurrent=max_concurrent)
+        for group, job in submissions:
+            scheduler.submit(group, job)
+        while scheduler.pending or scheduler.running:
+            await asyncio.sleep(0.005)
+
+    asyncio.run(scenario())
+    return started, peak[0]
+
+
+def test_groups_are_served_round_robin():
+    submissions = [("batch", f"b{i}") for i in range(4)] + [("single", "s")]
+    started, _ = run_jobs(submissions, max_concurrent=1)
+    # b0 starts on submit; after that the groups alternate, so the single upload doesn't wait for the whole batch
+    assert started == ["b0", "b1", "s", "b2", "b3"]
+
+
+def test_concurrency_is_bounded():
+    submissions = [("batch", f"b{i}") for i in range(6)] + [("other", f"o{i}") for i in range(3)]
+    started, peak = run_jobs(submissions, max_concurrent=2)
+    assert sorted(started) == sorted(job for _, job in submissions)
+    assert peak == 2
+
+
+def test_failing_job_does_not_stop_the_scheduler():
+    started = []
+
+    async def run_job(job):
+        started.append(job)
+        if job == "bad":
+            raise RuntimeError("boom")
+
+    async def scenario():
+        scheduler = FairJobScheduler(run_job, max_concurrent=1)
+        for job in ("bad", "good"):
+            scheduler.submit(job, job)
+        while scheduler.pending or scheduler.running:
+            await asyncio.sleep(0.005)
+
+    asyncio.run(scenario())
+    assert started == ["bad", "good"]
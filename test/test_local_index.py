@@ -0,0 +1,166 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+from src.backend.assistant import local_index
+from src.backend.assistant.local_index import LocalVectorIndex
+
+DIM = 16
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((400, DIM)).astype(np.float32), rng.standard_normal(DIM).astype(np.float32)
+
+
+@pytest.fixture
+def open_index(tmp_path):
+    """Opens indexes on tmp_path and releases their directory locks afterwards"""
+    opened = []
+
+    def open_index(quantization="float16"):
+        index = LocalVectorIndex(str(tmp_path / "index"), quantization)
+        opened.append(index)
+        return index
+
+    yield open_index
+    for index in opened:
+        index.close()
+
+
+def chunk_ids(count):
+    return [f"c{i:04d}" for i in range(count)]
+
+
+def exact_top(matrix, ids, query, k, live=None):
+    """Best k ids by cosine similarity, as a brute-force reference"""
+    scores = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)) @ (query / np.linalg.norm(query))
+    ranked = [ids[row] for row in np.argsort(-scores) if live is None or ids[row] in live]
+    return ranked[:k]
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_search_matches_exact_cosine(open_index, vectors, quantization):
+    matrix, query = vectors
+    ids = chunk_ids(len(matrix))
+    index = open_index(quantization)
+    index.apply(list(zip(ids, matrix)))
+
+    hits = index.search(query, 10)
+    assert [chunk_id for chunk_id, _ in hits] == exact_top(matrix, ids, query, 10)
+    # Same score scale as the Neo4j cosine index
+    best = matrix[ids.index(hits[0][0])]
+    cosine = float(best @ query / (np.linalg.norm(best) * np.linalg.norm(query)))
+    assert hits[0][1] == pytest.approx((1 + cosine) / 2, abs=1e-5)
+
+
+def test_upserts_replace_and_deletes_remove(open_index, vectors):
+    matrix, query = vectors
+    ids = chunk_ids(len(matrix))
+    index = open_index()
+    index.apply(list(zip(ids, matrix)))
+
+    index.apply([("c0001", query)], deleted_ids=["c0000", "missing"])
+    assert index.size == len(ids) - 1
+    hits = index.search(query, 3)
+    assert hits[0][0] == "c0001"
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert "c0000" not in [chunk_id for chunk_id, _ in index.search(matrix[0], 20)]
+
+
+def test_compaction_and_reload_keep_the_live_rows(open_index, vectors):
+    matrix, query = vectors
+    ids = chunk_ids(len(matrix))
+    index = open_index()
+    index.apply(list(zip(ids, matrix)))
+    # Deleting over LOCAL_INDEX_COMPACT_RATIO of the rows rewrites the files
+    index.apply(deleted_ids=ids[:150])
+    live = set(ids[150:])
+    assert len(index._ids) == index.size == len(live)
+    expected = exact_top(matrix, ids, query, 10, live)
+    assert [chunk_id for chunk_id, _ in index.search(query, 10)] == expected
+
+    index.close()
+    reloaded = open_index()
+    assert reloaded.load()
+    assert reloaded.size == len(live)
+    assert [chunk_id for chunk_id, _ in reloaded.search(query, 10)] == expected
+
+
+def test_dimension_mismatch_is_rejected(open_index, vectors):
+    matrix, _ = vectors
+    index = open_index()
+    index.apply([("a", matrix[0])])
+    with pytest.raises(ValueError):
+        index.apply([("b", np.ones(DIM + 1, dtype=np.float32))])
+
+
+@pytest.mark.skipif(local_index.fcntl is None, reason="directory locks need fcntl")
+def test_directory_is_locked_while_open(open_index):
+    open_index()
+    with pytest.raises(RuntimeError):
+        open_index()
+
+
+def test_hnsw_search_skips_deleted_rows(open_index, vectors):
+    pytest.importorskip("hnswlib")
+    matrix, query = vectors
+    ids = chunk_ids(len(matrix))
+    index = open_index()
+    index.apply(list(zip(ids, matrix)))
+    index.build_hnsw()
+    top = exact_top(matrix, ids, query, 1)[0]
+    index.apply(deleted_ids=[top])
+    assert top not in [chunk_id for chunk_id, _ in index.search(query, 10)]
+    assert [chunk_id for chunk_id, _ in index.search(query, 5)] == exact_top(matrix, ids, query, 5, set(ids) - {top})
+
+
+
+class PagedNeo4j:
+    """Serves CHUNK_EMBEDDINGS_PAGE_QUERY pages; calls on_page after each one"""
+
+    def __init__(self, matrix, ids, on_page=lambda: None):
+        self.matrix, self.ids, self.on_page = matrix, ids, on_page
+
+    def run_query(self, query, parameters):
+        page = [{"id": chunk_id, "embedding": self.matrix[i].tolist()} for i, chunk_id in enumerate(self.ids)
+                if chunk_id > parameters["after"]][:parameters["limit"]]
+        self.on_page()
+        return page
+
+
+class EmptyStream:
+    def xrevrange(self, stream, count):
+        return []
+
+
+def test_interrupted_rebuild_is_not_loaded(open_index, vectors):
+    matrix, _ = vectors
+    ids = chunk_ids(len(matrix))
+    neo4j = PagedNeo4j(matrix, ids)
+    sync = local_index.LocalIndexSync(open_index(), neo4j, page_size=100)
+    neo4j.on_page = sync.stop # Shut down after the first page
+
+    assert not sync.rebuild(EmptyStream())
+    assert sync.index.size == 100
+    sync.index.close()
+    assert not open_index().load()
+
+
+def test_finished_rebuild_is_loaded(open_index, vectors):
+    matrix, _ = vectors
+    ids = chunk_ids(len(matrix))
+    sync = local_index.LocalIndexSync(open_index(), PagedNeo4j(matrix, ids), page_size=100)
+
+    assert sync.rebuild(EmptyStream())
+    sync.index.close()
+    reloaded = open_index()
+    assert reloaded.load()
+    assert reloaded.size == len(ids)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa") # fakeredis runs the Lua scripts with lupa
+
+from fakeredis import aioredis as fake_aioredis
+import src.backend.api.progress as progress
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Points the progress module's sync and async clients at one in-memory Redis"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(progress, "redis_client", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(progress.aioredis, "from_url", lambda url, **kwargs: fake_aioredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(progress, "_sync_scripts", {})
+    monkeypatch.setattr(progress, "_async_clients", {})
+    monkeypatch.setattr(progress, "_progress_state", {})
+    monkeypatch.setattr(progress, "_parent_ids", {})
+    monkeypatch.setattr(progress, "PROGRESS_MIN_INTERVAL", 0)
+    return server
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_job_progress_and_completion(server):
+    async def scenario():
+        await progress.create_job("j1", "a.pdf", 10)
+        await progress.update_job_progress("j1", 3)
+        await progress.update_job_status("j1", "embedding_neo4j", "Embedding", percent_complete=150)
+        job = progress.get_job("j1")
+        assert (job["current_page"], job["percent_complete"], job["status"]) == (3, 100, "embedding_neo4j")
+
+        await progress.progress_complete_job("j1", "boom", final_status="failed")
+        await progress.update_job_progress("j1", 5) # Ignored once the job is final
+        return progress.get_job("j1")
+
+    job = run(scenario())
+    assert job["status"] == "failed"
+    assert job["current_page"] == 3
+    assert job["message"] == "boom"
+
+
+def test_job_writes_are_published(server):
+    pubsub = fakeredis.FakeRedis(server=server, decode_responses=True).pubsub()
+    pubsub.subscribe(f"{progress.PROGRESS_CHANNEL_PREFIX}j1")
+    pubsub.get_message(timeout=1) # Subscription confirmation
+
+    run(progress.create_job("j1", "a.pdf", 4))
+    message = pubsub.get_message(timeout=1)
+    assert message is not None
+    assert json.loads(message["data"])["status"] == "starting"
+
+
+def test_batch_aggregates_children(server):
+    async def scenario():
+        await progress.create_batch_job("b1", [("c1", "a.pdf"), ("c2", "b.pdf")])
+        # A worker process knows nothing about the batch: the parent is looked up from Redis
+        progress._parent_ids.clear()
+        await progress.create_job("c1", "a.pdf", 4)
+        await progress.update_job_progress("c1", 2)
+        halfway = progress.get_job("b1")
+        await progress.progress_complete_job("c1", "done")
+        await progress.create_job("c2", "b.pdf", 2)
+        await progress.progress_complete_job("c2", "broken", final_status="failed")
+        return halfway, progress.get_job("b1"), progress.get_job("c1")
+
+    halfway, batch, child = run(scenario())
+    assert child["parent_id"] == "b1"
+    assert (halfway["status"], halfway["percent_complete"], halfway["files_done"]) == ("processing", 25, 0)
+    assert batch["status"] == "completed"
+    assert (batch["files_done"], batch["files_failed"], batch["percent_complete"]) == (2, 1, 100)
+
+
+def test_all_failed_batch_is_failed(server):
+    async def scenario():
+        await progress.create_batch_job("b1", [("c1", "a.pdf")])
+        await progress.progress_complete_job("c1", "broken", final_status="failed")
+        return progress.get_job("b1")
+
+    assert run(scenario())["status"] == "failed"
+
+
+def test_scripts_only_touch_declared_keys(server):
+    """A child job's script updates its batch only when the batch key is passed in KEYS"""
+    run(progress.create_batch_job("b1", [("c1", "a.pdf"), ("c2", "b.pdf")]))
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    script = client.register_script(progress.COMPLETE_SCRIPT)
+
+    script(keys=progress._job_keys("c1"), args=[progress.JOB_TTL, "c1", "completed", "done"])
+    assert progress.get_job("b1")["files_done"] == 0
+
+    script(keys=progress._job_keys("c2", "b1"), args=[progress.JOB_TTL, "c2", "completed", "done"])
+    assert progress.get_job("b1")["files_done"] == 1
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+pytest.importorskip("langchain")
+
+from src.backend.document_processing.text_processor import TextProcessor, ChunkBuffer
+
+
+def pages(count, words_per_page=120):
+    return [" ".join(f"p{page}w{word}" for word in range(words_per_page)) for page in range(count)]
+
+
+def test_short_input_matches_a_single_split():
+    processor = TextProcessor(chunk_size=200, chunk_overlap=20)
+    texts = pages(2, words_per_page=10)
+    assert list(processor.iter_chunks(texts)) == processor.process_text("\n".join(texts))
+
+
+def test_streamed_chunks_cover_every_word_within_the_size_limit():
+    processor = TextProcessor(chunk_size=200, chunk_overlap=20)
+    texts = pages(30)
+    chunks = list(processor.iter_chunks(texts))
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    streamed_words = set(" ".join(chunks).split())
+    assert all(word in streamed_words for text in texts for word in text.split())
+
+
+def test_buffer_stays_bounded():
+    processor = TextProcessor(chunk_size=200, chunk_overlap=20)
+    buffer = ChunkBuffer(processor, flush_chars=1000)
+    emitted = []
+    for text in pages(30):
+        emitted.extend(buffer.feed(text))
+        # Only the carried-over chunk plus unflushed input stays in memory
+        assert len(buffer._buffer) < buffer.flush_chars + 200
+    assert emitted
+    assert buffer.flush()
+    assert buffer.flush() == []
+
+
+def test_blank_pages_emit_nothing():
+    buffer = ChunkBuffer(TextProcessor(chunk_size=200, chunk_overlap=20))
+    assert buffer.feed("  \n\n \t ") == []
+    assert buffer.flush() == []
@@ -0,0 +1,95 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to Python's module search path
+project_root = str(Path(__file__).parent.parent)
+sys.path.insert(0, project_root)
+
+import src.backend.api.websocket as websocket_module
+from src.backend.api.websocket import ProgressBroadcaster
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.client = "test"
+        self.sent = []
+        self.closed = False
+        self.stalled = stalled
+        self.sending = 0
+        self.overlapped = False
+
+    async def send_text(self, text):
+        self.sending += 1
+        self.overlapped |= self.sending > 1
+        try:
+            if self.stalled:
+                await asyncio.Event().wait()
+            await asyncio.sleep(0.001)
+            self.sent.append(text)
+        finally:
+            self.sending -= 1
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def short_timeout(monkeypatch):
+    monkeypatch.setattr(websocket_module, "WEBSOCKET_SEND_TIMEOUT", 0.1)
+
+
+def test_messages_are_sent_in_order_one_at_a_time():
+    async def scenario():
+        broadcaster = ProgressBroadcaster()
+        client = FakeWebSocket()
+        broadcaster.register("j1", client)
+        for i in range(5):
+            broadcaster.broadcast_progress("j1", str(i))
+        broadcaster.send("j1", client, "pong")
+        await asyncio.sleep(0.1)
+        await broadcaster.stop()
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.sent == ["0", "1", "2", "3", "4", "pong"]
+    assert not client.overlapped
+
+
+def test_stalled_client_does_not_delay_the_others():
+    async def scenario():
+        broadcaster = ProgressBroadcaster()
+        stalled, other_job = FakeWebSocket(stalled=True), FakeWebSocket()
+        broadcaster.register("j1", stalled)
+        broadcaster.register("j2", other_job)
+        broadcaster.broadcast_progress("j1", "a")
+        broadcaster.broadcast_progress("j2", "b")
+        await asyncio.sleep(0.02)
+        delivered_early = list(other_job.sent)
+        await asyncio.sleep(0.2)
+        return broadcaster, stalled, delivered_early
+
+    broadcaster, stalled, delivered_early = asyncio.run(scenario())
+    assert delivered_early == ["b"]
+    # Dropped once the send timed out
+    assert stalled.closed
+    assert "j1" not in broadcaster.active_connections
+
+
+def test_client_too_far_behind_is_dropped(monkeypatch):
+    monkeypatch.setattr(websocket_module, "WEBSOCKET_SEND_QUEUE", 2)
+
+    async def scenario():
+        broadcaster = ProgressBroadcaster()
+        client = FakeWebSocket(stalled=True)
+        broadcaster.register("j1", client)
+        for i in range(5):
+            broadcaster.broadcast_progress("j1", str(i))
+        await asyncio.sleep(0.01)
+        return broadcaster, client
+
+    broadcaster, client = asyncio.run(scenario())
+    assert client.closed
+    assert broadcaster.active_connections == {}